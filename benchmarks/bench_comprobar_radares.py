@@ -0,0 +1,115 @@
+"""
+Benchmark de la comprobación de radares: parser HTTP (requests + BeautifulSoup) frente a Selenium.
+
+Sirve el corpus de páginas guardadas en fixtures/radar_pages desde un servidor HTTP local y mide,
+para cada página, el camino sin navegador y el camino con Chrome (arranque + carga + análisis).
+El camino con Selenium se omite si no hay Chrome disponible.
+
+Uso:
+    python benchmarks/bench_comprobar_radares.py [--repeticiones 20] [--sin-selenium]
+"""
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+import statistics
+import threading
+import argparse
+import logging
+import json
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(RAIZ, "fixtures", "radar_pages")
+sys.path.insert(0, RAIZ)
+
+from radar_parser import TEXTO_SIN_RADARES, TEXTO_CON_RADARES
+import telegram_radar_notifier as notifier
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def servir_fixtures():
+    """Arranca un servidor HTTP local con el corpus de páginas y devuelve su URL base."""
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), partial(_Handler, directory=FIXTURES))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+def comprobar_radares_legacy(driver):
+    """Recorrido original párrafo a párrafo con WebDriver (O(n²) consultas), como referencia."""
+    from selenium.webdriver.common.by import By
+    for elemento in driver.find_elements(By.CLASS_NAME, "span12"):
+        parrafos = elemento.find_elements(By.TAG_NAME, "p")
+        for i, _ in enumerate(parrafos):
+            texto_parrafo = elemento.find_elements(By.TAG_NAME, "p")[i].text
+            if TEXTO_SIN_RADARES in texto_parrafo:
+                return []
+            elif TEXTO_CON_RADARES in texto_parrafo and i + 1 < len(parrafos):
+                return [span.text for span in parrafos[i + 1].find_elements(By.CLASS_NAME, "label")]
+    return None
+
+def medir(funcion, repeticiones):
+    """Ejecuta `funcion` varias veces y devuelve (resultado, mediana en segundos)."""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, statistics.median(tiempos)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--sin-selenium", action="store_true", help="mide solo el camino sin navegador")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    esperados = json.load(open(os.path.join(FIXTURES, "expected.json"), encoding="utf-8"))
+    servidor, base = servir_fixtures()
+
+    driver = None
+    if not args.sin_selenium:
+        inicio = time.perf_counter()
+        driver = notifier.inicializar_driver()
+        arranque = time.perf_counter() - inicio
+        if driver:
+            print(f"Arranque de Chrome: {arranque * 1000:.0f} ms (se paga en cada ejecución del camino Selenium)")
+        else:
+            print("Chrome no disponible, se omite el camino con Selenium.")
+
+    print(f"{'página':<18}{'http (ms)':>12}{'selenium (ms)':>16}{'legacy (ms)':>14}  ok")
+    try:
+        for fichero, esperado in esperados.items():
+            url = f"{base}/{fichero}"
+            resultado, t_http = medir(lambda: notifier.comprobar_radares_http(url), args.repeticiones)
+            correcto = resultado == esperado
+            t_selenium = t_legacy = None
+
+            if driver:
+                def selenium():
+                    notifier.cargar_pagina(driver, url)
+                    return notifier.comprobar_radares(driver)
+
+                def legacy():
+                    notifier.cargar_pagina(driver, url)
+                    return comprobar_radares_legacy(driver)
+
+                resultado, t_selenium = medir(selenium, max(1, args.repeticiones // 4))
+                correcto = correcto and resultado == esperado
+                resultado, t_legacy = medir(legacy, max(1, args.repeticiones // 4))
+                correcto = correcto and resultado == esperado
+
+            formato = lambda t: f"{t * 1000:.1f}" if t is not None else "-"
+            print(f"{fichero:<18}{formato(t_http):>12}{formato(t_selenium):>16}{formato(t_legacy):>14}  {'sí' if correcto else 'NO'}")
+    finally:
+        if driver:
+            driver.quit()
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Benchmark de extremo a extremo: ejecuta el `main` de los dos scripts contra la API de Telegram falsa.
+
+Para cada tamaño se siembran N suscriptores en MongoDB y una imagen del mapa en la caché (así no
+hace falta navegador), se sirve una página de radares de `fixtures/radar_pages` y se ejecutan
+`bot_interactions_updater.main` (con nuevos /start pendientes) y `telegram_radar_notifier.main`.
+Muestra mensajes por segundo, latencia de entrega p50/p99 (desde el inicio de `main` hasta que el
+servidor recibe el mensaje de cada usuario) y tiempo total.
+
+Usa un mongod local si se indica `--mongo-uri`; si no, mongomock (recomendado solo hasta ~1k
+suscriptores, ya que mongomock no usa índices y cada envío reclama su trabajo en la outbox).
+
+Uso:
+    python benchmarks/bench_end_to_end.py [--suscriptores 1000,10000,100000] [--pagina radar.html]
+        [--latencia-ms 40] [--limite-global 1000] [--limite-servidor 0] [--bloqueados 0.02] [--workers 32] [--suscritos 0.5]
+        [--mongo-uri mongodb://localhost]
+"""
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+from io import BytesIO
+import threading
+import argparse
+import datetime
+import logging
+import json
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(RAIZ, "fixtures", "radar_pages")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram_api import FakeTelegramAPI
+
+
+class PaginaSilenciosa(SimpleHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+
+def servir_fixtures():
+    """Sirve las páginas de `fixtures/radar_pages` por HTTP y devuelve la URL base."""
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), partial(PaginaSilenciosa, directory=FIXTURES))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}"
+
+def configurar_entorno(args, api_url, pagina_url):
+    """Los módulos leen la configuración del entorno al importarse: se fija antes de importarlos."""
+    os.environ.update({
+        "TELEGRAM_TOKEN": "benchmark",
+        "TELEGRAM_API_BASE": api_url,
+        "DONOSTI_RADAR_WEB": pagina_url,
+        "TELEGRAM_LIMITE_GLOBAL": str(args.limite_global),
+        "BROADCAST_WORKERS": str(args.workers),
+        "LIVENESS_WORKERS": str(args.workers),
+        "MONGO_DB": "bench_end_to_end",
+        "MONGO_COLLECTION_INTERACTIONS": "interactions",
+        "MONGO_COLLECTION_REPORTS": "reports",
+    })
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+
+class ColeccionSincronizada:
+    """mongomock no admite escrituras concurrentes sobre una colección: serializa sus llamadas."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._collection, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def sincronizado(*args, **kwargs):
+            with self._lock:
+                return atributo(*args, **kwargs)
+        return sincronizado
+
+def usar_mongomock(notifier, updater):
+    """Hace que los dos módulos usen una base de datos mongomock (a través del contexto compartido)."""
+    import mongomock
+    contexto = notifier.contexto
+    contexto.usar_cliente(mongomock.MongoClient(), "bench_end_to_end")
+    # Los hilos de la difusión reclaman los trabajos de la outbox a la vez
+    contexto.collection_outbox = ColeccionSincronizada(contexto.db[contexto.nombre_coleccion("collection_outbox")])
+    updater._indices_creados = False
+
+def imagen_de_prueba():
+    """PNG del tamaño del mapa real, para que la subida sea representativa."""
+    from PIL import Image
+    imagen = Image.effect_noise((1200, 800), 40).convert("RGB")
+    salida = BytesIO()
+    imagen.save(salida, format="PNG")
+    return salida.getvalue()
+
+# Zonas de las suscripciones sembradas (la mitad aparecen en radar.html)
+ZONAS = ("tolosa", "zarautz", "easo", "amara", "gros", "antiguo")
+
+def sembrar(notifier, updater, api, n_suscriptores, n_nuevos, locations, png, suscritos=0.0):
+    """Crea los suscriptores (una fracción `suscritos` con suscripción a una zona), la imagen cacheada y los /start pendientes."""
+    from config import COLECCIONES
+    contexto = notifier.contexto
+    for atributo in COLECCIONES:
+        contexto.db.drop_collection(contexto.nombre_coleccion(atributo))
+    updater._indices_creados = False
+    notifier.reports._colecciones_creadas.clear()
+    notifier.outbox._indices_creados.clear()
+
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    n_suscritos = int(n_suscriptores * suscritos)
+    lote = []
+    for i in range(n_suscriptores):
+        chat_id = 100000 + i
+        lote.append({"chat_id": chat_id, "first_name": f"Usuario {chat_id}", "username": f"u{chat_id}", "chat_type": "private",
+                     "active": True, "active_checked_at": ahora, "has_subscriptions": i < n_suscritos, "messages": []})
+        if len(lote) == 10000:
+            contexto.collection_interactions.insert_many(lote)
+            lote = []
+    if lote:
+        contexto.collection_interactions.insert_many(lote)
+    if n_suscritos:
+        contexto.collection_subscriptions.insert_many([
+            {"key": ZONAS[i % len(ZONAS)], "chat_id": 100000 + i, "label": ZONAS[i % len(ZONAS)]} for i in range(n_suscritos)
+        ])
+
+    if locations:
+        fecha_hoy = datetime.datetime.now(notifier.pytz.timezone(notifier.ZONA_HORARIA)).date().isoformat()
+        clave = notifier.image_cache.clave_imagen(locations, fecha_hoy, notifier.variante_imagen(notifier.url_radares()))
+        notifier.image_cache.guardar_imagen(contexto.collection_image_cache, clave, png, locations, fecha_hoy)
+
+    # Los nuevos /start son de usuarios que aún no están en la base de datos
+    api.agregar_updates([
+        {
+            "update_id": i + 1,
+            "message": {
+                "message_id": 1, "date": int(time.time()), "text": "/start",
+                "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+                "chat": {"id": 900000000 + i, "first_name": f"Nuevo {i}", "type": "private"}
+            }
+        }
+        for i in range(n_nuevos)
+    ])
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+def ejecutar(nombre, funcion, api):
+    """Ejecuta `funcion` y devuelve (tiempo total, entregas por método, latencias de sendMessage, contadores)."""
+    api.reiniciar_estadisticas()
+    inicio = time.monotonic()
+    funcion()
+    total = time.monotonic() - inicio
+
+    estadisticas = api.estadisticas()
+    entregas = estadisticas["entregas"]
+    latencias = [t - inicio for t in entregas["sendMessage"].values()]
+    enviados = len(entregas["sendMessage"]) + len(entregas["sendPhoto"])
+    return {
+        "fase": nombre,
+        "enviados": enviados,
+        "msgs_s": enviados / total if total else 0.0,
+        "p50": percentil(latencias, 50),
+        "p99": percentil(latencias, 99),
+        "total": total,
+        **estadisticas["contadores"],
+    }
+
+def mostrar(n_suscriptores, resultado):
+    print(f"{n_suscriptores:>12}{resultado['fase']:>10}{resultado['enviados']:>10}{resultado['msgs_s']:>10.1f}"
+          f"{resultado['p50']:>10.2f}{resultado['p99']:>10.2f}{resultado['total']:>10.2f}"
+          f"{resultado['429']:>7}{resultado['403']:>7}{resultado['uploads']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suscriptores", default="1000,10000,100000", help="tamaños separados por comas")
+    parser.add_argument("--nuevos", type=int, default=100, help="/start pendientes en getUpdates para el updater")
+    parser.add_argument("--pagina", default="radar.html", help="página de fixtures/radar_pages que se sirve")
+    parser.add_argument("--latencia-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--limite-global", type=float, default=1000, help="TELEGRAM_LIMITE_GLOBAL del cliente")
+    parser.add_argument("--limite-servidor", type=float, default=0, help="peticiones/s antes de que el servidor responda 429 (0 = sin límite)")
+    parser.add_argument("--bloqueados", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--suscritos", type=float, default=0.0, help="fracción de suscriptores con suscripción a una zona")
+    parser.add_argument("--mongo-uri", help="mongod local; por defecto se usa mongomock")
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    args = parser.parse_args()
+
+    api = FakeTelegramAPI(args.latencia_ms, args.jitter_ms, args.limite_servidor or None, bloqueados=args.bloqueados)
+    configurar_entorno(args, api.iniciar(), f"{servir_fixtures()}/{args.pagina}")
+
+    import bot_interactions_updater as updater
+    import telegram_radar_notifier as notifier
+    if not args.mongo_uri:
+        usar_mongomock(notifier, updater)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with open(os.path.join(FIXTURES, "expected.json"), encoding="utf-8") as f:
+        locations = json.load(f).get(args.pagina)
+    png = imagen_de_prueba()
+
+    print(f"Página {args.pagina}, latencia {args.latencia_ms}±{args.jitter_ms} ms, {args.workers} workers "
+          f"({'mongod' if args.mongo_uri else 'mongomock'})")
+    print(f"{'suscriptores':>12}{'fase':>10}{'enviados':>10}{'msgs/s':>10}{'p50 (s)':>10}{'p99 (s)':>10}"
+          f"{'total (s)':>10}{'429':>7}{'403':>7}{'subidas':>9}")
+
+    resultados = []
+    for n_suscriptores in (int(n) for n in args.suscriptores.split(",")):
+        sembrar(notifier, updater, api, n_suscriptores, args.nuevos, locations, png, args.suscritos)
+        for nombre, funcion in (("updater", updater.main), ("notifier", notifier.main)):
+            resultado = ejecutar(nombre, funcion, api)
+            resultado["suscriptores"] = n_suscriptores
+            resultados.append(resultado)
+            mostrar(n_suscriptores, resultado)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+
+    api.detener()
+
+
+if __name__ == "__main__":
+    main()
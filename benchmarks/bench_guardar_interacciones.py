@@ -0,0 +1,136 @@
+"""
+Benchmark de guardar_interacciones_en_bd: escritura masiva frente al recorrido original mensaje a mensaje.
+
+Genera actualizaciones sintéticas de Telegram, las transforma con transformar_a_estructura_mongo y
+las guarda con las dos implementaciones, contando las idas y vueltas a MongoDB y las llamadas a
+getChatMember. Usa un mongod local si se indica `--mongo-uri`; si no, mongomock.
+
+Uso:
+    python benchmarks/bench_guardar_interacciones.py [--updates 10000] [--chats 1000] [--mongo-uri mongodb://localhost]
+"""
+import argparse
+import datetime
+import logging
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Importar el módulo no conecta con MongoDB; la colección se sustituye antes de medir
+import bot_interactions_updater as updater
+
+
+class ColeccionContada:
+    """Envuelve una colección y cuenta cada operación que implica una ida y vuelta al servidor."""
+
+    OPERACIONES = {"find_one", "insert_one", "update_one", "bulk_write", "distinct", "create_index"}
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.round_trips = 0
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.coleccion, nombre)
+        if nombre in self.OPERACIONES:
+            def contado(*args, **kwargs):
+                self.round_trips += 1
+                return atributo(*args, **kwargs)
+            return contado
+        return atributo
+
+
+def generar_updates(n_updates, n_chats):
+    """Genera `n_updates` mensajes de texto repartidos entre `n_chats` chats privados."""
+    updates = []
+    for i in range(n_updates):
+        chat_id = 100000 + i % n_chats
+        updates.append({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": 1700000000 + i,
+                "chat": {"id": chat_id, "first_name": f"Usuario {chat_id}", "username": f"u{chat_id}", "type": "private"},
+                "text": "/start" if i < n_chats else f"mensaje {i}",
+                **({"entities": [{"offset": 0, "length": 6, "type": "bot_command"}]} if i < n_chats else {})
+            }
+        })
+    return updates
+
+def guardar_legacy(interacciones):
+    """Implementación original: find_one, getChatMember, update_one, find_one y $push por mensaje."""
+    collection = updater.contexto.collection_interactions
+    for interaction in interacciones:
+        for msg in interaction.get("messages", []):
+            message_id = msg.get("message_id")
+            chat_id = interaction.get("chat_id")
+            documento = {
+                "message_id": message_id,
+                "date": datetime.datetime.utcfromtimestamp(msg["date"]),
+                "text": msg["text"],
+                "command": msg.get("command", ""),
+                "entities": msg.get("entities", [])
+            }
+            if not collection.find_one({"chat_id": chat_id}):
+                collection.insert_one({
+                    "chat_id": chat_id,
+                    "first_name": interaction.get("first_name", ""),
+                    "username": interaction.get("username", ""),
+                    "chat_type": interaction.get("chat_type", ""),
+                    "active": True,
+                    "messages": [documento]
+                })
+            else:
+                activo = updater.obtener_estado_usuario(chat_id)
+                collection.update_one({"chat_id": chat_id}, {"$set": {"active": activo}})
+                if not collection.find_one({"chat_id": chat_id, "messages.message_id": message_id}):
+                    collection.update_one({"chat_id": chat_id}, {"$push": {"messages": documento}})
+
+def ejecutar(nombre, guardar, chats, coleccion):
+    """Guarda `chats` con la implementación indicada y muestra idas y vueltas, llamadas HTTP y tiempo."""
+    llamadas_http = []
+    updater.obtener_estado_usuario = lambda chat_id: llamadas_http.append(chat_id) or True
+    updater.comprobar_usuarios = lambda collection, chat_ids, url: {chat_id: llamadas_http.append(chat_id) or True for chat_id in chat_ids}
+    updater.contexto.collection_interactions = ColeccionContada(coleccion)
+
+    inicio = time.perf_counter()
+    guardar(chats)
+    duracion = time.perf_counter() - inicio
+
+    mensajes = sum(len(d.get("messages", [])) for d in coleccion.find({}, {"messages.message_id": 1}))
+    print(f"{nombre:<10}{updater.contexto.collection_interactions.round_trips:>14}{len(llamadas_http):>16}{duracion:>12.2f}{mensajes:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--mongo-uri", help="mongod local; por defecto se usa mongomock")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo_uri)["bench_guardar_interacciones"]
+    else:
+        import mongomock
+        db = mongomock.MongoClient()["bench_guardar_interacciones"]
+    # Las suscripciones (comandos del bot) van a la misma base de datos
+    updater.contexto.usar_cliente(db.client, db.name)
+
+    chats = [chat for lote in updater.transformar_a_estructura_mongo(generar_updates(args.updates, args.chats), tamano_lote=args.chats) for chat in lote]
+    print(f"{args.updates} updates en {args.chats} chats ({'mongod' if args.mongo_uri else 'mongomock'})")
+    print(f"{'versión':<10}{'round-trips':>14}{'getChatMember':>16}{'tiempo (s)':>12}{'mensajes':>12}")
+
+    for nombre, guardar in (("legacy", guardar_legacy), ("bulk", updater.guardar_interacciones_en_bd)):
+        db.drop_collection(nombre)
+        coleccion = db[nombre]
+        coleccion.create_index("chat_id", unique=True)
+        coleccion.create_index([("chat_id", 1), ("messages.message_id", 1)])
+        ejecutar(nombre, guardar, chats, coleccion)
+        db.drop_collection(nombre)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark del procesado de la imagen del mapa: bytes y tiempo de codificación por formato.
+
+Compara el PNG sin optimizar que se enviaba antes con el PNG con paleta y con JPEG/WebP ajustados
+a un presupuesto de bytes. Por defecto usa un mapa sintético (colores planos, calles y textos
+suavizados y marcadores) del tamaño de la captura del canvas; con `--imagen` usa una captura real.
+
+Uso:
+    python benchmarks/bench_image_pipeline.py [--imagen captura.png] [--max-bytes 200000] [--max-lado 1280] [--repeticiones 5]
+"""
+from PIL import Image, ImageDraw
+from io import BytesIO
+import argparse
+import logging
+import random
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import image_pipeline
+
+
+def mapa_sintetico(ancho=1200, alto=800, escala=2, semilla=3105):
+    """PNG parecido a una captura del mapa; se dibuja al doble de tamaño y se reduce para suavizar los bordes."""
+    aleatorio = random.Random(semilla)
+    imagen = Image.new("RGB", (ancho * escala, alto * escala), (242, 239, 233))
+    draw = ImageDraw.Draw(imagen)
+
+    # Mar, parques y manzanas
+    draw.polygon([(0, 0), (ancho * escala * 0.6, 0), (ancho * escala * 0.3, alto * escala * 0.35), (0, alto * escala * 0.4)], fill=(170, 211, 223))
+    for _ in range(40):
+        x, y = aleatorio.randrange(ancho * escala), aleatorio.randrange(alto * escala)
+        color = aleatorio.choice([(205, 235, 176), (224, 223, 223), (242, 218, 217)])
+        draw.rectangle((x, y, x + aleatorio.randrange(60, 300), y + aleatorio.randrange(60, 300)), fill=color)
+
+    # Calles y nombres
+    for _ in range(120):
+        x, y = aleatorio.randrange(ancho * escala), aleatorio.randrange(alto * escala)
+        destino = (x + aleatorio.randrange(-600, 600), y + aleatorio.randrange(-600, 600))
+        draw.line((x, y, *destino), fill=aleatorio.choice([(255, 255, 255), (247, 250, 191), (252, 214, 164)]), width=aleatorio.choice([6, 10, 16]))
+    for i in range(60):
+        draw.text((aleatorio.randrange(ancho * escala), aleatorio.randrange(alto * escala)), f"Kalea {i}", fill=(80, 80, 80))
+
+    # Marcadores de radar
+    for _ in range(5):
+        x, y = aleatorio.randrange(ancho * escala), aleatorio.randrange(alto * escala)
+        draw.ellipse((x - 22, y - 22, x + 22, y + 22), fill=(255, 255, 255))
+        draw.ellipse((x - 18, y - 18, x + 18, y + 18), fill=(220, 30, 30))
+
+    imagen = imagen.resize((ancho, alto), Image.Resampling.LANCZOS).convert("RGBA")
+    salida = BytesIO()
+    imagen.save(salida, format="PNG")
+    return salida.getvalue()
+
+def medir(nombre, funcion, repeticiones):
+    """Ejecuta `funcion` (que devuelve los bytes codificados) y devuelve (tamaño, mejor tiempo)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        tamano = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return {"formato": nombre, "bytes": tamano, "segundos": min(tiempos)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imagen", help="captura PNG real del canvas; por defecto, mapa sintético")
+    parser.add_argument("--max-bytes", type=int, default=image_pipeline.IMAGE_MAX_BYTES)
+    parser.add_argument("--max-lado", type=int, default=image_pipeline.IMAGE_MAX_LADO)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    if args.imagen:
+        with open(args.imagen, "rb") as f:
+            original = f.read()
+    else:
+        original = mapa_sintetico()
+
+    with Image.open(BytesIO(original)) as imagen:
+        print(f"Imagen {imagen.width}x{imagen.height} {imagen.mode}, {len(original)} bytes (PNG sin optimizar)")
+
+    def png_original():
+        # Lo que se enviaba antes: la captura tal cual, o un PNG sin optimizar de la imagen renderizada
+        with Image.open(BytesIO(original)) as imagen:
+            return image_pipeline._codificar(imagen, "png").getbuffer().nbytes
+
+    resultados = [medir("png (antes)", png_original, args.repeticiones)]
+    for formato in ("png", "jpeg", "webp"):
+        resultados.append(medir(
+            formato,
+            lambda: image_pipeline.optimizar_imagen(original, formato, args.max_lado, args.max_bytes)[1]["bytes"],
+            args.repeticiones
+        ))
+
+    print(f"{'formato':>12}{'bytes':>10}{'reducción':>11}{'tiempo (s)':>12}")
+    for resultado in resultados:
+        print(f"{resultado['formato']:>12}{resultado['bytes']:>10}{resultados[0]['bytes'] / resultado['bytes']:>10.1f}x"
+              f"{resultado['segundos']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark del tiempo de arranque: cuánto tarda en importarse cada script y qué dependencias carga.
+
+Importa cada módulo en un proceso nuevo con `python -X importtime` (sin caché de imports ni
+conexiones previas), toma la mediana de varias repeticiones y muestra el tiempo total, los
+paquetes que más tardan y si se han cargado las dependencias pesadas (Selenium, Pillow,
+webdriver_manager, pymongo). Importar un script no debería abrir conexiones ni cargar el
+navegador ni Pillow: solo se necesitan al comprobar los radares o al procesar la imagen.
+
+Uso:
+    python benchmarks/bench_import_time.py [--modulos telegram_radar_notifier,bot_interactions_updater] [--repeticiones 5] [--top 8]
+"""
+import subprocess
+import statistics
+import argparse
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencias que solo deberían cargarse cuando se usan
+PESADAS = ("selenium", "PIL", "webdriver_manager", "pymongo", "bs4", "requests")
+
+
+def importar(modulo):
+    """
+    Importa `modulo` en un proceso nuevo y devuelve (ms totales, {paquete: ms acumulados}).
+
+    Cada línea de -X importtime es "import time: propio | acumulado | nombre", con el nombre
+    sangrado según la profundidad. Se devuelven los paquetes (sin submódulos) que carga `modulo`;
+    el acumulado de cada uno ya incluye sus submódulos y dependencias.
+    """
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{resultado.stderr[-2000:]}")
+
+    total, paquetes = 0, {}
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        if nombre.strip() == modulo:
+            total = int(acumulado) / 1000
+        # Los imports del arranque del intérprete (site, encodings...) no van sangrados
+        elif nombre.startswith("  ") and "." not in nombre:
+            paquetes[nombre.strip()] = int(acumulado) / 1000
+    return total, paquetes
+
+def medir(modulo, repeticiones):
+    """Mediana del tiempo de importación (ms), paquetes de la última ejecución y dependencias pesadas cargadas."""
+    totales = []
+    for _ in range(repeticiones):
+        total, paquetes = importar(modulo)
+        totales.append(total)
+    cargadas = [nombre for nombre in PESADAS if nombre in paquetes]
+    return statistics.median(totales), paquetes, cargadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modulos", default="telegram_radar_notifier,bot_interactions_updater,radar_daemon")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="paquetes más lentos que se muestran por módulo")
+    args = parser.parse_args()
+
+    print(f"{'módulo':<28}{'mediana (ms)':>14}  dependencias pesadas cargadas")
+    detalles = []
+    for modulo in args.modulos.split(","):
+        mediana, paquetes, cargadas = medir(modulo, args.repeticiones)
+        print(f"{modulo:<28}{mediana:>14.1f}  {', '.join(cargadas) or '-'}")
+        detalles.append((modulo, paquetes))
+
+    for modulo, paquetes in detalles:
+        print(f"\n{modulo}: paquetes más lentos (ms acumulados)")
+        for nombre, ms in sorted(paquetes.items(), key=lambda t: -t[1])[:args.top]:
+            print(f"    {nombre:<30}{ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
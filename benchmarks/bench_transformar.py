@@ -0,0 +1,90 @@
+"""
+Micro-benchmark de transformar_a_estructura_mongo frente a la versión original (búsqueda lineal por chat).
+
+Genera updates sintéticos (texto, comandos, mensajes editados, fotos y my_chat_member) y mide el
+tiempo y el pico de memoria de la transformación. La versión original es O(updates × chats), por
+lo que se mide con menos updates (`--updates-legacy`) y se compara el ritmo. En la versión por lotes
+un chat cuenta una vez por cada lote en el que aparece.
+
+Uso:
+    python benchmarks/bench_transformar.py [--updates 100000] [--chats 20000] [--updates-legacy 10000]
+"""
+import tracemalloc
+import argparse
+import logging
+import random
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import bot_interactions_updater as updater
+
+
+def generar_updates(n_updates, n_chats, semilla=3105):
+    """Genera `n_updates` updates variados repartidos entre `n_chats` chats (como generador)."""
+    aleatorio = random.Random(semilla)
+    for i in range(n_updates):
+        chat = {"id": 100000 + aleatorio.randrange(n_chats), "first_name": "Usuario", "type": "private"}
+        tipo = aleatorio.random()
+        if tipo < 0.05:
+            yield {"update_id": i, "my_chat_member": {"chat": chat, "new_chat_member": {"status": aleatorio.choice(["member", "kicked"])}}}
+            continue
+
+        mensaje = {"message_id": i + 1, "date": 1700000000 + i, "chat": chat}
+        if tipo < 0.15:
+            mensaje.update({"photo": [{"file_id": "x"}], "caption": "foto"})
+        elif tipo < 0.25:
+            mensaje.update({"text": "/start", "entities": [{"offset": 0, "length": 6, "type": "bot_command"}]})
+        else:
+            mensaje["text"] = f"mensaje {i}"
+
+        if tipo > 0.95:
+            yield {"update_id": i, "edited_message": dict(mensaje, text="editado", edit_date=1700000000 + i + 60)}
+        else:
+            yield {"update_id": i, "message": mensaje}
+
+def transformar_legacy(interacciones):
+    """Versión original: lista de chats con búsqueda lineal; solo mensajes de texto."""
+    chats = []
+    for interaccion in interacciones:
+        mensaje = interaccion.get('message', {})
+        if mensaje and 'text' in mensaje:
+            chat_id = mensaje['chat']['id']
+            chat = next((c for c in chats if c['chat_id'] == chat_id), None)
+            if not chat:
+                chat = {"chat_id": chat_id, "first_name": mensaje['chat'].get('first_name', ''), "username": mensaje['chat'].get('username', ''),
+                        "chat_type": mensaje['chat']['type'], "active": True, "messages": []}
+                chats.append(chat)
+            chat['messages'].append({"message_id": mensaje['message_id'], "date": mensaje['date'], "text": mensaje['text'], "command": '', "entities": []})
+    return chats
+
+def medir(nombre, funcion, n_updates):
+    """Mide tiempo y pico de memoria de `funcion` y muestra el ritmo en updates por segundo."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    chats = funcion()
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:<10}{n_updates:>10}{chats:>10}{duracion:>12.3f}{n_updates / duracion:>16,.0f}{pico / 2 ** 20:>14.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=100000)
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--updates-legacy", type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    print(f"{'versión':<10}{'updates':>10}{'chats':>10}{'tiempo (s)':>12}{'updates/s':>16}{'pico (MiB)':>14}")
+
+    medir("legacy", lambda: len(transformar_legacy(list(generar_updates(args.updates_legacy, args.chats)))), args.updates_legacy)
+    # La entrada llega como generador y cada lote se descarta tras "guardarlo", como en la sincronización
+    medir("dict", lambda: sum(len(lote) for lote in updater.transformar_a_estructura_mongo(generar_updates(args.updates, args.chats))), args.updates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Servidor local que imita la API de bots de Telegram para pruebas de carga sin enviar mensajes reales.
+
+Implementa getUpdates (con offset y long polling), sendMessage, sendPhoto (multipart o file_id),
+getChatMember, setWebhook y deleteWebhook. Puede simular latencia, límites de envío (429 con
+retry_after) y usuarios que han bloqueado el bot (403), y registra cada entrega para medir
+rendimiento.
+
+Uso independiente (apuntando los scripts con TELEGRAM_API_BASE=http://127.0.0.1:8081):
+    python benchmarks/fake_telegram_api.py [--puerto 8081] [--latencia-ms 40] [--limite 30] [--bloqueados 0.02]
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+from email.parser import BytesParser
+from email.policy import HTTP
+import threading
+import argparse
+import logging
+import random
+import json
+import time
+import zlib
+
+
+class FakeTelegramAPI:
+    """Estado y configuración del servidor falso de la API de Telegram."""
+
+    def __init__(self, latencia_ms=0.0, jitter_ms=0.0, limite_por_segundo=None, retry_after=1, bloqueados=0.0, semilla=3105):
+        self.latencia = latencia_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.limite = limite_por_segundo
+        self.retry_after = retry_after
+        self.bloqueados = bloqueados
+        self.aleatorio = random.Random(semilla)
+
+        self.lock = threading.Lock()
+        self.nuevos_updates = threading.Condition(self.lock)
+        self.updates = []
+        self.ventana = []
+        self.servidor = None
+        self.reiniciar_estadisticas()
+
+    # --- Configuración de escenarios -------------------------------------------------------
+
+    def esta_bloqueado(self, chat_id):
+        """Decide de forma determinista (por chat_id) si un usuario ha bloqueado el bot."""
+        return (zlib.crc32(str(chat_id).encode()) % 10000) < self.bloqueados * 10000
+
+    def agregar_updates(self, updates):
+        """Añade updates a la cola de getUpdates y despierta a los clientes en long polling."""
+        with self.nuevos_updates:
+            self.updates.extend(updates)
+            self.nuevos_updates.notify_all()
+
+    def reiniciar_estadisticas(self):
+        """Vacía los registros de entregas y contadores."""
+        with self.lock:
+            self.entregas = {"sendMessage": {}, "sendPhoto": {}}
+            self.contadores = {"requests": 0, "429": 0, "403": 0, "uploads": 0, "by_file_id": 0, "bytes_uploaded": 0}
+
+    def estadisticas(self):
+        """Copia de los contadores y de los instantes de entrega (time.monotonic) por método y chat."""
+        with self.lock:
+            return {"contadores": dict(self.contadores), "entregas": {m: dict(e) for m, e in self.entregas.items()}}
+
+    # --- Servidor ------------------------------------------------------------------------------
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.servidor.server_port}"
+
+    def iniciar(self, puerto=0):
+        """Arranca el servidor en un hilo y devuelve la URL base (para TELEGRAM_API_BASE)."""
+        api = self
+
+        class Handler(_Handler):
+            fake = api
+
+        self.servidor = _Servidor(("127.0.0.1", puerto), Handler)
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self.url
+
+    def detener(self):
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+
+    # --- Lógica de la API ----------------------------------------------------------------------
+
+    def _limitado(self):
+        """Ventana deslizante de un segundo: True si la petición supera el límite configurado."""
+        if not self.limite:
+            return False
+        ahora = time.monotonic()
+        self.ventana = [t for t in self.ventana if ahora - t < 1]
+        if len(self.ventana) >= self.limite:
+            return True
+        self.ventana.append(ahora)
+        return False
+
+    def atender(self, metodo, params, bytes_subidos):
+        """Devuelve (status, cuerpo) para una llamada a la API."""
+        if metodo == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+
+        if metodo in ("setWebhook", "deleteWebhook"):
+            return 200, {"ok": True, "result": True}
+
+        if metodo == "getChatMember":
+            estado = "kicked" if self.esta_bloqueado(params.get("user_id")) else "member"
+            return 200, {"ok": True, "result": {"status": estado, "user": {"id": int(params.get("user_id", 0))}}}
+
+        if metodo not in ("sendMessage", "sendPhoto"):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+
+        chat_id = params.get("chat_id")
+        with self.lock:
+            self.contadores["requests"] += 1
+            if self._limitado():
+                self.contadores["429"] += 1
+                return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {self.retry_after}",
+                             "parameters": {"retry_after": self.retry_after}}
+            if self.esta_bloqueado(chat_id):
+                self.contadores["403"] += 1
+                return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+
+            self.entregas[metodo].setdefault(chat_id, time.monotonic())
+            if metodo == "sendPhoto":
+                if bytes_subidos:
+                    self.contadores["uploads"] += 1
+                    self.contadores["bytes_uploaded"] += bytes_subidos
+                else:
+                    self.contadores["by_file_id"] += 1
+
+        resultado = {"message_id": self.aleatorio.randrange(1, 10 ** 9), "chat": {"id": int(chat_id), "type": "private"}, "date": int(time.time())}
+        if metodo == "sendPhoto":
+            resultado["photo"] = [{"file_id": "fake-photo-small", "width": 90, "height": 60},
+                                  {"file_id": "fake-photo-file-id", "width": 1280, "height": 853}]
+        return 200, {"ok": True, "result": resultado}
+
+    def _get_updates(self, params):
+        """getUpdates con offset (confirma los anteriores), limit y long polling."""
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        fin = time.monotonic() + float(params.get("timeout", 0))
+
+        with self.nuevos_updates:
+            # Los updates anteriores al offset quedan confirmados y se descartan
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.monotonic() < fin:
+                self.nuevos_updates.wait(fin - time.monotonic())
+            return self.updates[:limit]
+
+
+class _Servidor(ThreadingHTTPServer):
+    # Cola de conexiones amplia: con muchos hilos de envío la cola por defecto (5) provoca resets
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+
+    def _responder(self, params, bytes_subidos=0):
+        metodo = urlparse(self.path).path.rsplit("/", 1)[-1]
+        if self.fake.latencia or self.fake.jitter:
+            time.sleep(self.fake.latencia + self.fake.aleatorio.random() * self.fake.jitter)
+
+        status, cuerpo = self.fake.atender(metodo, params, bytes_subidos)
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        self._responder(dict(parse_qsl(urlparse(self.path).query)))
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        tipo = self.headers.get("Content-Type", "")
+        params = dict(parse_qsl(urlparse(self.path).query))
+        bytes_subidos = 0
+
+        if tipo.startswith("multipart/form-data"):
+            # Reconstruir el mensaje MIME para extraer los campos y el tamaño de los ficheros subidos
+            mensaje = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {tipo}\r\n\r\n".encode() + cuerpo)
+            for parte in mensaje.iter_parts():
+                nombre = parte.get_param("name", header="content-disposition")
+                contenido = parte.get_payload(decode=True) or b""
+                if parte.get_filename():
+                    bytes_subidos += len(contenido)
+                else:
+                    params[nombre] = contenido.decode("utf-8")
+        elif tipo.startswith("application/json"):
+            params.update(json.loads(cuerpo or b"{}"))
+        else:
+            params.update(parse_qsl(cuerpo.decode("utf-8")))
+
+        self._responder(params, bytes_subidos)
+
+    def log_message(self, formato, *args):
+        logging.debug(formato, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=8081)
+    parser.add_argument("--latencia-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--limite", type=float, default=30, help="peticiones de envío por segundo antes de responder 429")
+    parser.add_argument("--bloqueados", type=float, default=0.02, help="fracción de usuarios que han bloqueado el bot")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    api = FakeTelegramAPI(args.latencia_ms, args.jitter_ms, args.limite, bloqueados=args.bloqueados)
+    logging.info(f"API de Telegram falsa escuchando en {api.iniciar(args.puerto)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.detener()
+
+
+if __name__ == "__main__":
+    main()
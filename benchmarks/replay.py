@@ -0,0 +1,359 @@
+"""
+Grabación y reproducción de la página de radares para comprobar el scraper sin la web municipal.
+
+`grabar` guarda el HTML de la página y sus recursos (hojas de estilo, scripts e imágenes) en
+fixtures/recordings/<nombre>/, con las referencias del HTML apuntando a las copias locales, un
+manifest.json con la URL, la fecha y las ubicaciones esperadas y, opcionalmente, el GeoJSON de
+los radares y las teselas necesarias para renderizar el mapa sin conexión.
+
+`ejecutar` sirve por HTTP las páginas de fixtures/radar_pages (con expected.json) y las
+grabaciones, y pasa cada una por todo el flujo del notificador (descarga, análisis, destinatarios,
+mapa, envío a la API de Telegram falsa y report en mongomock). Compara las ubicaciones del report
+con las esperadas y termina con código 1 si alguna no coincide o si no se guardó el report. Los
+casos cubren las tres ramas: con radares, sin radares y estado desconocido (None: comprobación con
+el navegador, aviso de error a los usuarios y report sin ubicaciones).
+
+Sin `--navegador` no se arranca Chrome: la rama de Selenium usa un navegador simulado cuyo
+`page_source` es el HTML servido, y el mapa sale de la caché de imágenes (o se renderiza si la
+grabación trae GeoJSON).
+
+Uso:
+    python benchmarks/replay.py grabar <url> <nombre> [--features <url GeoJSON>]
+    python benchmarks/replay.py servir [--puerto 8090]
+    python benchmarks/replay.py ejecutar [--casos radar.html,unknown.html] [--usuarios 20] [--navegador] [--json resultados.json]
+"""
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urljoin, urlparse
+from functools import partial
+import threading
+import argparse
+import datetime
+import hashlib
+import logging
+import json
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(RAIZ, "fixtures")
+GRABACIONES = os.path.join(FIXTURES, "recordings")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Atributos del HTML con recursos que se graban
+RECURSOS = (("link", "href"), ("script", "src"), ("img", "src"))
+
+
+
+
+
+###############################
+##         Grabación         ##
+###############################
+
+
+def _nombre_recurso(url):
+    """Nombre local de un recurso: hash corto de la URL y el nombre original (sin colisiones entre rutas)."""
+    base = os.path.basename(urlparse(url).path) or "recurso"
+    return f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}-{base}"
+
+def grabar(url, nombre, features_url=None, directorio=GRABACIONES):
+    """Descarga la página, sus recursos y (opcionalmente) el GeoJSON y las teselas del mapa. Devuelve el manifest."""
+    from radar_parser import parsear_radares, TIMEOUT_DESCARGA
+    from bs4 import BeautifulSoup
+    import requests
+
+    destino = os.path.join(directorio, nombre)
+    os.makedirs(os.path.join(destino, "recursos"), exist_ok=True)
+    session = requests.Session()
+
+    response = session.get(url, timeout=TIMEOUT_DESCARGA)
+    response.raise_for_status()
+    html = response.content
+
+    # Los recursos se guardan aparte y el HTML se reescribe sin volver a serializarlo (queda igual que el original)
+    recursos = {}
+    soup = BeautifulSoup(html, "html.parser")
+    for etiqueta, atributo in RECURSOS:
+        for elemento in soup.find_all(etiqueta, attrs={atributo: True}):
+            valor = elemento[atributo]
+            if valor in recursos or valor.startswith("data:"):
+                continue
+            absoluta = urljoin(url, valor)
+            try:
+                recurso = session.get(absoluta, timeout=TIMEOUT_DESCARGA)
+                recurso.raise_for_status()
+            except requests.RequestException as e:
+                logging.warning(f"No se pudo grabar {absoluta}: {e}")
+                continue
+            local = f"recursos/{_nombre_recurso(absoluta)}"
+            with open(os.path.join(destino, local), "wb") as f:
+                f.write(recurso.content)
+            recursos[valor] = {"url": absoluta, "local": local, "content_type": recurso.headers.get("Content-Type")}
+
+    for valor, recurso in recursos.items():
+        for comilla in ('"', "'"):
+            html = html.replace(f"{comilla}{valor}{comilla}".encode("utf-8"), f"{comilla}{recurso['local']}{comilla}".encode("utf-8"))
+    with open(os.path.join(destino, "index.html"), "wb") as f:
+        f.write(html)
+
+    manifest = {
+        "url": url,
+        "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "expected": parsear_radares(response.content),
+        "resources": list(recursos.values()),
+    }
+
+    if features_url:
+        manifest["features"] = _grabar_mapa(session, features_url, destino)
+
+    with open(os.path.join(destino, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    logging.info(f"Grabación '{nombre}' guardada en {destino} ({len(recursos)} recursos).")
+    return manifest
+
+def _grabar_mapa(session, features_url, destino):
+    """Guarda el GeoJSON de los radares y renderiza el mapa una vez para guardar sus teselas."""
+    import map_renderer
+
+    response = session.get(features_url, timeout=(5, 20))
+    response.raise_for_status()
+    with open(os.path.join(destino, "features.geojson"), "wb") as f:
+        f.write(response.content)
+
+    map_renderer.MAP_TILE_CACHE_DIR = os.path.join(destino, "teselas")
+    map_renderer.renderizar_mapa(map_renderer.puntos_desde_geojson(response.json()), session=session)
+    return "features.geojson"
+
+
+
+
+
+###############################
+##       Reproducción        ##
+###############################
+
+
+class Silencioso(SimpleHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+
+class NavegadorSimulado:
+    """
+    Sustituto del driver de Chrome para reproducir sin navegador: `get` descarga la página servida
+    y `page_source` es su HTML (sin JavaScript). No hay canvas que capturar.
+    """
+
+    def __init__(self):
+        self.tiempos_arranque = {}
+        self.current_url = None
+        self.page_source = ""
+
+    def get(self, url):
+        import requests
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        self.current_url, self.page_source = url, response.text
+
+    def find_elements(self, by, valor):
+        from selenium.webdriver.common.by import By
+        from bs4 import BeautifulSoup
+        if by != By.CLASS_NAME:
+            return []
+        return BeautifulSoup(self.page_source, "html.parser").find_all(class_=valor)
+
+    def find_element(self, by, valor):
+        from selenium.common.exceptions import NoSuchElementException
+        elementos = self.find_elements(by, valor)
+        if not elementos:
+            raise NoSuchElementException(f"{by}={valor}")
+        return elementos[0]
+
+    def set_page_load_timeout(self, segundos):
+        pass
+
+    def set_script_timeout(self, segundos):
+        pass
+
+    def execute_script(self, script, *args):
+        return None
+
+    def quit(self):
+        pass
+
+
+def servir(puerto=0):
+    """Sirve `fixtures/` por HTTP y devuelve (servidor, URL base)."""
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), partial(Silencioso, directory=FIXTURES))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+def cargar_casos():
+    """Casos de reproducción: {nombre: {"ruta", "expected", "features"}} de radar_pages y de las grabaciones."""
+    casos = {}
+    with open(os.path.join(FIXTURES, "radar_pages", "expected.json"), encoding="utf-8") as f:
+        for pagina, esperado in json.load(f).items():
+            casos[pagina] = {"ruta": f"radar_pages/{pagina}", "expected": esperado, "features": None}
+
+    if os.path.isdir(GRABACIONES):
+        for nombre in sorted(os.listdir(GRABACIONES)):
+            ruta_manifest = os.path.join(GRABACIONES, nombre, "manifest.json")
+            if not os.path.exists(ruta_manifest):
+                continue
+            with open(ruta_manifest, encoding="utf-8") as f:
+                manifest = json.load(f)
+            casos[nombre] = {
+                "ruta": f"recordings/{nombre}/index.html",
+                "expected": manifest["expected"],
+                "features": manifest.get("features") and f"recordings/{nombre}/{manifest['features']}",
+                "teselas": os.path.join(GRABACIONES, nombre, "teselas"),
+            }
+    return casos
+
+def ejecutar_caso(notifier, updater, api, base, caso, usuarios, navegador, png):
+    """Ejecuta el notificador contra un caso y devuelve el resultado (ubicaciones del report, envíos y tiempo)."""
+    import bench_end_to_end
+    import map_renderer
+
+    notifier.donosti_radar_web_url = f"{base}/{caso['ruta']}"
+    if caso["features"]:
+        # Mapa renderizado con el GeoJSON y las teselas grabados (una tesela que falte falla sin salir a internet)
+        notifier.MAP_RENDER_MODE = "render"
+        notifier.MAP_FEATURES_URL = f"{base}/{caso['features']}"
+        map_renderer.MAP_TILE_CACHE_DIR = caso["teselas"]
+        map_renderer.MAP_TILE_URL = f"{base}/sin-teselas/{{z}}/{{x}}/{{y}}.png"
+    else:
+        notifier.MAP_RENDER_MODE = "screenshot"
+        notifier.MAP_FEATURES_URL = None
+
+    # Sin navegador, la imagen del mapa sale de la caché (salvo que se renderice desde el GeoJSON)
+    imagen_cacheada = caso["expected"] if not (navegador or caso["features"]) else None
+    bench_end_to_end.sembrar(notifier, updater, api, usuarios, 0, imagen_cacheada, png)
+
+    api.reiniciar_estadisticas()
+    inicio = time.perf_counter()
+    error = None
+    try:
+        notifier.main()
+    except Exception as e:
+        error = repr(e)
+    duracion = time.perf_counter() - inicio
+
+    report = notifier.contexto.collection_reports.find_one(sort=[("timestamp", -1)])
+    obtenido = report.get("locations") if report else None
+    entregas = api.estadisticas()["entregas"]
+    ok = error is None and report is not None and obtenido == caso["expected"]
+    if caso["expected"] is None:
+        # El estado desconocido tiene que llegar a los usuarios como aviso de error
+        ok = ok and len(entregas["sendMessage"]) > 0
+    return {
+        "expected": caso["expected"],
+        "locations": obtenido,
+        "report": report is not None,
+        "messages": len(entregas["sendMessage"]),
+        "photos": len(entregas["sendPhoto"]),
+        "seconds": round(duracion, 3),
+        "error": error,
+        "ok": ok,
+    }
+
+def ejecutar(casos, usuarios=20, navegador=False):
+    """Reproduce los casos indicados con todo el flujo del notificador y devuelve sus resultados."""
+    from fake_telegram_api import FakeTelegramAPI
+    import bench_end_to_end
+
+    api = FakeTelegramAPI()
+    os.environ.update({
+        "TELEGRAM_TOKEN": "replay",
+        "TELEGRAM_API_BASE": api.iniciar(),
+        "MONGO_DB": "replay",
+        "MONGO_COLLECTION_INTERACTIONS": "interactions",
+        "MONGO_COLLECTION_REPORTS": "reports",
+    })
+    servidor, base = servir()
+
+    import bot_interactions_updater as updater
+    import telegram_radar_notifier as notifier
+    bench_end_to_end.usar_mongomock(notifier, updater)
+    if not navegador:
+        # Nunca se descarga chromedriver ni se sale a internet: la página renderizada es el HTML servido
+        notifier.inicializar_driver = lambda persistente=False, url=None: NavegadorSimulado()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    png = bench_end_to_end.imagen_de_prueba()
+    resultados = {}
+    try:
+        for nombre, caso in casos.items():
+            resultados[nombre] = ejecutar_caso(notifier, updater, api, base, caso, usuarios, navegador, png)
+    finally:
+        servidor.shutdown()
+        api.detener()
+    return resultados
+
+
+
+
+
+########################
+##    Funcion Main    ##
+########################
+
+
+def _describir(locations):
+    return "None" if locations is None else str(len(locations))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+
+    grabacion = subparsers.add_parser("grabar", help="graba la página y sus recursos")
+    grabacion.add_argument("url")
+    grabacion.add_argument("nombre")
+    grabacion.add_argument("--features", help="GeoJSON de los radares (graba también las teselas del mapa)")
+
+    servicio = subparsers.add_parser("servir", help="sirve fixtures/ por HTTP (p. ej. para DONOSTI_RADAR_WEB)")
+    servicio.add_argument("--puerto", type=int, default=8090)
+
+    ejecucion = subparsers.add_parser("ejecutar", help="pasa los casos grabados por todo el flujo del notificador")
+    ejecucion.add_argument("--casos", help="nombres separados por comas; por defecto, todos")
+    ejecucion.add_argument("--usuarios", type=int, default=20)
+    ejecucion.add_argument("--navegador", action="store_true", help="usa Chrome en la rama de Selenium y para capturar el mapa")
+    ejecucion.add_argument("--json", help="guarda los resultados en este fichero")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.accion == "grabar":
+        print(json.dumps(grabar(args.url, args.nombre, args.features), indent=2, ensure_ascii=False))
+        return
+
+    if args.accion == "servir":
+        _, base = servir(args.puerto)
+        print(f"Sirviendo {FIXTURES} en {base} (Ctrl+C para terminar)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+
+    casos = cargar_casos()
+    if args.casos:
+        casos = {nombre: casos[nombre] for nombre in args.casos.split(",")}
+    resultados = ejecutar(casos, args.usuarios, args.navegador)
+
+    print(f"{'caso':<20}{'esperado':>10}{'obtenido':>10}{'mensajes':>10}{'fotos':>7}{'tiempo (s)':>12}  resultado")
+    for nombre, resultado in resultados.items():
+        print(f"{nombre:<20}{_describir(resultado['expected']):>10}{_describir(resultado['locations']):>10}"
+              f"{resultado['messages']:>10}{resultado['photos']:>7}{resultado['seconds']:>12.2f}  "
+              f"{'OK' if resultado['ok'] else 'FALLO'}{' ' + resultado['error'] if resultado['error'] else ''}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if all(resultado["ok"] for resultado in resultados.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,67 @@
-from pymongo import MongoClient
+from user_liveness import comprobar_usuarios, consultar_estado, estado_activo
+from telegram_client import obtener_cliente
+from telegram_broadcast import difundir
+from message_archive import comando_mensaje
+from pymongo import UpdateOne
+from config import contexto
+import message_templates
+import subscriptions
 import datetime
-import requests
 import logging
 import os
 
 # Configuración básica de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Configura el token de tu bot
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-GET_UPDATES_URL = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates'
-GET_CHAT_MEMBER_URL = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/getChatMember'
+# Las URLs de la API de Telegram se construyen al usarse con `obtener_cliente().url(metodo)`: el
+# token y el servidor se leen al crear el cliente (ver `telegram_client`), no al importar el script
 
-# Configura la conexión con MongoDB Atlas
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+# La conexión con MongoDB Atlas y las colecciones (interacciones, estado de la sincronización y
+# suscripciones) se crean al usarse por primera vez (ver `config`)
 
-# Selecciona la base de datos y colección
-MONGO_DB = os.getenv("MONGO_DB")
-db = client[MONGO_DB]
-MONGO_COLLECTION_INTERACTIONS = os.getenv("MONGO_COLLECTION_INTERACTIONS")
-collection = db[MONGO_COLLECTION_INTERACTIONS]
+# Documento de la colección de estado con el último update_id procesado
+ESTADO_UPDATES_ID = "telegram_updates"
+_indices_creados = False
 
-def obtener_interacciones():
+# Número de chats por lote entre la transformación y el guardado
+TAMANO_LOTE_CHATS = int(os.getenv("TAMANO_LOTE_CHATS", "500"))
+
+# Tipos de contenido de los mensajes sin texto
+TIPOS_CONTENIDO = ("photo", "sticker", "animation", "video", "voice", "audio", "document", "location", "contact")
+
+# Parámetros de getUpdates: tamaño de página y espera máxima del long polling (segundos)
+GET_UPDATES_LIMIT = int(os.getenv("GET_UPDATES_LIMIT", "100"))
+GET_UPDATES_TIMEOUT = int(os.getenv("GET_UPDATES_TIMEOUT", "0"))
+
+def obtener_offset():
+    """Devuelve el offset para getUpdates (último update_id procesado + 1) o None si nunca se ha sincronizado."""
+    estado = contexto.collection_state.find_one({"_id": ESTADO_UPDATES_ID})
+    if estado and estado.get("last_update_id") is not None:
+        return estado["last_update_id"] + 1
+    return None
+
+def guardar_offset(last_update_id):
+    """Guarda en MongoDB el último update_id procesado (nunca retrocede)."""
+    contexto.collection_state.update_one(
+        {"_id": ESTADO_UPDATES_ID},
+        {
+            "$max": {"last_update_id": last_update_id},
+            "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)}
+        },
+        upsert=True
+    )
+
+def obtener_interacciones(offset=None, limit=GET_UPDATES_LIMIT, timeout=GET_UPDATES_TIMEOUT):
+    """Obtiene una página de interacciones posteriores a `offset` (long polling de hasta `timeout` segundos)."""
     try:
-        logging.info("Iniciando la solicitud a la API de Telegram...")
-        response = requests.get(GET_UPDATES_URL)
+        logging.info(f"Iniciando la solicitud a la API de Telegram (offset={offset})...")
+        params = {'limit': limit, 'timeout': timeout}
+        if offset is not None:
+            params['offset'] = offset
+
+        # El tiempo de lectura cubre la espera del long polling
+        cliente = obtener_cliente()
+        response = cliente.get(cliente.url("getUpdates"), params=params, timeout=(5, timeout + 30))
         data = response.json()
 
         if data.get('ok'):
@@ -43,165 +79,304 @@ def obtener_estado_usuario(chat_id):
     """
     Verifica si el usuario está activo o ha dejado el bot.
     """
-    try:
-        url = f"{GET_CHAT_MEMBER_URL}?chat_id={chat_id}&user_id={chat_id}"
-        response = requests.get(url)
-        data = response.json()
-        
-        if data.get('ok'):
-            # Si el estado es "left", significa que el usuario ha dejado el bot
-            if data['result']['status'] == 'left':
-                return False
-            return True
-        else:
-            logging.error(f"Error al obtener estado del usuario {chat_id}: {data}")
-            return True  # Si no se puede obtener el estado, asumimos que está activo
-    except Exception as e:
-        logging.error(f"Error al verificar estado del usuario {chat_id}: {e}")
-        return True  # En caso de error, asumimos que está activo
+    cliente = obtener_cliente()
+    activo = consultar_estado(cliente, cliente.url("getChatMember"), chat_id)
+    return activo if activo is not None else True  # Si no se puede obtener el estado, asumimos que está activo
+
+def _nuevo_chat(chat_telegram):
+    """Crea la estructura de un chat a partir del objeto `chat` de Telegram."""
+    return {
+        "chat_id": chat_telegram['id'],
+        "first_name": chat_telegram.get('first_name', ''),
+        "username": chat_telegram.get('username', ''),
+        "chat_type": chat_telegram['type'],
+        "active": True,  # Inicialmente está activo
+        "messages": []
+    }
+
+def _transformar_mensaje(mensaje):
+    """Convierte un mensaje (o mensaje editado) de Telegram, tenga o no texto, a la estructura de MongoDB."""
+    # Los mensajes sin texto (fotos, stickers, ubicaciones...) se guardan con su pie de foto, si lo tienen
+    if 'text' in mensaje:
+        content_type = 'text'
+    else:
+        content_type = next((tipo for tipo in TIPOS_CONTENIDO if tipo in mensaje), 'other')
+
+    transformado = {
+        "message_id": mensaje['message_id'],
+        "date": mensaje['date'],
+        "text": mensaje.get('text', mensaje.get('caption', '')),
+        "content_type": content_type,
+        "command": '',
+        "entities": []
+    }
+    if 'edit_date' in mensaje:
+        transformado["edit_date"] = mensaje['edit_date']
 
-def transformar_a_estructura_mongo(interacciones):
+    # Verificamos si el mensaje tiene entidades (comandos)
+    for entity in mensaje.get('entities', mensaje.get('caption_entities', [])):
+        if entity['type'] == 'bot_command':
+            transformado['command'] = 'bot_command'
+            transformado['entities'].append({
+                "offset": entity['offset'],
+                "length": entity['length'],
+                "type": entity['type']
+            })
+
+    return transformado
+
+def transformar_a_estructura_mongo(interacciones, tamano_lote=TAMANO_LOTE_CHATS):
+    """
+    Agrupa las interacciones por chat y genera lotes de hasta `tamano_lote` chats.
+
+    Recorre la entrada una sola vez con un diccionario indexado por chat_id, de modo que cada lote
+    se puede guardar mientras se siguen transformando los siguientes. Un chat puede aparecer en
+    varios lotes; el guardado es idempotente y los lotes se generan en orden.
+    """
     try:
-        chats = []
+        chats = {}
+        total = 0
         logging.info("Transformando las interacciones a la estructura para MongoDB...")
 
         for interaccion in interacciones:
-            mensaje = interaccion.get('message', {})
+            mensaje = interaccion.get('message') or interaccion.get('edited_message')
+            cambio_estado = interaccion.get('my_chat_member')
+
+            if cambio_estado:
+                # El usuario ha bloqueado, abandonado o reactivado el bot: Telegram informa sin necesidad de consultar
+                chat_id = cambio_estado['chat']['id']
+                if chat_id not in chats:
+                    chats[chat_id] = _nuevo_chat(cambio_estado['chat'])
+
+                # Los updates llegan en orden, así que prevalece el último cambio de estado
+                chats[chat_id]['member_status'] = cambio_estado['new_chat_member']['status']
 
             if mensaje:
                 chat_id = mensaje['chat']['id']
-                first_name = mensaje['chat'].get('first_name', '')
-                username = mensaje['chat'].get('username', '')
-                chat_type = mensaje['chat']['type']
-
-                # Verificamos si este chat ya existe en la lista de chats
-                chat = next((c for c in chats if c['chat_id'] == chat_id), None)
-
-                if not chat:
-                    # Si no existe, lo creamos
-                    chat = {
-                        "chat_id": chat_id,
-                        "first_name": first_name,
-                        "username": username,
-                        "chat_type": chat_type,
-                        "active": True,  # Inicialmente está activo
-                        "messages": []
-                    }
-                    chats.append(chat)
+                if chat_id not in chats:
+                    chats[chat_id] = _nuevo_chat(mensaje['chat'])
 
                 # Ahora agregamos el mensaje a este chat
-                chat['messages'].append({
-                    "message_id": mensaje['message_id'],
-                    "date": mensaje['date'],
-                    "text": mensaje['text'],
-                    "command": '',
-                    "entities": []
-                })
-
-                # Verificamos si el mensaje tiene entidades (comandos)
-                if 'entities' in mensaje:
-                    for entity in mensaje['entities']:
-                        if entity['type'] == 'bot_command':
-                            chat['messages'][-1]['command'] = 'bot_command'
-                            chat['messages'][-1]['entities'].append({
-                                "offset": entity['offset'],
-                                "length": entity['length'],
-                                "type": entity['type']
-                            })
-        logging.info("Transformación completa.")
-        return chats
+                chats[chat_id]['messages'].append(_transformar_mensaje(mensaje))
+
+                # Idioma de la aplicación del usuario (prevalece el del último mensaje)
+                idioma = (mensaje.get('from') or {}).get('language_code')
+                if idioma:
+                    chats[chat_id]['language_code'] = idioma
+
+            # Entregar el lote en cuanto se completa
+            if len(chats) >= tamano_lote:
+                total += len(chats)
+                yield list(chats.values())
+                chats = {}
+
+        if chats:
+            total += len(chats)
+            yield list(chats.values())
+
+        logging.info(f"Transformación completa ({total} chats).")
 
     except Exception as e:
         logging.error(f"Error al transformar las interacciones: {e}")
         raise  # Propaga el error
 
+def crear_indices():
+    """Crea los índices de la colección de interacciones (una vez por proceso)."""
+    global _indices_creados
+    if _indices_creados:
+        return
+
+    # Un único documento por chat: sustituye a la comprobación previa con find_one
+    contexto.collection_interactions.create_index("chat_id", unique=True)
+    # Permite resolver rápido el filtro que evita duplicar mensajes de un chat
+    contexto.collection_interactions.create_index([("chat_id", 1), ("messages.message_id", 1)])
+    subscriptions.crear_indices(contexto.collection_subscriptions)
+    _indices_creados = True
+
+def _documento_mensaje(msg):
+    """Convierte un mensaje transformado al documento que se guarda en MongoDB."""
+    documento = {
+        "message_id": msg["message_id"],
+        "date": datetime.datetime.utcfromtimestamp(msg["date"]),
+        "text": msg["text"],
+        "content_type": msg.get("content_type", "text"),
+        "command": msg.get("command", ""),
+        "entities": msg.get("entities", [])
+    }
+    if "edit_date" in msg:
+        documento["edit_date"] = datetime.datetime.utcfromtimestamp(msg["edit_date"])
+    return documento
+
 def guardar_interacciones_en_bd(interacciones):
+    """
+    Guarda los chats transformados en una única escritura masiva (bulk_write).
+
+    Por cada chat se hace un upsert con los datos del perfil ($setOnInsert) y el estado `active`,
+    y por cada mensaje un $push condicionado a que el message_id no exista ya en el chat, que
+    actualiza a la vez el resumen del chat (`message_count`, `last_seen`, `last_command`; los
+    mensajes antiguos se archivan con `message_archive`).
+    """
     logging.info("Guardando interacciones en la base de datos...")
+
+    # Descartar los chats sin mensajes (ni cambios de estado) y los mensajes sin identificador
+    chats = []
     for interaction in interacciones:
-        mensaje = interaction.get("messages", [])
-        if not mensaje:
+        mensajes = [msg for msg in interaction.get("messages", []) if msg.get("message_id")]
+        if len(mensajes) < len(interaction.get("messages", [])):
+            logging.warning("Mensaje sin 'message_id', omitiendo.")
+        if not mensajes and "member_status" not in interaction:
             logging.warning("Interacción sin mensajes, omitiendo.")
             continue
+        chats.append((interaction, mensajes))
 
-        for msg in mensaje:
-            message_id = msg.get("message_id")
-            if not message_id:
-                logging.warning("Mensaje sin 'message_id', omitiendo.")
-                continue
-
-            chat_id = interaction.get("chat_id")
-
-            # Verificar si el chat ya existe en la base de datos
-            chat_document = collection.find_one({"chat_id": chat_id})
-
-            if not chat_document:
-                logging.info(f"Nuevo chat con ID {chat_id}, creando un nuevo documento.")
-                collection.insert_one({
-                    "chat_id": chat_id,
-                    "first_name": interaction.get("first_name", ""),
-                    "username": interaction.get("username", ""),
-                    "chat_type": interaction.get("chat_type", ""),
-                    "active": True,  # Inicialmente está activo
-                    "messages": [
-                        {
-                            "message_id": message_id,
-                            "date": datetime.datetime.utcfromtimestamp(msg["date"]),
-                            "text": msg["text"],
-                            "command": msg.get("command", ""),
-                            "entities": msg.get("entities", [])
-                        }
-                    ]
-                })
-                logging.info(f"Chat con ID {chat_id} añadido a la base de datos.")
-
-            else:
-                # Comprobamos si el usuario está activo
-                if not obtener_estado_usuario(chat_id):
-                    # Si el usuario ha dejado el bot, lo marcamos como inactivo
-                    logging.info(f"Usuario con ID {chat_id} ha dejado el bot, actualizando estado a inactivo.")
-                    collection.update_one(
-                        {"chat_id": chat_id},
-                        {"$set": {"active": False}}
-                    )
-                else:
-                    # Si el usuario está activo, aseguramos que esté marcado como tal
-                    collection.update_one(
-                        {"chat_id": chat_id},
-                        {"$set": {"active": True}}
-                    )
-
-                # Verificamos si el mensaje ya existe en el chat
-                existing_message = collection.find_one(
-                    {"chat_id": chat_id, "messages.message_id": message_id}
-                )
-                
-                if not existing_message:
-                    logging.info(f"Nuevo mensaje del chat {chat_id}, añadiéndolo a la base de datos.")
-                    collection.update_one(
-                        {"chat_id": chat_id},
-                        {
-                            "$push": {
-                                "messages": {
-                                    "message_id": message_id,
-                                    "date": datetime.datetime.utcfromtimestamp(msg["date"]),
-                                    "text": msg["text"],
-                                    "command": msg.get("command", ""),
-                                    "entities": msg.get("entities", [])
-                                }
-                            }
-                        }
-                    )
-                    logging.info(f"Mensaje con ID {message_id} añadido al chat {chat_id}.")
-                else:
-                    logging.info(f"El mensaje con ID {message_id} ya existe en el chat {chat_id}, omitiendo.")
+    if not chats:
+        return
 
-def main():
-    interacciones = obtener_interacciones()
+    # Una sola consulta para saber qué chats existen ya (solo a estos se les comprueba el estado)
+    existentes = set(contexto.collection_interactions.distinct("chat_id", {"chat_id": {"$in": [interaction["chat_id"] for interaction, _ in chats]}}))
+
+    # Estado de los usuarios: el cambio notificado por Telegram (my_chat_member) prevalece; el resto
+    # de chats existentes se comprueba una sola vez, con caché y en paralelo
+    estados = {
+        interaction["chat_id"]: estado_activo(interaction["member_status"])
+        for interaction, _ in chats if "member_status" in interaction
+    }
+    estados.update(comprobar_usuarios(
+        contexto.collection_interactions,
+        [interaction["chat_id"] for interaction, _ in chats if interaction["chat_id"] in existentes and interaction["chat_id"] not in estados],
+        obtener_cliente().url("getChatMember")
+    ))
+
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    operaciones = []
+    for interaction, mensajes in chats:
+        chat_id = interaction.get("chat_id")
+
+        activo = estados.get(chat_id, True)
+        if not activo:
+            logging.info(f"Usuario con ID {chat_id} ha dejado el bot, actualizando estado a inactivo.")
+
+        actualizacion = {
+            "$setOnInsert": {
+                "first_name": interaction.get("first_name", ""),
+                "username": interaction.get("username", ""),
+                "chat_type": interaction.get("chat_type", "")
+            },
+            "$set": {"active": activo}
+        }
+        if "member_status" in interaction:
+            actualizacion["$set"].update({"active_checked_at": ahora, "active_source": "my_chat_member"})
+        if interaction.get("language_code"):
+            actualizacion["$set"]["language_code"] = interaction["language_code"]
+
+        operaciones.append(UpdateOne({"chat_id": chat_id}, actualizacion, upsert=True))
+
+        # Añadir cada mensaje solo si no existe ya en el chat (el resumen solo cambia si se añade)
+        for msg in mensajes:
+            documento = _documento_mensaje(msg)
+            actualizacion = {
+                "$push": {"messages": documento},
+                "$inc": {"message_count": 1},
+                "$max": {"last_seen": documento["date"]}
+            }
+            if documento["command"]:
+                actualizacion["$set"] = {"last_command": comando_mensaje(documento)}
+            operaciones.append(UpdateOne(
+                {"chat_id": chat_id, "messages.message_id": {"$ne": msg["message_id"]}},
+                actualizacion
+            ))
+
+            # Un mensaje editado sustituye el texto del mensaje ya guardado
+            if "edit_date" in documento:
+                operaciones.append(UpdateOne(
+                    {"chat_id": chat_id, "messages.message_id": msg["message_id"]},
+                    {"$set": {
+                        "messages.$.text": documento["text"],
+                        "messages.$.entities": documento["entities"],
+                        "messages.$.command": documento["command"],
+                        "messages.$.edit_date": documento["edit_date"]
+                    }}
+                ))
+
+    resultado = contexto.collection_interactions.bulk_write(operaciones, ordered=True)
+    logging.info(
+        f"Interacciones guardadas: {resultado.upserted_count} chats nuevos, "
+        f"{resultado.modified_count} actualizaciones ({len(operaciones)} operaciones en un bulk_write)."
+    )
+
+def confirmar_suscripciones(chats):
+    """Responde al momento a los usuarios que han enviado /start en este lote."""
+    nuevos = {
+        chat["chat_id"]: message_templates.idioma(chat.get("language_code")) for chat in chats
+        if any(msg.get("text", "").startswith("/start") and "edit_date" not in msg for msg in chat.get("messages", []))
+    }
+    if not nuevos:
+        return
+
+    # Un texto ya construido por idioma
+    params = {idioma: {'text': message_templates.confirmacion(idioma), 'parse_mode': 'Markdown'} for idioma in set(nuevos.values())}
+    url = obtener_cliente().url("sendMessage")
+    ids_sent, ids_error = difundir(list(nuevos), lambda chat_id: (url, {**params[nuevos[chat_id]], 'chat_id': chat_id}, None))
+    logging.info(f"Confirmación de suscripción enviada a {len(ids_sent)} usuarios ({len(ids_error)} errores).")
+
+def responder_comandos(chats):
+    """Ejecuta los comandos de suscripción (/suscribir, /desuscribir, /zonas) del lote y responde a cada usuario."""
+    respuestas = subscriptions.procesar_comandos(contexto.collection_subscriptions, contexto.collection_interactions, chats)
+    if not respuestas:
+        return
 
-    if interacciones:
-        chats_transformados = transformar_a_estructura_mongo(interacciones)
+    textos = {chat_id: "\n\n".join(mensajes) for chat_id, mensajes in respuestas.items()}
+    url = obtener_cliente().url("sendMessage")
+    ids_sent, ids_error = difundir(
+        list(textos),
+        lambda chat_id: (url, {'text': textos[chat_id], 'parse_mode': 'Markdown', 'chat_id': chat_id}, None)
+    )
+    logging.info(f"Respuesta a los comandos enviada a {len(ids_sent)} usuarios ({len(ids_error)} errores).")
+
+def procesar_interacciones(interacciones):
+    """Transforma, guarda y responde un conjunto de interacciones (de getUpdates o del webhook)."""
+    crear_indices()
+
+    # Cada lote de chats se guarda en cuanto se termina de transformar
+    for chats_transformados in transformar_a_estructura_mongo(interacciones):
         guardar_interacciones_en_bd(chats_transformados)
-    else:
+        confirmar_suscripciones(chats_transformados)
+        responder_comandos(chats_transformados)
+
+def sincronizar_interacciones(timeout=GET_UPDATES_TIMEOUT):
+    """
+    Descarga y guarda las interacciones nuevas página a página hasta vaciar la cola de Telegram.
+
+    El offset se guarda tras persistir cada página, de modo que una ejecución interrumpida se
+    reanuda sin volver a descargar lo ya guardado. Devuelve el número de interacciones procesadas.
+    """
+    offset = obtener_offset()
+    total = 0
+
+    while True:
+        interacciones = obtener_interacciones(offset, timeout=timeout)
+        if not interacciones:
+            break
+
+        procesar_interacciones(interacciones)
+
+        # Confirmar la página: Telegram descarta los updates anteriores al nuevo offset
+        last_update_id = max(interaccion['update_id'] for interaccion in interacciones)
+        guardar_offset(last_update_id)
+        offset = last_update_id + 1
+        total += len(interacciones)
+
+        # Una página incompleta indica que ya no quedan updates pendientes
+        if len(interacciones) < GET_UPDATES_LIMIT:
+            break
+
+        # El resto de páginas ya están disponibles, no hace falta esperar
+        timeout = 0
+
+    return total
+
+def main():
+    if not sincronizar_interacciones():
         logging.warning("No se han obtenido nuevas interacciones de Telegram.")
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+"""
+Contexto compartido de los scripts: conexión con MongoDB y colecciones, creadas la primera vez que se usan.
+
+Importar un script ya no abre conexiones: el MongoClient se crea al acceder por primera vez a
+`contexto.client`, `contexto.db` o a una colección, con la configuración del entorno en ese
+momento. Los dos scripts (y el daemon) comparten el mismo contexto y, por tanto, el mismo pool
+de conexiones. Para usar otra base de datos (p. ej. mongomock) basta con `contexto.usar_cliente()`
+antes de llamar a las funciones, o con asignar directamente una colección.
+"""
+import threading
+import os
+
+# Colecciones del contexto: atributo -> (variable de entorno con el nombre, nombre por defecto)
+COLECCIONES = {
+    "collection_interactions": ("MONGO_COLLECTION_INTERACTIONS", None),
+    # Reports de las ejecuciones (time-series; ver `reports` para migrar la colección antigua)
+    "collection_reports": ("MONGO_COLLECTION_REPORTS", "radar_reports"),
+    # Mensajes archivados de las interacciones (uno por documento, ver `message_archive`)
+    "collection_archive": ("MONGO_COLLECTION_ARCHIVE", "interactions_archive"),
+    # Resultado de cada envío por usuario (separado del report de la ejecución)
+    "collection_deliveries": ("MONGO_COLLECTION_DELIVERIES", "radar_deliveries"),
+    # Caché de imágenes del mapa (clave: ubicaciones + fecha)
+    "collection_image_cache": ("MONGO_COLLECTION_IMAGE_CACHE", "radar_image_cache"),
+    # Índice invertido de suscripciones por ubicación (clave normalizada -> chat_id)
+    "collection_subscriptions": ("MONGO_COLLECTION_SUBSCRIPTIONS", "radar_subscriptions"),
+    # Cola de envíos persistente (un trabajo por ejecución, tipo de envío y usuario)
+    "collection_outbox": ("MONGO_COLLECTION_OUTBOX", "radar_outbox"),
+    # Estado de la sincronización de getUpdates (último update_id procesado)
+    "collection_state": ("MONGO_COLLECTION_STATE", "bot_state"),
+    # Última versión vista de la página de cada fuente (ETag, Last-Modified, hash y ubicaciones)
+    "collection_snapshots": ("MONGO_COLLECTION_SNAPSHOTS", "radar_snapshots"),
+}
+
+
+class Contexto:
+    """
+    Recursos de MongoDB creados bajo demanda y de forma thread-safe.
+
+    `client`, `db` y los atributos de COLECCIONES se crean al primer acceso y se guardan en la
+    instancia; asignarlos (p. ej. `contexto.collection_outbox = ...`) sustituye el recurso.
+    """
+
+    def __init__(self, entorno=os.environ):
+        self.entorno = entorno
+        self._lock = threading.RLock()
+
+    def nombre_coleccion(self, atributo):
+        """Nombre en MongoDB de una colección del contexto ('collection_outbox' -> 'radar_outbox')."""
+        variable, por_defecto = COLECCIONES[atributo]
+        return self.entorno.get(variable, por_defecto)
+
+    def _crear(self, nombre):
+        if nombre == "client":
+            # El MongoClient (y su conexión) solo se crea cuando hace falta la base de datos; pymongo ya
+            # está importado (`metrics` registra los comandos con pymongo.monitoring)
+            from metrics import listener_mongo
+            from pymongo import MongoClient
+            return MongoClient(self.entorno.get("MONGO_URI"), event_listeners=[listener_mongo])
+        if nombre == "db":
+            return self.client[self.entorno.get("MONGO_DB")]
+        return self.db[self.nombre_coleccion(nombre)]
+
+    def __getattr__(self, nombre):
+        # Solo se llama si el atributo aún no existe en la instancia
+        if nombre not in ("client", "db") and nombre not in COLECCIONES:
+            raise AttributeError(nombre)
+        with self._lock:
+            if nombre not in self.__dict__:
+                self.__dict__[nombre] = self._crear(nombre)
+            return self.__dict__[nombre]
+
+    def usar_cliente(self, client, nombre_db=None):
+        """Sustituye el MongoClient (y descarta la base de datos y las colecciones ya creadas)."""
+        with self._lock:
+            self.reiniciar()
+            self.__dict__["client"] = client
+            if nombre_db:
+                self.__dict__["db"] = client[nombre_db]
+
+    def reiniciar(self):
+        """Olvida los recursos creados; se volverán a crear con la configuración actual del entorno."""
+        with self._lock:
+            for nombre in ("client", "db", *COLECCIONES):
+                self.__dict__.pop(nombre, None)
+
+    def cerrar(self):
+        """Cierra el MongoClient si se llegó a crear."""
+        with self._lock:
+            client = self.__dict__.get("client")
+            if client is not None:
+                client.close()
+            self.reiniciar()
+
+
+# Contexto compartido por todos los módulos del proceso
+contexto = Contexto()
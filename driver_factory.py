@@ -0,0 +1,231 @@
+from urllib.parse import urlparse
+import ipaddress
+import subprocess
+import threading
+import logging
+import shutil
+import time
+import re
+import os
+
+# Directorio donde se guarda el chromedriver resuelto, una copia por versión de Chrome
+CHROMEDRIVER_CACHE_DIR = os.getenv("CHROMEDRIVER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mobile_radar_notifier", "chromedriver"))
+# Ejecutable de Chrome (opcional, por defecto se busca en el PATH)
+CHROME_BINARY = os.getenv("CHROME_BINARY")
+
+# Bloqueo de hosts de terceros: solo se resuelven el dominio de la página, las teselas del mapa y las CDN de sus scripts
+BLOQUEAR_RECURSOS = os.getenv("BLOQUEAR_RECURSOS", "1") == "1"
+MAP_TILE_HOSTS = [host.strip() for host in os.getenv("MAP_TILE_HOSTS", "tile.openstreetmap.org,*.tile.openstreetmap.org").split(",") if host.strip()]
+CDN_HOSTS = [host.strip() for host in os.getenv("CDN_HOSTS", "cdn.jsdelivr.net,cdnjs.cloudflare.com,unpkg.com,openlayers.org").split(",") if host.strip()]
+
+# Fuentes e iconos: no aparecen en la captura del mapa (las imágenes no se bloquean, las teselas y los marcadores lo son)
+PATRONES_BLOQUEADOS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.ico"]
+
+EJECUTABLES_CHROME = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"]
+
+# Navegadores de larga duración reutilizables entre comprobaciones (modo daemon), uno por fuente
+_drivers_persistentes = {}
+_drivers_lock = threading.Lock()
+
+
+
+
+
+##################################
+##   Resolución de chromedriver  ##
+##################################
+
+
+def version_chrome():
+    """Devuelve la versión de Chrome instalada (p. ej. '130.0.6723.91') o None si no se puede determinar."""
+    for ejecutable in ([CHROME_BINARY] if CHROME_BINARY else EJECUTABLES_CHROME):
+        try:
+            salida = subprocess.run([ejecutable, "--version"], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        coincidencia = re.search(r"\d+\.\d+\.\d+\.\d+", salida)
+        if coincidencia:
+            return coincidencia.group(0)
+    return None
+
+def resolver_chromedriver():
+    """Devuelve la ruta de un chromedriver compatible, usando la caché en disco por versión de Chrome."""
+    version = version_chrome()
+    ruta_cache = os.path.join(CHROMEDRIVER_CACHE_DIR, version or "desconocida", "chromedriver")
+
+    if version and os.access(ruta_cache, os.X_OK):
+        logging.info(f"Chromedriver para Chrome {version} encontrado en caché.")
+        return ruta_cache
+
+    # Resolver (y descargar si hace falta) con webdriver-manager y guardar una copia en la caché
+    from webdriver_manager.chrome import ChromeDriverManager
+    ruta = ChromeDriverManager().install()
+
+    if version:
+        os.makedirs(os.path.dirname(ruta_cache), exist_ok=True)
+        shutil.copy2(ruta, ruta_cache)
+        os.chmod(ruta_cache, 0o755)
+        logging.info(f"Chromedriver para Chrome {version} guardado en caché: {ruta_cache}")
+        return ruta_cache
+    return ruta
+
+
+
+
+
+##############################
+##   Creación del driver    ##
+##############################
+
+
+def hosts_pagina(url):
+    """Hosts del dominio de una página ('www.donostia.eus' -> 'donostia.eus' y '*.donostia.eus'); una IP o localhost tal cual."""
+    host = urlparse(url).hostname if url else None
+    if not host:
+        return []
+    try:
+        ipaddress.ip_address(host)
+        return [host]
+    except ValueError:
+        pass
+    dominio = ".".join(host.split(".")[-2:])
+    return sorted({host, dominio, f"*.{dominio}"})
+
+def crear_opciones(hosts_permitidos=()):
+    """Opciones de Chrome: headless, carga 'eager' y, si se indican los hosts de la página, solo estos, las teselas y las CDN."""
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.page_load_strategy = "eager"
+
+    if CHROME_BINARY:
+        options.binary_location = CHROME_BINARY
+
+    # Resolver solo los hosts permitidos; el resto de terceros (analítica, anuncios, widgets) no se carga
+    if BLOQUEAR_RECURSOS and hosts_permitidos:
+        excepciones = ", ".join(f"EXCLUDE {host}" for host in [*hosts_permitidos, *MAP_TILE_HOSTS, *CDN_HOSTS])
+        options.add_argument(f"--host-resolver-rules=MAP * ~NOTFOUND, {excepciones}")
+
+    return options
+
+def bloquear_recursos(driver):
+    """Bloquea la descarga de fuentes e iconos mediante el protocolo DevTools."""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": PATRONES_BLOQUEADOS})
+    except Exception as e:
+        logging.warning(f"No se pudieron bloquear las fuentes: {e}")
+
+def crear_driver(url=None):
+    """
+    Crea un driver de Chrome y registra el tiempo de arranque por fases.
+
+    Los tiempos se guardan en `driver.tiempos_arranque` (driver_resolve y browser_launch; la
+    primera navegación la añade quien cargue la página, ver `registrar_navegacion`).
+    """
+    # Selenium solo se carga cuando de verdad hace falta un navegador
+    from selenium.webdriver.chrome.service import Service
+    from selenium import webdriver
+
+    hosts = hosts_pagina(url)
+
+    inicio = time.perf_counter()
+    ruta_driver = resolver_chromedriver()
+    resuelto = time.perf_counter()
+
+    driver = webdriver.Chrome(service=Service(ruta_driver), options=crear_opciones(hosts))
+    if BLOQUEAR_RECURSOS:
+        bloquear_recursos(driver)
+    lanzado = time.perf_counter()
+
+    driver.tiempos_arranque = {
+        "driver_resolve": round(resuelto - inicio, 3),
+        "browser_launch": round(lanzado - resuelto, 3),
+    }
+    return driver
+
+def limitar_tiempo(driver, segundos):
+    """
+    Acota cada orden al navegador a `segundos`: carga de la página, scripts asíncronos y la propia
+    petición HTTP al chromedriver, de modo que un navegador colgado no bloquea el hilo indefinidamente.
+    """
+    driver.set_page_load_timeout(segundos)
+    driver.set_script_timeout(segundos)
+    configuracion = getattr(getattr(driver, "command_executor", None), "_client_config", None)
+    if configuracion is not None:
+        configuracion.timeout = segundos
+
+def registrar_navegacion(driver, segundos):
+    """Anota la duración de la primera navegación del driver en sus tiempos de arranque."""
+    tiempos = getattr(driver, "tiempos_arranque", None)
+    if tiempos is not None and "first_navigation" not in tiempos:
+        tiempos["first_navigation"] = round(segundos, 3)
+        logging.info(f"Arranque del navegador: {tiempos}")
+
+
+
+
+
+##############################
+##   Navegador persistente  ##
+##############################
+
+
+def _driver_activo(driver):
+    """Comprueba si el navegador sigue respondiendo."""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+def obtener_driver(url=None, persistente=False):
+    """
+    Devuelve un driver nuevo o, en modo persistente, el navegador de larga duración ya arrancado.
+
+    Los navegadores persistentes se guardan por URL: cada fuente de radares tiene el suyo, con
+    sus propios hosts permitidos, y varias fuentes pueden usarse a la vez desde distintos hilos.
+    """
+    if not persistente:
+        return crear_driver(url)
+
+    with _drivers_lock:
+        driver = _drivers_persistentes.get(url)
+    if driver is not None and _driver_activo(driver):
+        driver.tiempos_arranque = {"driver_resolve": 0.0, "browser_launch": 0.0, "reused": True}
+        logging.info("Reutilizando el navegador persistente.")
+        return driver
+
+    cerrar_driver_persistente(url)
+    driver = crear_driver(url)
+    with _drivers_lock:
+        _drivers_persistentes[url] = driver
+    return driver
+
+def liberar_driver(driver):
+    """Cierra el driver salvo que sea un navegador persistente, que se deja en blanco (conservando las cookies) para la siguiente comprobación."""
+    if driver is None:
+        return
+    with _drivers_lock:
+        persistente = any(driver is existente for existente in _drivers_persistentes.values())
+    if persistente:
+        try:
+            driver.get("about:blank")
+        except Exception as e:
+            logging.warning(f"No se pudo limpiar el navegador persistente: {e}")
+        return
+    driver.quit()
+
+def cerrar_driver_persistente(url=None):
+    """Cierra el navegador persistente de `url` o, si no se indica, todos los navegadores persistentes."""
+    with _drivers_lock:
+        urls = [url] if url is not None else list(_drivers_persistentes)
+        drivers = [_drivers_persistentes.pop(clave) for clave in urls if clave in _drivers_persistentes]
+    for driver in drivers:
+        try:
+            driver.quit()
+        except Exception:
+            pass
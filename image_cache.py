@@ -0,0 +1,77 @@
+from bson.binary import Binary
+from pymongo import DESCENDING
+import datetime
+import hashlib
+import logging
+import json
+import os
+
+# Días sin usarse tras los que MongoDB elimina una imagen (índice TTL sobre `last_used`)
+IMAGE_CACHE_TTL_DIAS = int(os.getenv("IMAGE_CACHE_TTL_DIAS", "7"))
+# Número máximo de imágenes guardadas; por encima se eliminan las usadas hace más tiempo (LRU)
+IMAGE_CACHE_MAX_ENTRADAS = int(os.getenv("IMAGE_CACHE_MAX_ENTRADAS", "50"))
+
+_indices_creados = set()
+
+
+def clave_imagen(locations, fecha, variante=""):
+    """Clave de contenido de la imagen: hash de las ubicaciones ordenadas, la fecha y la variante de renderizado."""
+    contenido = json.dumps({"locations": sorted(locations), "fecha": fecha, "variante": variante}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+def crear_indices(collection):
+    """
+    Crea el índice TTL de la caché (una vez por proceso).
+
+    Se intenta una sola vez aunque falle: un índice en conflicto (p. ej. con otro TTL) no se
+    arregla reintentando, y la caché sigue funcionando sin él. El error se propaga para registrarlo.
+    """
+    if collection.full_name in _indices_creados:
+        return
+    _indices_creados.add(collection.full_name)
+    collection.create_index("last_used", expireAfterSeconds=IMAGE_CACHE_TTL_DIAS * 24 * 3600)
+
+def obtener_imagen(collection, clave):
+    """
+    Devuelve la entrada cacheada ({"png": bytes, "file_id": str | None, ...}) o None si no existe.
+
+    Cada acierto actualiza `last_used`, que sirve tanto para el TTL como para el desalojo LRU.
+    """
+    entrada = collection.find_one_and_update(
+        {"_id": clave},
+        {"$set": {"last_used": datetime.datetime.now(datetime.timezone.utc)}, "$inc": {"hits": 1}}
+    )
+    if entrada:
+        entrada["png"] = bytes(entrada["png"])
+        logging.info(f"Imagen del mapa encontrada en caché ({clave[:12]}).")
+    else:
+        logging.info(f"Imagen del mapa no encontrada en caché ({clave[:12]}).")
+    return entrada
+
+def guardar_imagen(collection, clave, png, locations, fecha, file_id=None):
+    """Guarda la imagen del mapa (y su file_id de Telegram, si ya se conoce) y aplica el límite de entradas."""
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    collection.update_one(
+        {"_id": clave},
+        {
+            "$set": {"png": Binary(png), "file_id": file_id, "locations": locations, "fecha": fecha, "last_used": ahora},
+            "$setOnInsert": {"created_at": ahora, "hits": 0}
+        },
+        upsert=True
+    )
+    logging.info(f"Imagen del mapa guardada en caché ({clave[:12]}, {len(png)} bytes).")
+    desalojar(collection)
+
+def guardar_file_id(collection, clave, file_id):
+    """Asocia a la imagen cacheada el file_id devuelto por Telegram tras subirla."""
+    collection.update_one({"_id": clave}, {"$set": {"file_id": file_id}})
+
+def desalojar(collection, max_entradas=IMAGE_CACHE_MAX_ENTRADAS):
+    """Elimina las entradas usadas hace más tiempo cuando se supera `max_entradas`."""
+    sobrantes = [
+        entrada["_id"]
+        for entrada in collection.find({}, {"_id": 1}).sort("last_used", DESCENDING).skip(max_entradas)
+    ]
+    if sobrantes:
+        collection.delete_many({"_id": {"$in": sobrantes}})
+        logging.info(f"Eliminadas {len(sobrantes)} imágenes antiguas de la caché.")
@@ -0,0 +1,139 @@
+"""
+Procesado de la imagen del mapa antes de enviarla: reducción de tamaño y compresión.
+
+La imagen se decodifica una sola vez y se codifica en el formato configurado:
+    - png: paleta de IMAGE_PNG_COLORES colores y optimize=True (sin pérdida visible en un mapa con pocos colores)
+    - jpeg / webp: la mayor calidad entre IMAGE_CALIDAD_MINIMA e IMAGE_CALIDAD_MAXIMA que cabe en IMAGE_MAX_BYTES
+"""
+from metrics import metricas
+from io import BytesIO
+import logging
+import time
+import os
+
+# Formato de salida: "png", "jpeg" o "webp"
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "png").lower()
+# Lado mayor máximo en píxeles (0 para no reducir)
+IMAGE_MAX_LADO = int(os.getenv("IMAGE_MAX_LADO", "1280"))
+# Tamaño máximo de la imagen codificada en JPEG/WebP (bytes)
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", "200000"))
+# Colores de la paleta en PNG (0 para no cuantizar)
+IMAGE_PNG_COLORES = int(os.getenv("IMAGE_PNG_COLORES", "256"))
+# Rango de calidades que se prueban en JPEG/WebP
+IMAGE_CALIDAD_MINIMA = int(os.getenv("IMAGE_CALIDAD_MINIMA", "60"))
+IMAGE_CALIDAD_MAXIMA = int(os.getenv("IMAGE_CALIDAD_MAXIMA", "90"))
+
+# Extensión y tipo MIME por formato (también para reconocer imágenes ya codificadas, p. ej. de la caché)
+FORMATOS = {
+    "png": ("png", "image/png", b"\x89PNG"),
+    "jpeg": ("jpg", "image/jpeg", b"\xff\xd8\xff"),
+    "webp": ("webp", "image/webp", b"RIFF"),
+}
+
+
+def variante():
+    """Descripción de la configuración de codificación (forma parte de la clave de la caché de imágenes)."""
+    if IMAGE_FORMAT == "png":
+        return f"png{IMAGE_PNG_COLORES}:{IMAGE_MAX_LADO}"
+    return f"{IMAGE_FORMAT}{IMAGE_MAX_BYTES}:{IMAGE_MAX_LADO}"
+
+def tipo_imagen(contenido):
+    """Devuelve (nombre de fichero, tipo MIME) de una imagen codificada según su cabecera."""
+    for formato, (extension, mime, firma) in FORMATOS.items():
+        if contenido[:len(firma)] == firma:
+            return f"mapa_recortado.{extension}", mime
+    return "mapa_recortado.png", "image/png"
+
+def _codificar(imagen, formato, **opciones):
+    salida = BytesIO()
+    imagen.save(salida, format=formato.upper(), **opciones)
+    return salida
+
+def _codificar_png(imagen, colores):
+    """PNG con paleta (sin tramado, que en un mapa de colores planos solo añade ruido y bytes)."""
+    from PIL import Image
+
+    if colores:
+        metodo = Image.Quantize.FASTOCTREE if imagen.mode == "RGBA" else Image.Quantize.MEDIANCUT
+        imagen = imagen.quantize(colors=colores, method=metodo, dither=Image.Dither.NONE)
+    return _codificar(imagen, "png", optimize=True), None
+
+def _codificar_con_presupuesto(imagen, formato, max_bytes, calidad_minima, calidad_maxima):
+    """
+    Busca (búsqueda binaria) la mayor calidad cuyo resultado no supera `max_bytes`.
+
+    Si ni la calidad mínima cabe, devuelve la de calidad mínima. Devuelve (buffer, calidad).
+    """
+    opciones = {"optimize": True, "progressive": True} if formato == "jpeg" else {"method": 4}
+    mejor = None
+    bajo, alto = calidad_minima, calidad_maxima
+    while bajo <= alto:
+        calidad = (bajo + alto) // 2
+        salida = _codificar(imagen, formato, quality=calidad, **opciones)
+        if salida.getbuffer().nbytes <= max_bytes:
+            mejor = (salida, calidad)
+            bajo = calidad + 1
+        else:
+            alto = calidad - 1
+
+    if mejor is None:
+        logging.warning(f"La imagen no cabe en {max_bytes} bytes ni con calidad {calidad_minima}.")
+        mejor = (_codificar(imagen, formato, quality=calidad_minima, **opciones), calidad_minima)
+    return mejor
+
+def optimizar_imagen(origen, formato=None, max_lado=None, max_bytes=None, colores=None):
+    """
+    Reduce y codifica la imagen del mapa. Devuelve (buffer en memoria, estadísticas).
+
+    `origen` es una imagen de Pillow (se modifica en el sitio) o los bytes de una imagen
+    codificada, que se decodifican una sola vez. Las estadísticas incluyen formato, dimensiones,
+    bytes antes y después, calidad y tiempo de codificación.
+    """
+    # Pillow solo se carga cuando hay una imagen que procesar
+    from PIL import Image
+
+    formato = (formato or IMAGE_FORMAT).lower()
+    max_lado = IMAGE_MAX_LADO if max_lado is None else max_lado
+    max_bytes = IMAGE_MAX_BYTES if max_bytes is None else max_bytes
+    colores = IMAGE_PNG_COLORES if colores is None else colores
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de imagen no soportado: {formato}")
+
+    inicio = time.perf_counter()
+    bytes_originales = len(origen) if isinstance(origen, (bytes, bytearray)) else None
+    imagen = Image.open(BytesIO(origen)) if bytes_originales is not None else origen
+
+    # Reducir en el sitio (thumbnail no crea una copia a resolución completa)
+    if max_lado and max(imagen.size) > max_lado:
+        imagen.thumbnail((max_lado, max_lado), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    # JPEG no admite transparencia; la captura del canvas llega en RGBA
+    if formato == "jpeg" and imagen.mode != "RGB":
+        imagen = imagen.convert("RGB")
+    elif imagen.mode not in ("RGB", "RGBA"):
+        imagen = imagen.convert("RGBA" if "A" in imagen.getbands() else "RGB")
+
+    if formato == "png":
+        salida, calidad = _codificar_png(imagen, colores)
+    else:
+        salida, calidad = _codificar_con_presupuesto(imagen, formato, max_bytes, IMAGE_CALIDAD_MINIMA, IMAGE_CALIDAD_MAXIMA)
+    salida.seek(0)
+
+    duracion = time.perf_counter() - inicio
+    estadisticas = {
+        "format": formato,
+        "width": imagen.width,
+        "height": imagen.height,
+        "bytes_original": bytes_originales,
+        "bytes": salida.getbuffer().nbytes,
+        "quality": calidad,
+        "encode_seconds": round(duracion, 4),
+    }
+    metricas.registrar_duracion("image_encode", duracion)
+    metricas.incrementar("image_bytes", estadisticas["bytes"])
+
+    logging.info(
+        f"Imagen codificada en {formato} {imagen.width}x{imagen.height}: {estadisticas['bytes']} bytes"
+        + (f" (antes {bytes_originales})" if bytes_originales else "") + f" en {duracion:.3f}s."
+    )
+    return salida, estadisticas
@@ -0,0 +1,150 @@
+import requests
+import logging
+import math
+import os
+
+# Servidor de teselas base del mapa y directorio donde se cachean en disco
+MAP_TILE_URL = os.getenv("MAP_TILE_URL", "https://tile.openstreetmap.org/{z}/{x}/{y}.png")
+MAP_TILE_CACHE_DIR = os.getenv("MAP_TILE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mobile_radar_notifier", "tiles"))
+MAP_USER_AGENT = os.getenv("MAP_USER_AGENT", "MobileRadarNotifier/1.0 (+https://github.com/Unai3105/Mobile_Radar_Notifier)")
+
+TILE_SIZE = 256
+ZOOM_MAXIMO = 17
+
+# Centro por defecto (Donostia / San Sebastián) cuando no hay puntos que mostrar
+CENTRO_POR_DEFECTO = (-1.9812, 43.3183)
+
+
+
+
+
+#################################
+##   Proyección y geometrías   ##
+#################################
+
+
+def lonlat_a_pixel(lon, lat, zoom):
+    """Convierte coordenadas geográficas a píxeles globales de Web Mercator para un nivel de zoom."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    escala = TILE_SIZE * 2 ** zoom
+    x = (lon + 180.0) / 360.0 * escala
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * escala
+    return x, y
+
+def mercator_a_lonlat(x, y):
+    """Convierte coordenadas EPSG:3857 (metros) a longitud y latitud."""
+    lon = x / 6378137.0 * 180.0 / math.pi
+    lat = math.degrees(2 * math.atan(math.exp(y / 6378137.0)) - math.pi / 2)
+    return lon, lat
+
+def normalizar_punto(x, y, nombre=""):
+    """Devuelve el punto como dict lon/lat, convirtiendo desde EPSG:3857 si las coordenadas están en metros."""
+    if abs(x) > 180 or abs(y) > 90:
+        x, y = mercator_a_lonlat(x, y)
+    return {"lon": x, "lat": y, "nombre": nombre}
+
+def puntos_desde_geojson(geojson):
+    """Extrae los puntos (Point y MultiPoint) de una FeatureCollection GeoJSON."""
+    puntos = []
+    for feature in geojson.get("features", []):
+        geometria = feature.get("geometry") or {}
+        propiedades = feature.get("properties") or {}
+        nombre = propiedades.get("name") or propiedades.get("nombre") or ""
+
+        if geometria.get("type") == "Point":
+            coordenadas = [geometria["coordinates"]]
+        elif geometria.get("type") == "MultiPoint":
+            coordenadas = geometria["coordinates"]
+        else:
+            continue
+
+        puntos += [normalizar_punto(c[0], c[1], nombre) for c in coordenadas]
+    return puntos
+
+def elegir_zoom(puntos, ancho, alto, margen=60):
+    """Elige el mayor zoom en el que todos los puntos caben en la imagen con el margen indicado."""
+    if len(puntos) < 2:
+        return 15
+
+    for zoom in range(ZOOM_MAXIMO, 0, -1):
+        pixeles = [lonlat_a_pixel(p["lon"], p["lat"], zoom) for p in puntos]
+        xs = [x for x, _ in pixeles]
+        ys = [y for _, y in pixeles]
+        if max(xs) - min(xs) <= ancho - 2 * margen and max(ys) - min(ys) <= alto - 2 * margen:
+            return zoom
+    return 1
+
+
+
+
+
+###############################
+##   Teselas y renderizado   ##
+###############################
+
+
+def obtener_tesela(z, x, y, session=None):
+    """Devuelve la tesela base (z, x, y) como imagen, descargándola solo si no está en la caché de disco."""
+    from PIL import Image
+
+    ruta = os.path.join(MAP_TILE_CACHE_DIR, str(z), str(x), f"{y}.png")
+
+    if not os.path.exists(ruta):
+        response = (session or requests).get(
+            MAP_TILE_URL.format(z=z, x=x, y=y),
+            headers={"User-Agent": MAP_USER_AGENT},
+            timeout=(5, 20)
+        )
+        response.raise_for_status()
+
+        # Escribir en un fichero temporal y renombrar para no dejar teselas a medias en la caché
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(response.content)
+        os.replace(temporal, ruta)
+
+    with Image.open(ruta) as tesela:
+        return tesela.convert("RGB")
+
+def dibujar_marcador(draw, x, y, radio=9):
+    """Dibuja el marcador de un radar centrado en (x, y)."""
+    draw.ellipse((x - radio - 2, y - radio - 2, x + radio + 2, y + radio + 2), fill=(255, 255, 255))
+    draw.ellipse((x - radio, y - radio, x + radio, y + radio), fill=(220, 30, 30))
+    draw.ellipse((x - 3, y - 3, x + 3, y + 3), fill=(255, 255, 255))
+
+def renderizar_mapa(puntos, ancho=1200, alto=800, session=None):
+    """Compone el mapa de los radares sobre las teselas base cacheadas y devuelve la imagen."""
+    from PIL import Image, ImageDraw
+
+    zoom = elegir_zoom(puntos, ancho, alto)
+
+    # Centro de la imagen en píxeles globales
+    if puntos:
+        pixeles = [lonlat_a_pixel(p["lon"], p["lat"], zoom) for p in puntos]
+        centro_x = (min(x for x, _ in pixeles) + max(x for x, _ in pixeles)) / 2
+        centro_y = (min(y for _, y in pixeles) + max(y for _, y in pixeles)) / 2
+    else:
+        pixeles = []
+        centro_x, centro_y = lonlat_a_pixel(*CENTRO_POR_DEFECTO, zoom)
+
+    origen_x = centro_x - ancho / 2
+    origen_y = centro_y - alto / 2
+
+    # Pegar todas las teselas que cubren la imagen
+    imagen = Image.new("RGB", (ancho, alto), (242, 239, 233))
+    limite = 2 ** zoom
+    for tx in range(int(origen_x // TILE_SIZE), int((origen_x + ancho) // TILE_SIZE) + 1):
+        for ty in range(int(origen_y // TILE_SIZE), int((origen_y + alto) // TILE_SIZE) + 1):
+            if not 0 <= ty < limite:
+                continue
+            tesela = obtener_tesela(zoom, tx % limite, ty, session)
+            imagen.paste(tesela, (int(tx * TILE_SIZE - origen_x), int(ty * TILE_SIZE - origen_y)))
+
+    # Dibujar los radares
+    draw = ImageDraw.Draw(imagen)
+    for x, y in pixeles:
+        dibujar_marcador(draw, x - origen_x, y - origen_y)
+
+    logging.info(f"Mapa renderizado con {len(puntos)} radares a zoom {zoom}.")
+    return imagen
@@ -0,0 +1,197 @@
+"""
+Compactación del histórico de mensajes de la colección de interacciones.
+
+Cada chat guarda sus mensajes en el array `messages` de su documento. Para que los documentos no
+crezcan sin límite (y no lleguen al máximo de 16 MB de MongoDB), los mensajes con más de
+INTERACTIONS_RETENCION_DIAS días se mueven a una colección de archivo de solo inserción, con un
+documento por mensaje indexado por chat_id y fecha. El documento del chat conserva los mensajes
+recientes y un resumen de todo su histórico: `last_seen`, `message_count` y `last_command` (el
+último comando enviado, p. ej. '/suscribir'); `guardar_interacciones_en_bd` lo mantiene al guardar
+cada mensaje.
+
+Cada mensaje se archiva antes de quitarlo del chat y el archivo no admite duplicados: si la
+compactación se interrumpe, basta con volver a ejecutarla. Las ediciones de un mensaje ya
+archivado no se aplican al archivo.
+
+Uso de la CLI (usa MONGO_URI, MONGO_DB, MONGO_COLLECTION_INTERACTIONS y MONGO_COLLECTION_ARCHIVE):
+    python message_archive.py compactar [--dias 30]
+    python message_archive.py migrar [--dias 30]
+"""
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from config import contexto
+import argparse
+import datetime
+import logging
+import json
+import os
+
+# Días que los mensajes permanecen en el documento del chat antes de archivarse
+INTERACTIONS_RETENCION_DIAS = int(os.getenv("INTERACTIONS_RETENCION_DIAS", "30"))
+# Chats que se compactan por lote (una escritura masiva en cada colección)
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+_indices_creados = set()
+
+
+def crear_indices(collection):
+    """Crea los índices de la colección de archivo (una vez por proceso)."""
+    if collection.full_name in _indices_creados:
+        return
+
+    # Un mensaje se archiva una sola vez aunque la compactación se repita
+    collection.create_index([("chat_id", ASCENDING), ("message_id", ASCENDING)], unique=True)
+    collection.create_index([("chat_id", ASCENDING), ("date", DESCENDING)])
+    collection.create_index("date")
+    _indices_creados.add(collection.full_name)
+
+def comando_mensaje(msg):
+    """
+    Texto del primer comando de un mensaje guardado ('/suscribir'), o None si no tiene.
+
+    Los `offset` y `length` de las entidades de Telegram cuentan unidades UTF-16; la mención al
+    bot de los grupos ('/start@MiBot') no forma parte del comando.
+    """
+    texto = (msg.get("text") or "").encode("utf-16-le")
+    for entity in msg.get("entities") or []:
+        if entity.get("type") == "bot_command":
+            comando = texto[entity["offset"] * 2:(entity["offset"] + entity["length"]) * 2].decode("utf-16-le", "ignore")
+            return comando.split("@")[0] or None
+    return None
+
+def resumir_mensajes(mensajes):
+    """Resumen de una lista de mensajes guardados: {"message_count", "last_seen", "last_command"}."""
+    fechas = [msg["date"] for msg in mensajes if msg.get("date")]
+    comandos = [msg for msg in mensajes if msg.get("command") and msg.get("date")]
+    return {
+        "message_count": len(mensajes),
+        "last_seen": max(fechas) if fechas else None,
+        "last_command": comando_mensaje(max(comandos, key=lambda msg: msg["date"])) if comandos else None,
+    }
+
+
+
+
+
+###############################
+##       Compactación        ##
+###############################
+
+
+def compactar(collection_interacciones, collection_archivo, retencion_dias=INTERACTIONS_RETENCION_DIAS, tamano_lote=ARCHIVE_BATCH_SIZE):
+    """
+    Mueve al archivo los mensajes anteriores a la ventana de retención. Devuelve {"chats", "archived"}.
+
+    Por lotes de chats: inserta los mensajes antiguos en el archivo (upsert idempotente) y después
+    los quita del array con $pull. Los chats ya compactados dejan de cumplir el filtro.
+    """
+    crear_indices(collection_archivo)
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    # Las fechas de los mensajes se guardan en UTC sin zona horaria
+    corte = ahora.replace(tzinfo=None) - datetime.timedelta(days=retencion_dias)
+    filtro = {"messages.date": {"$lt": corte}}
+    total_chats = total_mensajes = 0
+
+    while True:
+        chats = list(collection_interacciones.find(filtro, {"chat_id": 1, "messages": 1}).limit(tamano_lote))
+        if not chats:
+            break
+
+        operaciones_archivo = []
+        for chat in chats:
+            for msg in chat.get("messages", []):
+                if msg.get("date") and msg["date"] < corte and msg.get("message_id") is not None:
+                    operaciones_archivo.append(UpdateOne(
+                        {"chat_id": chat["chat_id"], "message_id": msg["message_id"]},
+                        {"$setOnInsert": {**msg, "chat_id": chat["chat_id"], "archived_at": ahora}},
+                        upsert=True
+                    ))
+        if operaciones_archivo:
+            collection_archivo.bulk_write(operaciones_archivo, ordered=False)
+
+        # Solo se quitan del chat cuando ya están en el archivo
+        collection_interacciones.bulk_write([
+            UpdateOne({"_id": chat["_id"]}, {"$pull": {"messages": {"date": {"$lt": corte}}}})
+            for chat in chats
+        ], ordered=False)
+
+        total_chats += len(chats)
+        total_mensajes += len(operaciones_archivo)
+        logging.info(f"Compactados {total_chats} chats ({total_mensajes} mensajes archivados).")
+
+    return {"chats": total_chats, "archived": total_mensajes}
+
+def migrar(collection_interacciones, collection_archivo, retencion_dias=INTERACTIONS_RETENCION_DIAS, tamano_lote=ARCHIVE_BATCH_SIZE):
+    """
+    Prepara los datos existentes: calcula el resumen de cada chat y compacta su histórico.
+
+    El resumen se recalcula a partir de los mensajes del chat y de los ya archivados, así que la
+    migración se puede repetir (o ejecutar con el bot en marcha) sin contar mensajes dos veces.
+    Devuelve {"summarized", "chats", "archived"}.
+    """
+    crear_indices(collection_archivo)
+
+    # Resumen de lo ya archivado por chat (vacío en la primera migración)
+    archivados = {
+        grupo["_id"]: grupo for grupo in collection_archivo.aggregate([
+            {"$group": {"_id": "$chat_id", "count": {"$sum": 1}, "last_seen": {"$max": "$date"}}}
+        ])
+    }
+    comandos_archivados = {
+        grupo["_id"]: comando_mensaje(grupo) for grupo in collection_archivo.aggregate([
+            {"$match": {"command": {"$gt": ""}}},
+            {"$sort": {"date": 1}},
+            {"$group": {"_id": "$chat_id", "text": {"$last": "$text"}, "entities": {"$last": "$entities"}}}
+        ])
+    }
+
+    resumidos = 0
+    operaciones = []
+    proyeccion = {"chat_id": 1, "messages.date": 1, "messages.command": 1, "messages.text": 1, "messages.entities": 1}
+    for chat in collection_interacciones.find({}, proyeccion):
+        resumen = resumir_mensajes(chat.get("messages", []))
+        archivo = archivados.get(chat["chat_id"])
+        if archivo:
+            resumen["message_count"] += archivo["count"]
+            resumen["last_seen"] = resumen["last_seen"] or archivo["last_seen"]
+            resumen["last_command"] = resumen["last_command"] or comandos_archivados.get(chat["chat_id"])
+        operaciones.append(UpdateOne({"_id": chat["_id"]}, {"$set": resumen}))
+
+        if len(operaciones) == tamano_lote:
+            resumidos += collection_interacciones.bulk_write(operaciones, ordered=False).matched_count
+            operaciones = []
+    if operaciones:
+        resumidos += collection_interacciones.bulk_write(operaciones, ordered=False).matched_count
+    logging.info(f"Resumen calculado para {resumidos} chats.")
+
+    return {"summarized": resumidos, **compactar(collection_interacciones, collection_archivo, retencion_dias, tamano_lote)}
+
+
+
+
+
+########################
+##    Funcion Main    ##
+########################
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    compactacion = subparsers.add_parser("compactar", help="archiva los mensajes anteriores a la ventana de retención")
+    compactacion.add_argument("--dias", type=int, default=INTERACTIONS_RETENCION_DIAS)
+    migracion = subparsers.add_parser("migrar", help="calcula el resumen de los chats existentes y compacta su histórico")
+    migracion.add_argument("--dias", type=int, default=INTERACTIONS_RETENCION_DIAS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.accion == "compactar":
+        resultado = compactar(contexto.collection_interactions, contexto.collection_archive, args.dias)
+    else:
+        resultado = migrar(contexto.collection_interactions, contexto.collection_archive, args.dias)
+
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Plantillas de los mensajes del bot en español, euskera e inglés.
+
+El idioma de cada usuario es el `language_code` que Telegram envía con sus mensajes (se guarda en
+el documento del chat). Cada variante del aviso (idioma, ubicaciones y encabezado) se renderiza una
+sola vez y queda memorizada; los destinatarios se agrupan por idioma para que la difusión envíe
+el texto ya construido sin formatear nada por usuario.
+"""
+from functools import lru_cache
+import os
+
+# Idioma de los usuarios sin `language_code` o con un idioma sin plantillas
+IDIOMA_POR_DEFECTO = os.getenv("IDIOMA_POR_DEFECTO", "es")
+
+PLANTILLAS = {
+    "es": {
+        "error": "⚠️ *Error al obtener información de los radares.*\n\n🚨 No se pudo verificar si hay radares móviles.",
+        "radares": "🚨 El radar móvil estará operando en las siguientes ubicaciones:\n\n{ubicaciones}\n\n🚗💨 ¡Cuidado con los naranjitos! 🚓",
+        "sin_radares": "No hay radares móviles planificados para hoy.",
+        "confirmacion": (
+            "✅ *¡Suscripción activada!*\n\n"
+            "Recibirás cada mañana la información de los radares móviles de Donostia.\n"
+            "Usa /suscribir <calle o zona> para recibir solo los avisos de tus ubicaciones."
+        ),
+    },
+    "eu": {
+        "error": "⚠️ *Errorea radarren informazioa lortzean.*\n\n🚨 Ezin izan da egiaztatu radar mugikorrik dagoen.",
+        "radares": "🚨 Radar mugikorra kokapen hauetan egongo da gaur:\n\n{ubicaciones}\n\n🚗💨 Kontuz naranjitoekin! 🚓",
+        "sin_radares": "Gaur ez dago radar mugikorrik aurreikusita.",
+        "confirmacion": (
+            "✅ *Harpidetza aktibatuta!*\n\n"
+            "Goizero jasoko duzu Donostiako radar mugikorren informazioa.\n"
+            "Erabili /suscribir <kalea edo eremua> zure kokapenen abisuak soilik jasotzeko."
+        ),
+    },
+    "en": {
+        "error": "⚠️ *Error retrieving the speed camera information.*\n\n🚨 Could not check whether there are mobile speed cameras.",
+        "radares": "🚨 The mobile speed camera will be operating at the following locations:\n\n{ubicaciones}\n\n🚗💨 Watch out for the naranjitos! 🚓",
+        "sin_radares": "No mobile speed cameras are scheduled for today.",
+        "confirmacion": (
+            "✅ *Subscription activated!*\n\n"
+            "You will receive the information about Donostia's mobile speed cameras every morning.\n"
+            "Use /suscribir <street or area> to receive only the alerts for your locations."
+        ),
+    },
+}
+
+# Formato de cada ubicación y del encabezado (nombre del municipio), comunes a todos los idiomas
+FORMATO_UBICACION = "   •  *{ubicacion}*"
+FORMATO_ENCABEZADO = "📍 *{encabezado}*\n\n{mensaje}"
+
+
+def idioma(language_code):
+    """Idioma con plantillas para un `language_code` de Telegram ('eu', 'en-GB'...); si no hay, el idioma por defecto."""
+    codigo = (language_code or "").split("-")[0].lower()
+    return codigo if codigo in PLANTILLAS else IDIOMA_POR_DEFECTO
+
+@lru_cache(maxsize=256)
+def _renderizar_aviso(idioma, ubicaciones, encabezado):
+    plantillas = PLANTILLAS[idioma]
+    if ubicaciones is None:
+        mensaje = plantillas["error"]
+    elif ubicaciones:
+        mensaje = plantillas["radares"].format(ubicaciones="\n".join(FORMATO_UBICACION.format(ubicacion=loc) for loc in ubicaciones))
+    else:
+        mensaje = plantillas["sin_radares"]
+
+    if encabezado:
+        mensaje = FORMATO_ENCABEZADO.format(encabezado=encabezado, mensaje=mensaje)
+    return mensaje
+
+def mensaje_radares(idioma, locations, encabezado=None):
+    """Aviso de los radares (ubicaciones, sin radares o error si `locations` es None), renderizado una vez por variante."""
+    return _renderizar_aviso(idioma, None if locations is None else tuple(locations), encabezado)
+
+def confirmacion(idioma):
+    """Respuesta al comando /start."""
+    return PLANTILLAS[idioma]["confirmacion"]
+
+def agrupar_por_idioma(ids_usuarios, idiomas):
+    """Agrupa los destinatarios por idioma ({idioma: [chat_id, ...]}) a partir de {chat_id: language_code}."""
+    grupos = {}
+    for chat_id in ids_usuarios:
+        grupos.setdefault(idioma(idiomas.get(chat_id)), []).append(chat_id)
+    return grupos
@@ -0,0 +1,167 @@
+from pymongo import monitoring
+from contextlib import contextmanager
+import functools
+import threading
+import logging
+import time
+import os
+
+# Fichero donde se exportan las métricas en formato de texto de Prometheus (textfile collector)
+METRICS_FILE = os.getenv("METRICS_FILE")
+# Prefijo de los nombres de las métricas exportadas
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "radar_notifier")
+
+
+class Metricas:
+    """Registro thread-safe de duraciones por etapa, contadores, estados HTTP y comandos de MongoDB."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Vacía todas las métricas (al empezar cada ejecución)."""
+        with self.lock:
+            self.etapas = {}
+            self.contadores = {}
+            self.estados_http = {}
+            self.mongo = {}
+
+    def registrar_duracion(self, etapa, segundos):
+        with self.lock:
+            datos = self.etapas.setdefault(etapa, {"count": 0, "total": 0.0, "max": 0.0})
+            datos["count"] += 1
+            datos["total"] += segundos
+            datos["max"] = max(datos["max"], segundos)
+
+    def incrementar(self, nombre, valor=1):
+        with self.lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + valor
+
+    def registrar_estado_http(self, status):
+        """Añade una respuesta al histograma de estados HTTP (None si no hubo respuesta)."""
+        clave = str(status) if status is not None else "error"
+        with self.lock:
+            self.estados_http[clave] = self.estados_http.get(clave, 0) + 1
+
+    def registrar_comando_mongo(self, comando, segundos, fallido=False):
+        with self.lock:
+            datos = self.mongo.setdefault(comando, {"count": 0, "total": 0.0, "failed": 0})
+            datos["count"] += 1
+            datos["total"] += segundos
+            datos["failed"] += int(fallido)
+
+    @contextmanager
+    def medir(self, etapa):
+        """Context manager que registra la duración del bloque como `etapa` (también si lanza una excepción)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_duracion(etapa, time.perf_counter() - inicio)
+
+    def cronometrar(self, etapa=None):
+        """Decorador que registra la duración de cada llamada (por defecto con el nombre de la función)."""
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self.medir(etapa or funcion.__name__):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def resumen(self):
+        """Copia de las métricas lista para guardarse en MongoDB (duraciones en segundos, redondeadas)."""
+        with self.lock:
+            return {
+                "stages": {
+                    etapa: {"count": d["count"], "total": round(d["total"], 4), "max": round(d["max"], 4)}
+                    for etapa, d in self.etapas.items()
+                },
+                "counters": dict(self.contadores),
+                "http_status": dict(self.estados_http),
+                "mongo": {
+                    comando: {"count": d["count"], "total": round(d["total"], 4), "failed": d["failed"]}
+                    for comando, d in self.mongo.items()
+                },
+            }
+
+    def formato_prometheus(self, prefijo=METRICS_PREFIX):
+        """Devuelve las métricas en el formato de texto de Prometheus."""
+        resumen = self.resumen()
+        lineas = []
+
+        def familia(nombre, tipo, ayuda, muestras):
+            if not muestras:
+                return
+            lineas.append(f"# HELP {prefijo}_{nombre} {ayuda}")
+            lineas.append(f"# TYPE {prefijo}_{nombre} {tipo}")
+            for sufijo, etiquetas, valor in muestras:
+                texto = ",".join(f'{clave}="{_escapar(v)}"' for clave, v in etiquetas.items())
+                lineas.append(f"{prefijo}_{nombre}{sufijo}{{{texto}}} {valor}" if texto else f"{prefijo}_{nombre}{sufijo} {valor}")
+
+        familia("stage_duration_seconds", "summary", "Duración de cada etapa de la ejecución.", [
+            muestra
+            for etapa, d in resumen["stages"].items()
+            for muestra in (("_sum", {"stage": etapa}, d["total"]), ("_count", {"stage": etapa}, d["count"]))
+        ])
+        familia("stage_duration_max_seconds", "gauge", "Duración máxima de una llamada a cada etapa.", [
+            ("", {"stage": etapa}, d["max"]) for etapa, d in resumen["stages"].items()
+        ])
+        familia("events_total", "counter", "Contadores de la ejecución (reintentos, bytes subidos...).", [
+            ("", {"name": nombre}, valor) for nombre, valor in resumen["counters"].items()
+        ])
+        familia("telegram_responses_total", "counter", "Respuestas de la API de Telegram por estado HTTP.", [
+            ("", {"status": status}, valor) for status, valor in resumen["http_status"].items()
+        ])
+        familia("mongo_command_duration_seconds", "summary", "Duración de los comandos de MongoDB.", [
+            muestra
+            for comando, d in resumen["mongo"].items()
+            for muestra in (("_sum", {"command": comando}, d["total"]), ("_count", {"command": comando}, d["count"]))
+        ])
+        familia("mongo_command_failures_total", "counter", "Comandos de MongoDB fallidos.", [
+            ("", {"command": comando}, d["failed"]) for comando, d in resumen["mongo"].items()
+        ])
+        familia("last_run_timestamp_seconds", "gauge", "Momento de la exportación.", [("", {}, round(time.time(), 3))])
+
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, ruta=METRICS_FILE):
+        """Escribe las métricas en `ruta` de forma atómica (no hace nada si no hay fichero configurado)."""
+        if not ruta:
+            return
+        try:
+            temporal = f"{ruta}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(self.formato_prometheus())
+            os.replace(temporal, ruta)
+            logging.info(f"Métricas exportadas en {ruta}.")
+        except OSError as e:
+            logging.warning(f"No se pudieron exportar las métricas: {e}")
+
+
+class ListenerMongo(monitoring.CommandListener):
+    """Registra la duración de cada comando que el MongoClient envía al servidor."""
+
+    def __init__(self, metricas):
+        self.metricas = metricas
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metricas.registrar_comando_mongo(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.metricas.registrar_comando_mongo(event.command_name, event.duration_micros / 1e6, fallido=True)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Métricas compartidas por todo el proceso
+metricas = Metricas()
+listener_mongo = ListenerMongo(metricas)
+medir = metricas.medir
+cronometrar = metricas.cronometrar
@@ -0,0 +1,330 @@
+"""
+Cola de envíos persistente en MongoDB (outbox) para difusiones reanudables y sin duplicados.
+
+Cada envío es un documento (ejecución, tipo, chat_id) con su estado: pending -> sending -> sent
+o failed. Los hilos (o procesos) reclaman los trabajos de uno en uno con find_one_and_update y
+un lease, de modo que ningún trabajo se reclama dos veces. El identificador de la ejecución es
+determinista (fuente, fecha y contenido): si el proceso se interrumpe, volver a ejecutarlo
+continúa donde se quedó y no reenvía a quien ya lo recibió.
+
+Un trabajo que se quedó en `sending` al caerse el proceso pudo haberse entregado o no; para no
+duplicar envíos pasa a `uncertain` y no se reenvía (salvo con OUTBOX_REENVIAR_INCIERTOS=1).
+
+Uso de la CLI (usa MONGO_URI, MONGO_DB, MONGO_COLLECTION_OUTBOX, TELEGRAM_TOKEN):
+    python outbox.py estado <run_id>
+    python outbox.py trabajar <run_id> [--tipo message] [--workers 8]
+"""
+from telegram_broadcast import enviar_con_reintentos, BROADCAST_WORKERS
+from telegram_client import obtener_cliente
+from metrics import metricas
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import ReturnDocument, InsertOne
+from pymongo.errors import BulkWriteError
+import threading
+import argparse
+import datetime
+import hashlib
+import logging
+import socket
+import json
+import uuid
+import time
+import os
+
+# Duración del lease de un trabajo reclamado y número máximo de intentos ante errores de red (sin respuesta)
+OUTBOX_LEASE_SEGUNDOS = int(os.getenv("OUTBOX_LEASE_SEGUNDOS", "300"))
+OUTBOX_MAX_INTENTOS = int(os.getenv("OUTBOX_MAX_INTENTOS", "3"))
+# Días que se conservan los trabajos (índice TTL)
+OUTBOX_TTL_DIAS = int(os.getenv("OUTBOX_TTL_DIAS", "7"))
+# Reenviar los trabajos interrumpidos a medio enviar (entrega al menos una vez en lugar de como mucho una)
+OUTBOX_REENVIAR_INCIERTOS = os.getenv("OUTBOX_REENVIAR_INCIERTOS", "0") == "1"
+
+# Trabajos por escritura al encolar
+TAMANO_LOTE_OUTBOX = 5000
+
+# Códigos de error de MongoDB por clave duplicada (el trabajo ya existía)
+CLAVE_DUPLICADA = 11000
+
+_indices_creados = set()
+
+
+def id_ejecucion(*partes):
+    """Identificador determinista de una difusión (p. ej. fuente, fecha y contenido del mensaje)."""
+    contenido = json.dumps(partes, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:24]
+
+def _id_trabajo(run_id, tipo, chat_id):
+    return f"{run_id}:{tipo}:{chat_id}"
+
+def _identificador_worker():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+def crear_indices(collection):
+    """Índices para reclamar trabajos por ejecución y lote y para caducar los antiguos (una vez por proceso)."""
+    if collection.full_name in _indices_creados:
+        return
+    collection.create_index([("run_id", 1), ("tipo", 1), ("status", 1), ("lote", 1)])
+    collection.create_index([("status", 1), ("lease_until", 1)])
+    collection.create_index("created_at", expireAfterSeconds=OUTBOX_TTL_DIAS * 24 * 3600)
+    _indices_creados.add(collection.full_name)
+
+
+
+
+
+###############################
+##   Encolado y reclamación  ##
+###############################
+
+
+def encolar(collection, run_id, tipo, ids_usuarios, payload=None, reabrir_fallidos=False):
+    """
+    Crea los trabajos que falten y asigna los pendientes a un lote nuevo. Devuelve el identificador del lote.
+
+    Los trabajos ya enviados no se tocan. `payload` ({"method", "data"}) permite que otros
+    procesos hagan los envíos (`trabajar`); sin él solo los procesa quien los encola.
+    """
+    crear_indices(collection)
+    recuperar_expirados(collection, run_id, tipo)
+
+    lote = uuid.uuid4().hex
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    ids_usuarios = list(ids_usuarios)
+
+    for inicio in range(0, len(ids_usuarios), TAMANO_LOTE_OUTBOX):
+        fragmento = ids_usuarios[inicio:inicio + TAMANO_LOTE_OUTBOX]
+
+        # Crear los trabajos nuevos (los existentes fallan por clave duplicada y se ignoran)
+        try:
+            collection.bulk_write([
+                InsertOne({
+                    "_id": _id_trabajo(run_id, tipo, chat_id), "run_id": run_id, "tipo": tipo, "chat_id": chat_id,
+                    "status": "pending", "lote": lote, "payload": payload, "attempts": 0, "created_at": ahora
+                })
+                for chat_id in fragmento
+            ], ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != CLAVE_DUPLICADA for error in e.details.get("writeErrors", [])):
+                raise
+
+        # Los pendientes de una ejecución anterior (y, si se pide, los fallidos) pasan a este lote
+        estados = ["pending", "failed"] if reabrir_fallidos else ["pending"]
+        collection.update_many(
+            {"_id": {"$in": [_id_trabajo(run_id, tipo, chat_id) for chat_id in fragmento]}, "status": {"$in": estados}},
+            {"$set": {"status": "pending", "lote": lote, "payload": payload}}
+        )
+
+    return lote
+
+def recuperar_expirados(collection, run_id=None, tipo=None):
+    """Libera los trabajos cuyo lease ha caducado (proceso caído a mitad de envío)."""
+    filtro = {"status": "sending", "lease_until": {"$lt": datetime.datetime.now(datetime.timezone.utc)}}
+    if run_id:
+        filtro.update({"run_id": run_id, "tipo": tipo})
+    destino = "pending" if OUTBOX_REENVIAR_INCIERTOS else "uncertain"
+    recuperados = collection.update_many(filtro, {"$set": {"status": destino}}).modified_count
+    if recuperados:
+        logging.warning(f"{recuperados} envíos interrumpidos marcados como '{destino}'.")
+    return recuperados
+
+def reclamar(collection, filtro, worker, lease=OUTBOX_LEASE_SEGUNDOS):
+    """Reclama de forma atómica un trabajo pendiente que cumpla `filtro` (None si no quedan)."""
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    return collection.find_one_and_update(
+        {**filtro, "status": "pending"},
+        {
+            "$set": {"status": "sending", "worker": worker, "lease_until": ahora + datetime.timedelta(seconds=lease)},
+            "$inc": {"attempts": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+def file_id_foto(response):
+    """Obtiene el file_id de la foto de mayor resolución de una respuesta de sendPhoto (None si no hay)."""
+    try:
+        return response.json()['result']['photo'][-1]['file_id']
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+def completar(collection, trabajo, response, reintentos, latencia):
+    """
+    Guarda el resultado de un envío: sent, failed o de nuevo pending si no hubo respuesta y quedan intentos.
+
+    Los 5xx ya se han reintentado en `enviar_con_reintentos`: si siguen fallando, el envío falla
+    (reencolarlo multiplicaría los reintentos por OUTBOX_MAX_INTENTOS).
+    """
+    status = response.status_code if response is not None else None
+    if status == 200:
+        estado = "sent"
+    elif status is None:
+        estado = "pending" if trabajo["attempts"] < OUTBOX_MAX_INTENTOS else "failed"
+    else:
+        estado = "failed"
+
+    resultado = {"status": status, "retries": reintentos, "latency": round(latencia, 3)}
+    if estado == "sent" and trabajo.get("tipo") == "photo":
+        # Una ejecución reanudada reutiliza la foto ya subida sin volver a subirla
+        resultado["file_id"] = file_id_foto(response)
+
+    collection.update_one(
+        {"_id": trabajo["_id"], "worker": trabajo["worker"]},
+        {"$set": {
+            "status": estado,
+            "result": resultado,
+            "updated_at": datetime.datetime.now(datetime.timezone.utc)
+        }}
+    )
+    return estado
+
+
+
+
+
+###############################
+##   Difusión desde la cola  ##
+###############################
+
+
+def _peticion_desde_payload(trabajo):
+    """Construye la petición (url, data, files) de un trabajo a partir de su payload."""
+    payload = trabajo["payload"]
+    return obtener_cliente().url(payload["method"]), {**payload["data"], "chat_id": trabajo["chat_id"]}, None
+
+def procesar(collection, filtro, construir_peticion, session=None, limitador=None, workers=BROADCAST_WORKERS, detalles=None):
+    """
+    Reclama y envía trabajos que cumplan `filtro` con `workers` hilos hasta vaciar la cola.
+
+    `construir_peticion(trabajo)` devuelve (url, data, files). Devuelve el número de trabajos procesados.
+    """
+    session = session or obtener_cliente()
+    procesados = []
+
+    def _trabajar():
+        worker = _identificador_worker()
+        while True:
+            trabajo = reclamar(collection, filtro, worker)
+            if trabajo is None:
+                return
+            url, data, files = construir_peticion(trabajo)
+            inicio = time.monotonic()
+            try:
+                response, reintentos = enviar_con_reintentos(session, url, trabajo["chat_id"], data, files, limitador)
+            except Exception as e:
+                logging.error(f"Error inesperado al enviar a {trabajo['chat_id']}: {e}")
+                response, reintentos = None, 0
+            latencia = time.monotonic() - inicio
+            metricas.registrar_estado_http(response.status_code if response is not None else None)
+            metricas.incrementar("telegram_retries", reintentos)
+            estado = completar(collection, trabajo, response, reintentos, latencia)
+
+            if detalles is not None and estado != "pending":
+                detalles[trabajo["chat_id"]] = {
+                    "status": response.status_code if response is not None else None,
+                    "latency": latencia, "retries": reintentos, "response": response
+                }
+            procesados.append(trabajo["_id"])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for futuro in [executor.submit(_trabajar) for _ in range(workers)]:
+            futuro.result()
+
+    return len(procesados)
+
+def difundir_outbox(collection, run_id, tipo, ids_usuarios, construir_peticion, payload=None, session=None,
+                    limitador=None, workers=BROADCAST_WORKERS, detalles=None, reabrir_fallidos=False):
+    """
+    Equivalente a `telegram_broadcast.difundir` sobre la outbox: devuelve (ids_sent, ids_error).
+
+    Solo envía a los usuarios sin un envío previo de esta ejecución y tipo; los que ya lo
+    recibieron cuentan como enviados. `construir_peticion(chat_id)` devuelve (url, data, files).
+    """
+    ids_usuarios = list(ids_usuarios)
+    lote = encolar(collection, run_id, tipo, ids_usuarios, payload, reabrir_fallidos)
+    procesar(
+        collection, {"run_id": run_id, "tipo": tipo, "lote": lote},
+        lambda trabajo: construir_peticion(trabajo["chat_id"]),
+        session, limitador, workers, detalles
+    )
+
+    # Estado final de cada usuario, incluidos los enviados en ejecuciones interrumpidas
+    estados = {}
+    for inicio in range(0, len(ids_usuarios), TAMANO_LOTE_OUTBOX):
+        fragmento = [_id_trabajo(run_id, tipo, chat_id) for chat_id in ids_usuarios[inicio:inicio + TAMANO_LOTE_OUTBOX]]
+        for trabajo in collection.find({"_id": {"$in": fragmento}}, {"chat_id": 1, "status": 1, "result": 1}):
+            estados[trabajo["chat_id"]] = trabajo
+    ids_sent = []
+    ids_error = []
+    previos = 0
+    for chat_id in ids_usuarios:
+        trabajo = estados.get(chat_id, {})
+        if trabajo.get("status") == "sent":
+            ids_sent.append(chat_id)
+        else:
+            ids_error.append(chat_id)
+
+        if detalles is not None and chat_id not in detalles and trabajo.get("result"):
+            previos += 1
+            detalles[chat_id] = {**trabajo["result"], "response": None}
+
+    if previos:
+        logging.info(f"{previos} envíos de '{tipo}' ya se habían completado en una ejecución anterior ({run_id}).")
+    return ids_sent, ids_error
+
+def enviados(collection, run_id, tipo):
+    """Resultado de los envíos ya completados de una ejecución y tipo: {chat_id: result}."""
+    return {
+        trabajo["chat_id"]: trabajo.get("result") or {}
+        for trabajo in collection.find({"run_id": run_id, "tipo": tipo, "status": "sent"}, {"chat_id": 1, "result": 1})
+    }
+
+def resumen(collection, run_id):
+    """Número de trabajos por tipo y estado de una ejecución."""
+    return {
+        f"{grupo['_id']['tipo']}:{grupo['_id']['status']}": grupo["count"]
+        for grupo in collection.aggregate([
+            {"$match": {"run_id": run_id}},
+            {"$group": {"_id": {"tipo": "$tipo", "status": "$status"}, "count": {"$sum": 1}}}
+        ])
+    }
+
+
+
+
+
+########################
+##    Funcion Main    ##
+########################
+
+
+def main():
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+    estado = subparsers.add_parser("estado", help="trabajos por tipo y estado de una ejecución")
+    estado.add_argument("run_id")
+    trabajar = subparsers.add_parser("trabajar", help="envía los trabajos pendientes de una ejecución")
+    trabajar.add_argument("run_id")
+    trabajar.add_argument("--tipo", default="message")
+    trabajar.add_argument("--workers", type=int, default=BROADCAST_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db = MongoClient(os.getenv("MONGO_URI"))[os.getenv("MONGO_DB")]
+    collection = db[os.getenv("MONGO_COLLECTION_OUTBOX", "radar_outbox")]
+
+    if args.accion == "trabajar":
+        recuperar_expirados(collection, args.run_id, args.tipo)
+        # Solo los trabajos con payload se pueden enviar desde otro proceso (las subidas de imagen no)
+        procesados = procesar(
+            collection, {"run_id": args.run_id, "tipo": args.tipo, "payload": {"$ne": None}},
+            _peticion_desde_payload,
+            workers=args.workers
+        )
+        logging.info(f"{procesados} trabajos procesados.")
+
+    print(json.dumps(resumen(collection, args.run_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
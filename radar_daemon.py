@@ -0,0 +1,230 @@
+"""
+Modo daemon: un único proceso de larga duración en lugar de las ejecuciones diarias del cron.
+
+Mantiene abiertos el MongoClient, el pool de conexiones HTTP y (opcionalmente) un navegador
+caliente. Recibe las interacciones del bot de forma continua, por long polling o por webhook, y
+comprueba los radares según un horario configurable con jitter.
+
+Variables de entorno (además de las de los dos scripts):
+    RADAR_SCHEDULE          Horas locales de comprobación, p. ej. "06:50,14:00" (por defecto "06:50")
+    RADAR_INTERVAL_MINUTES  Si se define, comprueba cada N minutos en lugar de seguir RADAR_SCHEDULE
+    RADAR_JITTER_SECONDS    Retraso aleatorio máximo añadido a cada comprobación (por defecto 120)
+    DAEMON_POLL_TIMEOUT     Espera del long polling de getUpdates en segundos (por defecto 30)
+    WEBHOOK_PORT            Si se define, recibe los updates por webhook en este puerto
+    WEBHOOK_URL             URL pública que se registra con setWebhook (opcional)
+    WEBHOOK_SECRET          Token secreto que Telegram envía en cada petición del webhook (opcional)
+    CHROME_PERSISTENTE      "1" para reutilizar el mismo navegador entre comprobaciones (por defecto)
+
+Uso:
+    python radar_daemon.py
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from driver_factory import cerrar_driver_persistente
+from telegram_client import obtener_cliente
+from datetime import datetime, timedelta, time
+from config import contexto
+import bot_interactions_updater as updater
+import telegram_radar_notifier as notifier
+import threading
+import logging
+import random
+import signal
+import queue
+import json
+import pytz
+import os
+
+RADAR_SCHEDULE = os.getenv("RADAR_SCHEDULE", "06:50")
+RADAR_INTERVAL_MINUTES = os.getenv("RADAR_INTERVAL_MINUTES")
+RADAR_JITTER_SECONDS = int(os.getenv("RADAR_JITTER_SECONDS", "120"))
+DAEMON_POLL_TIMEOUT = int(os.getenv("DAEMON_POLL_TIMEOUT", "30"))
+WEBHOOK_PORT = os.getenv("WEBHOOK_PORT")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+CHROME_PERSISTENTE = os.getenv("CHROME_PERSISTENTE", "1") == "1"
+
+# Señal de parada compartida por todos los hilos
+detener = threading.Event()
+
+# Updates recibidos por webhook pendientes de procesar
+cola_updates = queue.Queue()
+
+# Pausa tras un error antes de volver a intentarlo
+PAUSA_ERROR = 5
+
+
+
+
+
+###############################
+##   Recursos compartidos    ##
+###############################
+
+
+def compartir_recursos():
+    """Abre al arrancar el MongoClient (compartido por los dos módulos a través de `config`) y el pool HTTP."""
+    # En el daemon no compensa crearlos bajo demanda: el primer chequeo no paga la conexión
+    contexto.client
+    obtener_cliente().abrir()
+
+def llamar_api(metodo, **params):
+    """Llama a un método de la API de Telegram y devuelve el JSON de la respuesta."""
+    return obtener_cliente().llamar(metodo, **params)
+
+
+
+
+
+################################
+##   Recepción de updates     ##
+################################
+
+
+def bucle_long_polling():
+    """Sincroniza las interacciones de forma continua con long polling de getUpdates."""
+    # getUpdates no funciona si hay un webhook registrado
+    llamar_api("deleteWebhook")
+    logging.info(f"Escuchando updates por long polling (timeout {DAEMON_POLL_TIMEOUT}s).")
+
+    while not detener.is_set():
+        try:
+            updater.sincronizar_interacciones(timeout=DAEMON_POLL_TIMEOUT)
+        except Exception as e:
+            logging.error(f"Error en la sincronización de interacciones: {e}")
+            detener.wait(PAUSA_ERROR)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Recibe los updates que Telegram envía al webhook y los encola."""
+
+    def do_POST(self):
+        if WEBHOOK_SECRET and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            self.send_response(403)
+            self.end_headers()
+            return
+
+        try:
+            longitud = int(self.headers.get("Content-Length", 0))
+            cola_updates.put(json.loads(self.rfile.read(longitud)))
+            self.send_response(200)
+        except ValueError:
+            self.send_response(400)
+        self.end_headers()
+
+    def log_message(self, formato, *args):
+        logging.debug(formato, *args)
+
+
+def procesar_cola_webhook():
+    """Procesa los updates del webhook en pequeños lotes a medida que llegan."""
+    while not detener.is_set():
+        try:
+            interacciones = [cola_updates.get(timeout=1)]
+        except queue.Empty:
+            continue
+
+        # Agrupar lo que haya llegado mientras tanto
+        while len(interacciones) < updater.GET_UPDATES_LIMIT:
+            try:
+                interacciones.append(cola_updates.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            updater.procesar_interacciones(interacciones)
+        except Exception as e:
+            logging.error(f"Error al procesar los updates del webhook: {e}")
+
+def iniciar_webhook():
+    """Arranca el servidor del webhook y, si hay URL pública, la registra en Telegram."""
+    servidor = ThreadingHTTPServer(("0.0.0.0", int(WEBHOOK_PORT)), WebhookHandler)
+    threading.Thread(target=servidor.serve_forever, name="webhook", daemon=True).start()
+    threading.Thread(target=procesar_cola_webhook, name="webhook-worker", daemon=True).start()
+
+    if WEBHOOK_URL:
+        params = {"url": WEBHOOK_URL, "allowed_updates": json.dumps(["message", "edited_message", "my_chat_member"])}
+        if WEBHOOK_SECRET:
+            params["secret_token"] = WEBHOOK_SECRET
+        logging.info(f"Registro del webhook: {llamar_api('setWebhook', **params)}")
+
+    logging.info(f"Escuchando updates por webhook en el puerto {WEBHOOK_PORT}.")
+    return servidor
+
+
+
+
+
+###############################
+##   Planificación radares   ##
+###############################
+
+
+def proxima_ejecucion(ahora, zona):
+    """Calcula la próxima comprobación de radares (con jitter) a partir de `ahora` (en hora local)."""
+    if RADAR_INTERVAL_MINUTES:
+        siguiente = ahora + timedelta(minutes=float(RADAR_INTERVAL_MINUTES))
+    else:
+        candidatas = []
+        for hora in RADAR_SCHEDULE.split(","):
+            horas, minutos = (int(parte) for parte in hora.strip().split(":"))
+            for dias in (0, 1):
+                # localize respeta los cambios de horario de verano
+                candidata = zona.localize(datetime.combine(ahora.date() + timedelta(days=dias), time(horas, minutos)))
+                if candidata > ahora:
+                    candidatas.append(candidata)
+                    break
+        siguiente = min(candidatas)
+
+    return siguiente + timedelta(seconds=random.uniform(0, RADAR_JITTER_SECONDS))
+
+def bucle_radares():
+    """Ejecuta la comprobación de radares y el envío según el horario configurado."""
+    zona = pytz.timezone(notifier.ZONA_HORARIA)
+
+    while not detener.is_set():
+        siguiente = proxima_ejecucion(datetime.now(zona), zona)
+        logging.info(f"Próxima comprobación de radares: {siguiente.isoformat()}")
+
+        if detener.wait((siguiente - datetime.now(zona)).total_seconds()):
+            break
+
+        try:
+            notifier.main(persistente=CHROME_PERSISTENTE)
+        except Exception as e:
+            logging.error(f"Error en la comprobación de radares: {e}")
+
+
+
+
+
+########################
+##    Funcion Main    ##
+########################
+
+
+def main():
+    """Arranca la recepción de updates y la planificación de radares hasta recibir SIGINT/SIGTERM."""
+    signal.signal(signal.SIGTERM, lambda *args: detener.set())
+    signal.signal(signal.SIGINT, lambda *args: detener.set())
+
+    compartir_recursos()
+
+    servidor = None
+    if WEBHOOK_PORT:
+        servidor = iniciar_webhook()
+    else:
+        threading.Thread(target=bucle_long_polling, name="long-polling", daemon=True).start()
+
+    try:
+        bucle_radares()
+    finally:
+        detener.set()
+        if servidor:
+            servidor.shutdown()
+        cerrar_driver_persistente()
+        contexto.cerrar()
+        logging.info("Daemon detenido.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+from bs4 import BeautifulSoup, SoupStrainer
+import requests
+import hashlib
+import logging
+
+# Textos de la página que indican el estado de los radares
+TEXTO_SIN_RADARES = "No hay ninguna ubicación planificada para hoy."
+TEXTO_CON_RADARES = "el radar móvil estará operando en las siguientes ubicaciones"
+
+# Tiempo máximo de espera de la descarga de la página (conexión, lectura)
+TIMEOUT_DESCARGA = (5, 20)
+
+
+def _texto(elemento):
+    """Devuelve el texto de un elemento con los espacios normalizados (como `.text` en Selenium)."""
+    return " ".join(elemento.get_text(" ").split())
+
+def parsear_radares(html):
+    """
+    Extrae las ubicaciones de los radares del HTML de la página.
+
+    Devuelve la lista de ubicaciones, una lista vacía si no hay radares planificados para hoy
+    o None si el estado de los radares es desconocido.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    for elemento in soup.find_all(class_="span12"):
+        parrafos = elemento.find_all("p")
+
+        for i, parrafo in enumerate(parrafos):
+            texto_parrafo = _texto(parrafo)
+
+            # Caso en que no hay radares para hoy
+            if TEXTO_SIN_RADARES in texto_parrafo:
+                return []
+
+            # Caso en que hay radares planificados para hoy (las ubicaciones están en el párrafo siguiente)
+            elif TEXTO_CON_RADARES in texto_parrafo and i + 1 < len(parrafos):
+                return [_texto(span) for span in parrafos[i + 1].find_all(class_="label")]
+
+    return None
+
+def huella_pagina(html):
+    """
+    Hash del texto de las secciones `span12`, las que contienen el estado de los radares.
+
+    El resto de la página (menús, tokens, fechas de generación) puede cambiar en cada descarga
+    sin que cambien los radares. Si la página no trae esas secciones en el HTML (se rellenan con
+    JavaScript), se usa el hash de la página completa.
+    """
+    soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(class_="span12"))
+    texto = "\n".join(_texto(elemento) for elemento in soup.find_all(class_="span12"))
+    contenido = texto.encode("utf-8") if texto else (html if isinstance(html, bytes) else html.encode("utf-8"))
+    return hashlib.sha256(contenido).hexdigest()
+
+def descargar_pagina(url, session=None, timeout=TIMEOUT_DESCARGA):
+    """Descarga el HTML de la página de radares sin navegador (en bytes, BeautifulSoup detecta la codificación)."""
+    response = (session or requests).get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+def descargar_pagina_condicional(url, etag=None, last_modified=None, session=None, timeout=TIMEOUT_DESCARGA):
+    """
+    Descarga la página solo si ha cambiado (If-None-Match / If-Modified-Since).
+
+    Devuelve la respuesta: status 304 y sin contenido si el servidor confirma que no ha cambiado.
+    """
+    cabeceras = {}
+    if etag:
+        cabeceras["If-None-Match"] = etag
+    if last_modified:
+        cabeceras["If-Modified-Since"] = last_modified
+    response = (session or requests).get(url, headers=cabeceras, timeout=timeout)
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
@@ -0,0 +1,185 @@
+"""
+Fuentes de radares: cada municipio que publica una página de radares es una `FuenteRadar`.
+
+La configuración se lee de RADAR_SOURCES, una lista JSON de fuentes, por ejemplo:
+    [{"nombre": "Donostia", "url": "https://...", "tipo": "html", "timeout": 90},
+     {"nombre": "Errenteria", "url": "https://...", "difusion_general": false}]
+
+Si no se define, se usa una única fuente con DONOSTI_RADAR_WEB. Los usuarios sin suscripciones
+reciben los avisos de las fuentes con `difusion_general` (por defecto, solo la primera); los
+suscritos reciben los de cualquier fuente en la que aparezcan sus ubicaciones.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from abc import ABC, abstractmethod
+from radar_parser import descargar_pagina, descargar_pagina_condicional, parsear_radares
+from urllib.parse import urlparse
+import threading
+import logging
+import json
+import time
+import os
+
+RADAR_SOURCES = os.getenv("RADAR_SOURCES")
+# Fuentes que se comprueban a la vez y, de ellas, cuántas como máximo contra un mismo host
+RADAR_SOURCES_WORKERS = int(os.getenv("RADAR_SOURCES_WORKERS", "4"))
+RADAR_SOURCES_POR_HOST = int(os.getenv("RADAR_SOURCES_POR_HOST", "1"))
+# Tiempo máximo por defecto para comprobar una fuente (segundos)
+RADAR_SOURCE_TIMEOUT = float(os.getenv("RADAR_SOURCE_TIMEOUT", "120"))
+
+
+class FuenteRadar(ABC):
+    """
+    Interfaz de una fuente de radares.
+
+    `comprobar()` devuelve la lista de ubicaciones, una lista vacía si no hay radares o None si
+    no se puede determinar sin navegador; `parsear(html)` interpreta la página ya renderizada.
+    Las fuentes con `soporta_condicional` implementan además `descargar(etag, last_modified)`,
+    una petición condicional de la página; el resto se comprueban enteras en cada ejecución.
+    """
+
+    tipo = None
+    soporta_condicional = False
+
+    def __init__(self, nombre, url, timeout=RADAR_SOURCE_TIMEOUT, difusion_general=True, **opciones):
+        self.nombre = nombre
+        self.url = url
+        self.timeout = float(timeout)
+        self.difusion_general = difusion_general
+        self.opciones = opciones
+
+    @property
+    def host(self):
+        return urlparse(self.url).hostname or ""
+
+    @abstractmethod
+    def comprobar(self):
+        pass
+
+    @abstractmethod
+    def parsear(self, html):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.nombre!r}, {self.url!r})"
+
+
+class FuenteHTML(FuenteRadar):
+    """Página con el formato de la de Donostia: párrafos de `span12` con el estado y la lista de ubicaciones."""
+
+    tipo = "html"
+    soporta_condicional = True
+
+    def comprobar(self):
+        return self.parsear(descargar_pagina(self.url, timeout=min(self.timeout, 30)))
+
+    def parsear(self, html):
+        return parsear_radares(html)
+
+    def descargar(self, etag=None, last_modified=None):
+        return descargar_pagina_condicional(self.url, etag, last_modified, timeout=min(self.timeout, 30))
+
+
+# Tipos de fuente disponibles (clave `tipo` de RADAR_SOURCES)
+TIPOS_FUENTE = {FuenteHTML.tipo: FuenteHTML}
+
+
+def crear_fuente(config):
+    """Crea una fuente a partir de su configuración (diccionario de RADAR_SOURCES)."""
+    config = dict(config)
+    tipo = config.pop("tipo", FuenteHTML.tipo)
+    if tipo not in TIPOS_FUENTE:
+        raise ValueError(f"Tipo de fuente de radares desconocido: {tipo}")
+    return TIPOS_FUENTE[tipo](**config)
+
+def como_fuente(fuente):
+    """Acepta una fuente o una URL (se interpreta como página HTML)."""
+    if isinstance(fuente, FuenteRadar):
+        return fuente
+    return FuenteHTML(urlparse(fuente).hostname or fuente, fuente)
+
+def cargar_fuentes(configuracion=RADAR_SOURCES, url_por_defecto=None, **opciones_por_defecto):
+    """Devuelve las fuentes configuradas en RADAR_SOURCES o, si no hay, la de `url_por_defecto` (con `opciones_por_defecto`)."""
+    if not configuracion:
+        return [FuenteHTML("Donostia", url_por_defecto, **opciones_por_defecto)]
+
+    fuentes = []
+    for posicion, config in enumerate(json.loads(configuracion)):
+        # Por defecto solo la primera fuente llega a los usuarios sin suscripciones
+        config.setdefault("difusion_general", posicion == 0)
+        fuentes.append(crear_fuente(config))
+    return fuentes
+
+
+
+
+
+###############################
+##   Ejecución concurrente   ##
+###############################
+
+
+def ejecutar_fuentes(fuentes, escanear, entregar, workers=RADAR_SOURCES_WORKERS, por_host=RADAR_SOURCES_POR_HOST):
+    """
+    Comprueba las fuentes en paralelo y entrega cada una en cuanto termina.
+
+    `escanear(fuente)` se ejecuta con como mucho `por_host` fuentes simultáneas por host y con
+    el límite `fuente.timeout` desde que empieza; `entregar(fuente, resultado)` se lanza en
+    cuanto la fuente termina, sin esperar a las demás (no se llama si `escanear` devuelve None).
+    Una fuente que falla o supera su tiempo no retrasa al resto. `escanear` debe acotar también
+    sus propias esperas (peticiones HTTP y órdenes al navegador) por `fuente.timeout`: el hilo de
+    una fuente abandonada no se puede interrumpir y solo así termina. Devuelve un diccionario
+    nombre -> excepción con las fuentes fallidas.
+    """
+    semaforos = {host: threading.Semaphore(por_host) for host in {fuente.host for fuente in fuentes}}
+    inicios = {}
+    errores = {}
+
+    def _escanear(fuente):
+        with semaforos[fuente.host]:
+            inicios[fuente.nombre] = time.monotonic()
+            return escanear(fuente)
+
+    escaneo = ThreadPoolExecutor(max_workers=max(1, min(workers, len(fuentes))), thread_name_prefix="fuente")
+    entrega = ThreadPoolExecutor(max_workers=max(1, len(fuentes)), thread_name_prefix="entrega")
+    pendientes = {escaneo.submit(_escanear, fuente): fuente for fuente in fuentes}
+    entregas = {}
+
+    try:
+        while pendientes:
+            # Esperar como mucho hasta el primer límite de tiempo de las fuentes ya empezadas (las que
+            # esperan turno de su host se revisan cada segundo)
+            ahora = time.monotonic()
+            limites = [inicios[f.nombre] + f.timeout - ahora for f in pendientes.values() if f.nombre in inicios]
+            espera = max(0, min(limites)) if len(limites) == len(pendientes) else min([1.0] + limites)
+            hechos, _ = wait(pendientes, timeout=max(0, espera), return_when=FIRST_COMPLETED)
+
+            for futuro in hechos:
+                fuente = pendientes.pop(futuro)
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    logging.error(f"Error al comprobar la fuente {fuente.nombre}: {e}")
+                    errores[fuente.nombre] = e
+                    continue
+                if resultado is not None:
+                    entregas[entrega.submit(entregar, fuente, resultado)] = fuente
+
+            # Las fuentes que superan su tiempo se abandonan (su hilo termina al agotar sus propios timeouts)
+            ahora = time.monotonic()
+            for futuro, fuente in list(pendientes.items()):
+                if fuente.nombre in inicios and ahora - inicios[fuente.nombre] > fuente.timeout:
+                    logging.error(f"La fuente {fuente.nombre} ha superado su tiempo máximo ({fuente.timeout}s).")
+                    errores[fuente.nombre] = TimeoutError(f"{fuente.nombre}: más de {fuente.timeout}s")
+                    del pendientes[futuro]
+
+        for futuro, fuente in entregas.items():
+            try:
+                futuro.result()
+            except Exception as e:
+                logging.error(f"Error al enviar los avisos de la fuente {fuente.nombre}: {e}")
+                errores[fuente.nombre] = e
+    finally:
+        escaneo.shutdown(wait=False, cancel_futures=True)
+        entrega.shutdown(wait=True)
+
+    return errores
@@ -0,0 +1,281 @@
+"""
+Almacenamiento y consulta del histórico de ejecuciones del notificador.
+
+Cada ejecución guarda un documento en la colección de reports (colección time-series de MongoDB,
+con `timestamp` como fecha real y `meta` como metaField) y el resultado de cada usuario en una
+colección de entregas aparte, compacta e indexada por chat_id y fecha.
+
+Una colección existente no se convierte en time-series: los reports del formato antiguo
+(`scrapping_time` como texto) se copian a la colección nueva con `migrar`, que se puede repetir
+sin duplicar reports.
+
+Uso de la CLI (usa MONGO_URI, MONGO_DB, MONGO_COLLECTION_REPORTS y MONGO_COLLECTION_DELIVERIES):
+    python reports.py frecuencia [--desde 2026-01-01] [--hasta 2026-12-31]
+    python reports.py fallos [--desde 2026-01-01] [--minimo 5] [--limite 20]
+    python reports.py ejecuciones [--dias 30]
+    python reports.py migrar --origen <colección antigua>
+"""
+from pymongo import ASCENDING, DESCENDING, InsertOne
+import argparse
+import datetime
+import logging
+import json
+import os
+
+# Colección de reports por defecto (distinta de la del formato antiguo, que no era time-series)
+REPORTS_COLLECTION_POR_DEFECTO = "radar_reports"
+# Días que se conservan las entregas por usuario (índice TTL); 0 para no caducarlas
+DELIVERIES_TTL_DIAS = int(os.getenv("DELIVERIES_TTL_DIAS", "180"))
+# Documentos por lote al guardar las entregas
+DELIVERIES_BATCH_SIZE = int(os.getenv("DELIVERIES_BATCH_SIZE", "5000"))
+
+# Colecciones ya preparadas en este proceso
+_colecciones_creadas = set()
+
+
+
+
+
+###############################
+##   Creación de colecciones ##
+###############################
+
+
+def crear_coleccion_reports(collection):
+    """Crea la colección de reports como time-series (si aún no existe) y su índice por fecha."""
+    db = collection.database
+    if (db.name, collection.name) in _colecciones_creadas:
+        return
+
+    if collection.name not in db.list_collection_names():
+        try:
+            db.create_collection(
+                collection.name,
+                timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "hours"}
+            )
+            logging.info(f"Colección time-series '{collection.name}' creada.")
+        except Exception as e:
+            # Servidores anteriores a MongoDB 5.0: colección normal con índice por fecha
+            logging.warning(f"No se pudo crear la colección time-series '{collection.name}', se usará una normal: {e}")
+    elif "timeseries" not in collection.options():
+        # Probablemente la colección del formato antiguo: los reports nuevos se mezclarían con los antiguos
+        logging.warning(
+            f"La colección de reports '{collection.name}' ya existe y no es time-series; los reports se guardarán "
+            f"en una colección normal. Usa otra colección (por defecto '{REPORTS_COLLECTION_POR_DEFECTO}') y "
+            f"copia los antiguos con `python reports.py migrar --origen {collection.name}`."
+        )
+
+    collection.create_index([("meta.has_radar", ASCENDING), ("timestamp", ASCENDING)])
+    _colecciones_creadas.add((db.name, collection.name))
+
+def crear_coleccion_entregas(collection):
+    """Crea los índices de la colección de entregas (por usuario y fecha, por ejecución y TTL)."""
+    db = collection.database
+    if (db.name, collection.name) in _colecciones_creadas:
+        return
+
+    collection.create_index([("chat_id", ASCENDING), ("timestamp", DESCENDING)])
+    collection.create_index("run_id")
+    if DELIVERIES_TTL_DIAS:
+        collection.create_index("timestamp", expireAfterSeconds=DELIVERIES_TTL_DIAS * 24 * 3600)
+    else:
+        collection.create_index("timestamp")
+    _colecciones_creadas.add((db.name, collection.name))
+
+
+
+
+
+###############################
+##   Escritura de reports    ##
+###############################
+
+
+def guardar_report(collection_reports, collection_entregas, documento, entregas=None):
+    """
+    Guarda el report de una ejecución y, por separado, el resultado de cada usuario.
+
+    `documento` debe incluir `timestamp` (datetime) y `meta`. `entregas` es un diccionario
+    chat_id -> campos de la entrega (estado del mensaje y de la imagen, reintentos, latencia).
+    Devuelve el identificador del report, que se guarda como `run_id` en cada entrega.
+    """
+    crear_coleccion_reports(collection_reports)
+    run_id = collection_reports.insert_one(documento).inserted_id
+
+    if entregas:
+        crear_coleccion_entregas(collection_entregas)
+        lote = []
+        for chat_id, entrega in entregas.items():
+            lote.append(InsertOne({"run_id": run_id, "timestamp": documento["timestamp"], "chat_id": chat_id, **entrega}))
+            if len(lote) >= DELIVERIES_BATCH_SIZE:
+                collection_entregas.bulk_write(lote, ordered=False)
+                lote = []
+        if lote:
+            collection_entregas.bulk_write(lote, ordered=False)
+
+    return run_id
+
+def migrar_reports(collection_origen, collection_reports, collection_entregas):
+    """
+    Copia los reports antiguos (scrapping_time como texto e ids en arrays) al nuevo formato.
+
+    Los reports ya migrados (`migrated_from`) se omiten, así que se puede repetir si se interrumpe.
+    Las entregas por usuario solo se copian si son más recientes que DELIVERIES_TTL_DIAS: las más
+    antiguas las borraría el índice TTL nada más insertarlas (el report conserva sus totales).
+    """
+    if collection_origen.full_name == collection_reports.full_name:
+        raise ValueError(f"La colección de origen y la de reports son la misma ('{collection_origen.name}').")
+
+    ya_migrados = set(collection_reports.distinct("migrated_from", {"migrated_from": {"$exists": True}}))
+    limite_entregas = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=DELIVERIES_TTL_DIAS)
+    migrados = 0
+    for antiguo in collection_origen.find({"scrapping_time": {"$type": "string"}}):
+        if antiguo["_id"] in ya_migrados:
+            continue
+        timestamp = datetime.datetime.fromisoformat(antiguo["scrapping_time"])
+        ids_sent = antiguo.get("ids_sent", [])
+        ids_error = antiguo.get("ids_error", [])
+
+        documento = {
+            "timestamp": timestamp,
+            "meta": {"has_radar": antiguo.get("has_radar", False)},
+            "locations": antiguo.get("locations"),
+            "message_sent": antiguo.get("message_sent", ""),
+            "counts": {"recipients": len(ids_sent) + len(ids_error), "sent": len(ids_sent), "error": len(ids_error)},
+            "migrated_from": antiguo["_id"],
+        }
+        entregas = {chat_id: {"ok": True} for chat_id in ids_sent}
+        entregas.update({chat_id: {"ok": False} for chat_id in ids_error})
+        # Las fechas sin zona horaria de MongoDB son UTC
+        if DELIVERIES_TTL_DIAS and (timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=datetime.timezone.utc)) < limite_entregas:
+            entregas = None
+
+        guardar_report(collection_reports, collection_entregas, documento, entregas)
+        migrados += 1
+
+    logging.info(f"Migrados {migrados} reports desde '{collection_origen.name}'.")
+    return migrados
+
+
+
+
+
+###############################
+##   Consultas de histórico  ##
+###############################
+
+
+def _filtro_fechas(desde=None, hasta=None):
+    filtro = {}
+    if desde:
+        filtro["$gte"] = desde
+    if hasta:
+        filtro["$lt"] = hasta
+    return {"timestamp": filtro} if filtro else {}
+
+def frecuencia_radares(collection_reports, desde=None, hasta=None):
+    """Número de días con radar por ubicación y mes: [{"location", "month", "days"}], de más a menos frecuente."""
+    pipeline = [
+        {"$match": {"meta.has_radar": True, **_filtro_fechas(desde, hasta)}},
+        {"$unwind": "$locations"},
+        # Una ubicación cuenta una vez por día aunque haya varias ejecuciones
+        {"$group": {"_id": {
+            "location": "$locations",
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+            "month": {"$dateToString": {"format": "%Y-%m", "date": "$timestamp"}},
+        }}},
+        {"$group": {"_id": {"location": "$_id.location", "month": "$_id.month"}, "days": {"$sum": 1}}},
+        {"$sort": {"_id.month": 1, "days": -1, "_id.location": 1}},
+        {"$project": {"_id": 0, "location": "$_id.location", "month": "$_id.month", "days": 1}},
+    ]
+    return list(collection_reports.aggregate(pipeline))
+
+def tasa_fallos_usuarios(collection_entregas, desde=None, minimo_envios=1, limite=20):
+    """Usuarios con mayor proporción de entregas fallidas: [{"chat_id", "deliveries", "failed", "failure_rate"}]."""
+    pipeline = [
+        {"$match": _filtro_fechas(desde)},
+        {"$group": {
+            "_id": "$chat_id",
+            "deliveries": {"$sum": 1},
+            "failed": {"$sum": {"$cond": ["$ok", 0, 1]}},
+            "last_failure": {"$max": {"$cond": ["$ok", None, "$timestamp"]}},
+        }},
+        {"$match": {"deliveries": {"$gte": minimo_envios}, "failed": {"$gt": 0}}},
+        {"$addFields": {"failure_rate": {"$divide": ["$failed", "$deliveries"]}}},
+        {"$sort": {"failure_rate": -1, "failed": -1}},
+        {"$limit": limite},
+        {"$project": {"_id": 0, "chat_id": "$_id", "deliveries": 1, "failed": 1, "failure_rate": 1, "last_failure": 1}},
+    ]
+    return list(collection_entregas.aggregate(pipeline))
+
+def resumen_ejecuciones(collection_reports, dias=30):
+    """Resumen diario de las ejecuciones: número, días con radar, envíos, errores y duración media."""
+    desde = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=dias)
+    pipeline = [
+        {"$match": _filtro_fechas(desde)},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+            "runs": {"$sum": 1},
+            "with_radar": {"$sum": {"$cond": ["$meta.has_radar", 1, 0]}},
+            "sent": {"$sum": "$counts.sent"},
+            "error": {"$sum": "$counts.error"},
+            "avg_seconds": {"$avg": "$metrics.stages.main.total"},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "day": "$_id", "runs": 1, "with_radar": 1, "sent": 1, "error": 1, "avg_seconds": 1}},
+    ]
+    return list(collection_reports.aggregate(pipeline))
+
+
+
+
+
+########################
+##    Funcion Main    ##
+########################
+
+
+def _fecha(texto):
+    return datetime.datetime.fromisoformat(texto).replace(tzinfo=datetime.timezone.utc)
+
+def main():
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="consulta", required=True)
+
+    frecuencia = subparsers.add_parser("frecuencia", help="días con radar por ubicación y mes")
+    frecuencia.add_argument("--desde", type=_fecha)
+    frecuencia.add_argument("--hasta", type=_fecha)
+
+    fallos = subparsers.add_parser("fallos", help="usuarios con mayor tasa de entregas fallidas")
+    fallos.add_argument("--desde", type=_fecha)
+    fallos.add_argument("--minimo", type=int, default=1, help="entregas mínimas para aparecer")
+    fallos.add_argument("--limite", type=int, default=20)
+
+    ejecuciones = subparsers.add_parser("ejecuciones", help="resumen diario de las ejecuciones")
+    ejecuciones.add_argument("--dias", type=int, default=30)
+
+    migrar = subparsers.add_parser("migrar", help="convierte los reports del formato antiguo")
+    migrar.add_argument("--origen", required=True, help="colección con los reports antiguos")
+
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI"))[os.getenv("MONGO_DB")]
+    collection_reports = db[os.getenv("MONGO_COLLECTION_REPORTS", REPORTS_COLLECTION_POR_DEFECTO)]
+    collection_entregas = db[os.getenv("MONGO_COLLECTION_DELIVERIES", "radar_deliveries")]
+
+    if args.consulta == "frecuencia":
+        resultado = frecuencia_radares(collection_reports, args.desde, args.hasta)
+    elif args.consulta == "fallos":
+        resultado = tasa_fallos_usuarios(collection_entregas, args.desde, args.minimo, args.limite)
+    elif args.consulta == "ejecuciones":
+        resultado = resumen_ejecuciones(collection_reports, args.dias)
+    else:
+        resultado = {"migrated": migrar_reports(db[args.origen], collection_reports, collection_entregas)}
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Instantáneas de la página de cada fuente para no repetir el trabajo cuando no ha cambiado.
+
+Por cada fuente se guarda la última versión comprobada: ETag y Last-Modified de la respuesta,
+hash de las secciones con el estado de los radares (`radar_parser.huella_pagina`), ubicaciones
+obtenidas y el día en que se entregaron. La siguiente comprobación hace una petición
+condicional; si el servidor responde 304 o el hash coincide, la página no ha cambiado:
+    - si ya se entregó hoy, no hay nada que hacer (comprobaciones frecuentes casi gratuitas)
+    - si se entregó otro día, se reutilizan las ubicaciones sin analizar la página ni abrir el navegador
+"""
+from radar_parser import huella_pagina
+import datetime
+import logging
+
+
+def obtener(collection, fuente):
+    """Devuelve la última instantánea guardada de la fuente o None."""
+    return collection.find_one({"_id": fuente})
+
+def comprobar(collection, fuente):
+    """
+    Descarga la página de la fuente con una petición condicional a partir de su última instantánea.
+
+    Devuelve (instantánea anterior, html, huella). `html` es None si el servidor respondió 304;
+    `huella` es None si la fuente no admite descargas condicionales (`soporta_condicional`; se comprueba entera).
+    """
+    anterior = obtener(collection, fuente.nombre)
+    if not fuente.soporta_condicional:
+        return anterior, None, None
+
+    response = fuente.descargar(
+        anterior.get("etag") if anterior else None,
+        anterior.get("last_modified") if anterior else None
+    )
+
+    if response.status_code == 304:
+        logging.info(f"La página de {fuente.nombre} no ha cambiado (304).")
+        html, hash_contenido = None, anterior["content_hash"]
+    else:
+        html, hash_contenido = response.content, huella_pagina(response.content)
+
+    huella = {
+        "etag": response.headers.get("ETag") or (anterior or {}).get("etag"),
+        "last_modified": response.headers.get("Last-Modified") or (anterior or {}).get("last_modified"),
+        "content_hash": hash_contenido,
+    }
+    return anterior, html, huella
+
+def sin_cambios(anterior, huella):
+    """True si la página no ha cambiado desde la instantánea anterior (y sus ubicaciones se conocen)."""
+    return bool(
+        anterior and huella
+        and anterior.get("content_hash") == huella["content_hash"]
+        and anterior.get("locations") is not None
+    )
+
+def guardar(collection, fuente, huella, locations, fecha_entrega, cambiada=True):
+    """Guarda la instantánea de la fuente tras entregar sus avisos del día `fecha_entrega`."""
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    cambios = {**huella, "locations": locations, "delivered_on": fecha_entrega, "checked_at": ahora}
+    if cambiada:
+        cambios["changed_at"] = ahora
+    collection.update_one({"_id": fuente}, {"$set": cambios}, upsert=True)
@@ -0,0 +1,177 @@
+from pymongo import ASCENDING
+import unicodedata
+import datetime
+import logging
+import re
+import os
+
+# Número máximo de ubicaciones a las que se puede suscribir un usuario
+MAX_SUSCRIPCIONES = int(os.getenv("MAX_SUSCRIPCIONES", "20"))
+
+# Palabras que por sí solas no identifican una ubicación (tipos de vía y artículos, en castellano y euskera)
+PALABRAS_VACIAS = {
+    "de", "del", "la", "el", "los", "las", "y", "en", "a",
+    "calle", "c", "avenida", "av", "avda", "paseo", "pso", "plaza", "pza", "ronda", "carretera", "ctra",
+    "camino", "barrio", "glorieta", "rotonda", "puente", "alameda",
+    "kalea", "k", "etorbidea", "pasealekua", "enparantza", "bidea", "auzoa", "zubia",
+}
+
+# Comandos del bot y textos de respuesta
+COMANDO_SUSCRIBIR = "/suscribir"
+COMANDO_DESUSCRIBIR = "/desuscribir"
+COMANDO_ZONAS = "/zonas"
+AYUDA_SUSCRIBIR = (
+    "Indica la calle o zona, por ejemplo:\n`/suscribir Avenida de Tolosa`\n\n"
+    "Sin suscripciones recibirás los avisos de todas las ubicaciones."
+)
+
+
+def normalizar_ubicacion(texto):
+    """Minúsculas, sin tildes ni signos de puntuación y con los espacios simplificados ('Av. de Tolosa' -> 'av de tolosa')."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"\w+", texto))
+
+def clave_suscripcion(texto):
+    """Clave con la que se guarda una suscripción, o None si el texto no identifica ninguna ubicación."""
+    clave = normalizar_ubicacion(texto)
+    if not clave or all(palabra in PALABRAS_VACIAS for palabra in clave.split()):
+        return None
+    return clave
+
+def claves_ubicacion(ubicacion):
+    """
+    Claves del índice invertido que corresponden a una ubicación: todas sus secuencias de palabras.
+
+    Así 'Avenida de Tolosa' coincide con las suscripciones 'avenida de tolosa', 'de tolosa' y
+    'tolosa', pero no con 'avenida' ni 'de' (palabras vacías).
+    """
+    palabras = normalizar_ubicacion(ubicacion).split()
+    claves = set()
+    for inicio in range(len(palabras)):
+        for fin in range(inicio + 1, len(palabras) + 1):
+            fragmento = palabras[inicio:fin]
+            if not all(palabra in PALABRAS_VACIAS for palabra in fragmento):
+                claves.add(" ".join(fragmento))
+    return claves
+
+
+
+
+
+###############################
+##   Índice de suscripciones ##
+###############################
+
+
+def crear_indices(collection_subs):
+    """Índice invertido: un documento por (clave, chat_id), consultado por clave y por usuario."""
+    collection_subs.create_index([("key", ASCENDING), ("chat_id", ASCENDING)], unique=True)
+    collection_subs.create_index("chat_id")
+
+def _marcar_suscrito(collection_chats, chat_id, collection_subs):
+    """Mantiene `has_subscriptions` en el chat: separa a quien recibe todos los avisos de quien filtra por ubicación."""
+    tiene = collection_subs.count_documents({"chat_id": chat_id}, limit=1) > 0
+    collection_chats.update_one({"chat_id": chat_id}, {"$set": {"has_subscriptions": tiene}})
+    return tiene
+
+def suscribir(collection_subs, collection_chats, chat_id, texto):
+    """Suscribe al usuario a una ubicación. Devuelve la clave guardada o None si no es válida o se supera el máximo."""
+    clave = clave_suscripcion(texto)
+    if not clave:
+        return None
+    if collection_subs.count_documents({"chat_id": chat_id}) >= MAX_SUSCRIPCIONES:
+        return None
+
+    collection_subs.update_one(
+        {"key": clave, "chat_id": chat_id},
+        {"$setOnInsert": {"label": texto.strip(), "created_at": datetime.datetime.now(datetime.timezone.utc)}},
+        upsert=True
+    )
+    _marcar_suscrito(collection_chats, chat_id, collection_subs)
+    return clave
+
+def desuscribir(collection_subs, collection_chats, chat_id, texto=None):
+    """Elimina una suscripción (o todas si no se indica ubicación). Devuelve el número eliminado."""
+    filtro = {"chat_id": chat_id}
+    if texto:
+        filtro["key"] = clave_suscripcion(texto)
+    eliminadas = collection_subs.delete_many(filtro).deleted_count
+    _marcar_suscrito(collection_chats, chat_id, collection_subs)
+    return eliminadas
+
+def zonas(collection_subs, chat_id):
+    """Ubicaciones a las que está suscrito el usuario, tal como las escribió."""
+    return [doc["label"] for doc in collection_subs.find({"chat_id": chat_id}, {"label": 1, "_id": 0}).sort("label", ASCENDING)]
+
+def suscriptores(collection_subs, locations):
+    """IDs de los usuarios suscritos a alguna de las ubicaciones: unión de las entradas del índice invertido."""
+    claves = set()
+    for location in locations or []:
+        claves |= claves_ubicacion(location)
+    if not claves:
+        return set()
+    return {doc["chat_id"] for doc in collection_subs.find({"key": {"$in": list(claves)}}, {"chat_id": 1, "_id": 0})}
+
+
+
+
+
+###############################
+##   Comandos del bot        ##
+###############################
+
+
+def _separar_comando(texto):
+    """Devuelve (comando, argumentos) de un texto como '/suscribir@MiBot Avenida de Tolosa'."""
+    partes = texto.strip().split(maxsplit=1)
+    comando = partes[0].split("@", 1)[0].lower()
+    return comando, (partes[1].strip() if len(partes) > 1 else "")
+
+def _escapar_markdown(texto):
+    """Escapa el texto del usuario para incluirlo en una respuesta con parse_mode Markdown."""
+    return re.sub(r"([_*`\[])", r"\\\1", texto)
+
+def procesar_comando(collection_subs, collection_chats, chat_id, texto):
+    """Ejecuta un comando de suscripción y devuelve el texto de respuesta (None si no es de suscripción)."""
+    comando, argumentos = _separar_comando(texto)
+    ubicacion = _escapar_markdown(argumentos)
+
+    if comando == COMANDO_SUSCRIBIR:
+        if not argumentos:
+            return AYUDA_SUSCRIBIR
+        if not suscribir(collection_subs, collection_chats, chat_id, argumentos):
+            return f"⚠️ No se ha podido añadir *{ubicacion}* (ubicación no válida o máximo de {MAX_SUSCRIPCIONES} suscripciones)."
+        return f"✅ Recibirás los avisos de radares en *{ubicacion}*."
+
+    if comando == COMANDO_DESUSCRIBIR:
+        eliminadas = desuscribir(collection_subs, collection_chats, chat_id, argumentos or None)
+        if not eliminadas:
+            return f"No estabas suscrito a *{ubicacion}*." if argumentos else "No tenías suscripciones."
+        if argumentos:
+            return f"🗑️ Ya no recibirás los avisos de *{ubicacion}*."
+        return "🗑️ Suscripciones eliminadas: volverás a recibir los avisos de todas las ubicaciones."
+
+    if comando == COMANDO_ZONAS:
+        ubicaciones = zonas(collection_subs, chat_id)
+        if not ubicaciones:
+            return "Recibes los avisos de todas las ubicaciones.\n\n" + AYUDA_SUSCRIBIR
+        return "📍 Tus ubicaciones:\n\n" + "\n".join(f"   •  *{_escapar_markdown(ubicacion)}*" for ubicacion in ubicaciones)
+
+    return None
+
+def procesar_comandos(collection_subs, collection_chats, chats):
+    """Procesa los comandos de suscripción de un lote de chats y devuelve chat_id -> respuestas."""
+    respuestas = {}
+    for chat in chats:
+        for msg in chat.get("messages", []):
+            # Las ediciones no vuelven a ejecutar el comando
+            if not msg.get("command") or "edit_date" in msg:
+                continue
+            respuesta = procesar_comando(collection_subs, collection_chats, chat["chat_id"], msg.get("text", ""))
+            if respuesta:
+                respuestas.setdefault(chat["chat_id"], []).append(respuesta)
+
+    if respuestas:
+        logging.info(f"Procesados los comandos de suscripción de {len(respuestas)} usuarios.")
+    return respuestas
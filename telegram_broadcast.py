@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+from telegram_client import obtener_cliente
+from metrics import metricas
+import threading
+import requests
+import logging
+import random
+import time
+import os
+
+# Límites de Telegram: ~30 mensajes/segundo en total y 1 mensaje/segundo por chat
+TELEGRAM_LIMITE_GLOBAL = float(os.getenv("TELEGRAM_LIMITE_GLOBAL", "30"))
+TELEGRAM_LIMITE_POR_CHAT = float(os.getenv("TELEGRAM_LIMITE_POR_CHAT", "1"))
+
+# Número de hilos que envían en paralelo y número máximo de reintentos por envío
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_MAX_REINTENTOS = int(os.getenv("BROADCAST_MAX_REINTENTOS", "5"))
+
+# Códigos HTTP que se consideran errores transitorios del servidor
+ESTADOS_TRANSITORIOS = (500, 502, 503, 504)
+
+
+
+
+
+###############################
+##   Limitadores de envío    ##
+###############################
+
+
+class TokenBucket:
+    """Cubo de tokens thread-safe: permite `tasa` operaciones por segundo con ráfagas de hasta `capacidad`."""
+
+    def __init__(self, tasa, capacidad=None):
+        self.tasa = tasa
+        self.capacidad = capacidad if capacidad is not None else max(tasa, 1)
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reponer(self, ahora):
+        """Añade los tokens generados desde la última consulta."""
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def adquirir(self):
+        """Bloquea hasta que haya un token disponible y lo consume."""
+        while True:
+            with self.lock:
+                ahora = time.monotonic()
+                self._reponer(ahora)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.tasa
+            time.sleep(espera)
+
+
+class LimitadorTelegram:
+    """Aplica el límite global del bot, el límite por chat y las pausas impuestas por Telegram (429)."""
+
+    def __init__(self, limite_global=TELEGRAM_LIMITE_GLOBAL, limite_por_chat=TELEGRAM_LIMITE_POR_CHAT):
+        self.global_bucket = TokenBucket(limite_global)
+        self.intervalo_chat = 1.0 / limite_por_chat
+        self.proximo_envio_chat = {}
+        self.pausa_hasta = 0.0
+        self.lock = threading.Lock()
+
+    def pausar(self, segundos):
+        """Detiene todos los envíos durante `segundos` (respuesta 429 con `retry_after`)."""
+        with self.lock:
+            self.pausa_hasta = max(self.pausa_hasta, time.monotonic() + segundos)
+
+    def esperar_turno(self, chat_id):
+        """Bloquea hasta que se pueda enviar a `chat_id` respetando todos los límites."""
+        # Reservar el siguiente hueco libre para este chat
+        with self.lock:
+            ahora = time.monotonic()
+            if len(self.proximo_envio_chat) > 10000:
+                # Olvidar los chats cuyo hueco ya ha pasado (evita crecer sin límite en modo daemon)
+                self.proximo_envio_chat = {c: t for c, t in self.proximo_envio_chat.items() if t > ahora}
+            turno = max(ahora, self.proximo_envio_chat.get(chat_id, 0.0))
+            self.proximo_envio_chat[chat_id] = turno + self.intervalo_chat
+
+        # Esperar al hueco del chat y a que termine una posible pausa global
+        while True:
+            with self.lock:
+                espera = max(turno, self.pausa_hasta) - time.monotonic()
+            if espera <= 0:
+                break
+            time.sleep(espera)
+
+        self.global_bucket.adquirir()
+
+
+# Limitador compartido por todas las difusiones del proceso (mensaje e imagen van al mismo chat)
+limitador_por_defecto = LimitadorTelegram()
+
+
+
+
+
+###############################
+##   Envío con reintentos    ##
+###############################
+
+
+def _retry_after(response):
+    """Devuelve los segundos de espera indicados por Telegram en una respuesta 429."""
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after", 1))
+    except ValueError:
+        return float(response.headers.get("Retry-After", 1))
+
+def enviar_con_reintentos(session, url, chat_id, data, files=None, limitador=None, max_reintentos=BROADCAST_MAX_REINTENTOS):
+    """
+    Envía una petición a la API de Telegram respetando los límites de envío.
+
+    `session` es el cliente de Telegram (`telegram_client.ClienteTelegram`) o una sesión de requests.
+
+    Reintenta las respuestas 429 tras el `retry_after` indicado y los errores 5xx o de red con
+    backoff exponencial. Devuelve la tupla (response, reintentos); response es None si nunca se
+    obtuvo respuesta del servidor.
+    """
+    limitador = limitador or limitador_por_defecto
+    response = None
+
+    for intento in range(max_reintentos + 1):
+        limitador.esperar_turno(chat_id)
+
+        # Los ficheros en memoria se rebobinan antes de cada intento
+        if files:
+            for valor in files.values():
+                valor[1].seek(0)
+
+        try:
+            response = session.post(url, data=data, files=files)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logging.warning(f"Error de red al enviar a {chat_id}: {e}. Reintentando ({intento + 1}/{max_reintentos})...")
+            response = None
+        else:
+            if response.status_code == 429:
+                espera = _retry_after(response)
+                metricas.incrementar("telegram_429")
+                logging.warning(f"Límite de Telegram alcanzado enviando a {chat_id}, esperando {espera}s.")
+                limitador.pausar(espera)
+                continue
+            if response.status_code not in ESTADOS_TRANSITORIOS:
+                return response, intento
+            logging.warning(f"Error {response.status_code} de Telegram al enviar a {chat_id}. Reintentando ({intento + 1}/{max_reintentos})...")
+
+        if intento < max_reintentos:
+            time.sleep(min(30, 2 ** intento) * (0.5 + random.random() / 2))
+
+    return response, max_reintentos
+
+
+
+
+
+###############################
+##   Difusión concurrente    ##
+###############################
+
+
+def difundir(ids_usuarios, construir_peticion, session=None, limitador=None, workers=BROADCAST_WORKERS, detalles=None):
+    """
+    Envía una petición a cada usuario en paralelo y devuelve (ids_sent, ids_error).
+
+    `construir_peticion(chat_id)` devuelve la tupla (url, data, files) de cada envío. Si se pasa
+    el diccionario `detalles`, se rellena con el estado HTTP, la latencia y los reintentos de cada
+    chat_id. Las listas devueltas conservan el orden de `ids_usuarios`.
+    """
+    ids_sent = []
+    ids_error = []
+
+    def _enviar(chat_id):
+        url, data, files = construir_peticion(chat_id)
+        inicio = time.monotonic()
+        response, reintentos = enviar_con_reintentos(session, url, chat_id, data, files, limitador)
+        return response, reintentos, time.monotonic() - inicio
+
+    session = session or obtener_cliente()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = [(chat_id, executor.submit(_enviar, chat_id)) for chat_id in ids_usuarios]
+
+        for chat_id, futuro in futuros:
+            try:
+                response, reintentos, latencia = futuro.result()
+            except Exception as e:
+                logging.error(f"Error inesperado al enviar a {chat_id}: {e}")
+                response, reintentos, latencia = None, 0, 0.0
+
+            status = response.status_code if response is not None else None
+            metricas.registrar_estado_http(status)
+            metricas.incrementar("telegram_retries", reintentos)
+            if detalles is not None:
+                detalles[chat_id] = {"status": status, "latency": latencia, "retries": reintentos, "response": response}
+
+            if status == 200:
+                ids_sent.append(chat_id)
+            else:
+                ids_error.append(chat_id)
+
+    return ids_sent, ids_error
@@ -0,0 +1,151 @@
+"""
+Cliente HTTP de la API de Telegram compartido por todo el proceso.
+
+Mantiene un pool de conexiones keep-alive dimensionado para los hilos de envío, aplica siempre
+un tiempo máximo de conexión y de lectura y reintenta con backoff los fallos de conexión (y los
+errores 5xx de las consultas GET). Los reintentos de los envíos (POST) ante 429 y 5xx los hace
+`telegram_broadcast`, que respeta los límites de Telegram; un POST nunca se repite aquí si el
+servidor pudo haberlo recibido.
+
+Con TELEGRAM_HTTP2=1 y httpx[http2] instalado, las peticiones van por HTTP/2 (una conexión
+multiplexada) en lugar de HTTP/1.1.
+"""
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import contexto
+import threading
+import requests
+import logging
+import os
+
+# Tiempos máximos de conexión y de lectura por petición (segundos)
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "30"))
+# Conexiones keep-alive del pool (al menos tantas como hilos envían a la vez)
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+# Reintentos de conexión con backoff exponencial (0.5s, 1s, 2s...)
+TELEGRAM_RETRY_TOTAL = int(os.getenv("TELEGRAM_RETRY_TOTAL", "3"))
+TELEGRAM_RETRY_BACKOFF = float(os.getenv("TELEGRAM_RETRY_BACKOFF", "0.5"))
+# HTTP/2 mediante httpx (dependencia opcional)
+TELEGRAM_HTTP2 = os.getenv("TELEGRAM_HTTP2", "0") == "1"
+
+
+class ClienteTelegram:
+    """
+    Cliente de la API de un bot con la interfaz de `requests.Session` que usa el proyecto.
+
+    `get(url, params)` y `post(url, data, files)` devuelven la respuesta (con `status_code`,
+    `json()` y `headers`) y lanzan `requests.ConnectionError` o `requests.Timeout` ante errores
+    de red, tanto con requests como con httpx. El pool se crea en la primera petición.
+
+    Sin `token` ni `api_base` se usan TELEGRAM_TOKEN y TELEGRAM_API_BASE (para usar un servidor
+    local) del entorno del contexto en el momento de crear el cliente, no al importar el módulo.
+    """
+
+    def __init__(self, token=None, api_base=None, pool=TELEGRAM_POOL_SIZE,
+                 timeout=(TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT), http2=TELEGRAM_HTTP2):
+        self.token = token or contexto.entorno.get("TELEGRAM_TOKEN")
+        self.api_base = (api_base or contexto.entorno.get("TELEGRAM_API_BASE", "https://api.telegram.org")).rstrip("/")
+        self.timeout = timeout
+        self.pool = pool
+        self.http2 = http2
+        self.session = None
+        self.cliente = None
+        self._lock = threading.Lock()
+
+    def abrir(self):
+        """Crea el pool de conexiones (si aún no existe)."""
+        if self.session is not None or self.cliente is not None:
+            return self
+        with self._lock:
+            if self.session is None and self.cliente is None:
+                self.http2 = self.http2 and self._crear_cliente_http2(self.pool)
+                if not self.http2:
+                    self.session = self._crear_sesion(self.pool)
+        return self
+
+    def url(self, metodo):
+        """URL de un método de la API del bot (p. ej. 'sendMessage')."""
+        return f"{self.api_base}/bot{self.token}/{metodo}"
+
+    def _crear_sesion(self, pool):
+        """Sesión de requests con pool keep-alive y reintentos de urllib3."""
+        reintentos = Retry(
+            total=TELEGRAM_RETRY_TOTAL,
+            backoff_factor=TELEGRAM_RETRY_BACKOFF,
+            # Los errores de lectura y de estado solo se reintentan en métodos idempotentes (GET)
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool, max_retries=reintentos)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _crear_cliente_http2(self, pool):
+        """Cliente httpx con HTTP/2; devuelve False (se usará HTTP/1.1) si httpx o h2 no están instalados."""
+        try:
+            import httpx
+            self._httpx = httpx
+            self.cliente = httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool),
+                transport=httpx.HTTPTransport(http2=True, retries=TELEGRAM_RETRY_TOTAL),
+            )
+            return True
+        except ImportError:
+            logging.warning("TELEGRAM_HTTP2 requiere httpx[http2]; se usará HTTP/1.1.")
+            return False
+
+    def _peticion_http2(self, metodo, url, timeout, **opciones):
+        """Hace la petición con httpx traduciendo sus errores de red a los de requests."""
+        if timeout is not None:
+            conexion, lectura = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            opciones["timeout"] = self._httpx.Timeout(lectura, connect=conexion)
+        try:
+            return self.cliente.request(metodo, url, **opciones)
+        except self._httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except self._httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+
+    def get(self, url, params=None, timeout=None):
+        self.abrir()
+        if self.http2:
+            return self._peticion_http2("GET", url, timeout, params=params)
+        return self.session.get(url, params=params, timeout=timeout or self.timeout)
+
+    def post(self, url, data=None, files=None, timeout=None):
+        self.abrir()
+        if self.http2:
+            return self._peticion_http2("POST", url, timeout, data=data, files=files)
+        return self.session.post(url, data=data, files=files, timeout=timeout or self.timeout)
+
+    def llamar(self, metodo, timeout=None, **params):
+        """Llama a un método de la API y devuelve el JSON de la respuesta."""
+        return self.post(self.url(metodo), data=params, timeout=timeout).json()
+
+    def cerrar(self):
+        with self._lock:
+            if self.cliente is not None:
+                self.cliente.close()
+            if self.session is not None:
+                self.session.close()
+            self.session = self.cliente = None
+
+
+# Cliente compartido por todo el proceso (mantiene las conexiones abiertas entre llamadas)
+_cliente_compartido = None
+_cliente_lock = threading.Lock()
+
+def obtener_cliente():
+    """Devuelve el cliente de Telegram compartido del proceso, creándolo (con la configuración de ese momento) la primera vez."""
+    global _cliente_compartido
+    with _cliente_lock:
+        if _cliente_compartido is None:
+            _cliente_compartido = ClienteTelegram()
+        return _cliente_compartido
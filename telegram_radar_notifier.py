@@ -1,14 +1,21 @@
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from pymongo import MongoClient
-from selenium import webdriver
+from map_renderer import renderizar_mapa, puntos_desde_geojson, normalizar_punto
+from driver_factory import obtener_driver, liberar_driver, registrar_navegacion, limitar_tiempo
+from image_pipeline import optimizar_imagen, tipo_imagen, variante
+from user_liveness import marcar_estado_usuarios
+from telegram_client import obtener_cliente
+from radar_parser import parsear_radares
+from telegram_broadcast import difundir
 from datetime import datetime
+from metrics import metricas
+from config import contexto
 from io import BytesIO
-from PIL import Image
+import message_templates
+import radar_sources
+import subscriptions
+import image_cache
+import snapshots
+import reports
+import outbox
 import traceback
 import requests
 import logging
@@ -19,33 +26,78 @@ import os
 # Configuración básica de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Opciones avanzadas de Chrome
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--window-size=1920x1080")
-
-# URL de la página a monitorear
-donosti_radar_web_url = os.getenv("DONOSTI_RADAR_WEB")
-
-# Configuración del token de tu bot y la URL de la API de Telegram
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-SEND_MESSAGE_URL = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage'
-SEND_PHOTO_URL = f'https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendPhoto'
-
-# Configuración de la conexión con MongoDB Atlas
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-
-# Seleccionar la base de datos y colecciones
-MONGO_DB = os.getenv("MONGO_DB")
-db = client[MONGO_DB]
-
-MONGO_COLLECTION_INTERACTIONS = os.getenv("MONGO_COLLECTION_INTERACTIONS")
-collection_interactions = db[MONGO_COLLECTION_INTERACTIONS]
-
-MONGO_COLLECTION_REPORTS = os.getenv("MONGO_COLLECTION_REPORTS")
-collection_reports = db[MONGO_COLLECTION_REPORTS]
+# URL de la página a monitorear: DONOSTI_RADAR_WEB al usarse (ver `url_radares`), salvo que se asigne aquí
+donosti_radar_web_url = None
+
+# Modo de generación del mapa: "screenshot" (captura del canvas) o "render" (Pillow a partir de los datos del mapa)
+MAP_RENDER_MODE = os.getenv("MAP_RENDER_MODE", "screenshot")
+# GeoJSON opcional con las ubicaciones de los radares; permite renderizar el mapa sin navegador
+MAP_FEATURES_URL = os.getenv("MAP_FEATURES_URL")
+# Tiempo máximo de espera a que el mapa termine de renderizarse
+MAP_RENDER_TIMEOUT = int(os.getenv("MAP_RENDER_TIMEOUT", "20"))
+# "1" para comparar la página con la última comprobación (petición condicional y hash) y no repetir el trabajo si no ha cambiado
+RADAR_SNAPSHOTS = os.getenv("RADAR_SNAPSHOTS", "1") == "1"
+
+# Script que localiza el objeto ol.Map de la página (OpenLayers no lo enlaza desde el DOM)
+JS_BUSCAR_MAPA = """
+function buscarMapa() {
+    for (var clave in window) {
+        try {
+            var valor = window[clave];
+            if (valor && typeof valor.getLayers === 'function' && typeof valor.getView === 'function') {
+                return valor;
+            }
+        } catch (e) {}
+    }
+    return null;
+}
+"""
+
+# Espera al evento `rendercomplete` del mapa (todas las teselas cargadas y dibujadas)
+JS_ESPERAR_RENDERIZADO = JS_BUSCAR_MAPA + """
+var terminar = arguments[arguments.length - 1];
+var mapa = buscarMapa();
+if (!mapa) { terminar(false); return; }
+mapa.once('rendercomplete', function () { terminar(true); });
+mapa.render();
+"""
+
+# Lee los puntos de las capas vectoriales del mapa (incluidas las capas agrupadas)
+JS_LEER_PUNTOS = JS_BUSCAR_MAPA + """
+var mapa = buscarMapa();
+if (!mapa) { return null; }
+var proyeccion = mapa.getView().getProjection();
+var puntos = [];
+function recorrer(capa) {
+    if (typeof capa.getLayers === 'function') { capa.getLayers().forEach(recorrer); return; }
+    var fuente = capa.getSource && capa.getSource();
+    if (!fuente || typeof fuente.getFeatures !== 'function') { return; }
+    fuente.getFeatures().forEach(function (feature) {
+        var geometria = feature.getGeometry();
+        if (!geometria || geometria.getType() !== 'Point') { return; }
+        var c = geometria.getCoordinates();
+        if (window.ol && ol.proj && ol.proj.toLonLat) { c = ol.proj.toLonLat(c, proyeccion); }
+        puntos.push({x: c[0], y: c[1], nombre: feature.get('name') || feature.get('nombre') || ''});
+    });
+}
+mapa.getLayers().forEach(recorrer);
+return puntos;
+"""
+
+# Las URLs de la API de Telegram se construyen al usarse con `obtener_cliente().url(metodo)`: el
+# token y el servidor se leen al crear el cliente (ver `telegram_client`), no al importar el script
+
+# La conexión con MongoDB Atlas y las colecciones se crean al usarse por primera vez (ver `config`)
+
+# Zona horaria de la página de radares (la fecha de "hoy" se calcula en hora local)
+ZONA_HORARIA = os.getenv("ZONA_HORARIA", "Europe/Madrid")
+
+# Documentos de destinatarios por lote del cursor
+DESTINATARIOS_BATCH_SIZE = int(os.getenv("DESTINATARIOS_BATCH_SIZE", "1000"))
+# Índices de destinatarios de versiones anteriores, sustituidos por el que cubre la consulta actual
+INDICES_DESTINATARIOS_OBSOLETOS = ("active_chat_id", "active_subscriptions_chat_id")
+
+_indices_destinatarios_creados = set()
 
 
 
@@ -56,21 +108,29 @@ collection_reports = db[MONGO_COLLECTION_REPORTS]
 ###############################
 
 
-def inicializar_driver():
-    """Inicializa y devuelve el driver de Chrome con configuraciones avanzadas."""
+def url_radares():
+    """URL de la página de radares por defecto (`donosti_radar_web_url` o DONOSTI_RADAR_WEB del entorno del contexto)."""
+    return donosti_radar_web_url or contexto.entorno.get("DONOSTI_RADAR_WEB")
+
+@metricas.cronometrar()
+def inicializar_driver(persistente=False, url=None):
+    """Inicializa y devuelve el driver de Chrome (chromedriver cacheado, carga 'eager' y recursos bloqueados)."""
     try:
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        logging.info("Driver de Chrome inicializado exitosamente en modo headless.")
+        driver = obtener_driver(url or url_radares(), persistente=persistente)
+        logging.info(f"Driver de Chrome inicializado exitosamente en modo headless: {driver.tiempos_arranque}")
         return driver
     except Exception as e:
         logging.error("Error al inicializar el driver de Chrome: %s", traceback.format_exc())
         return None
 
+@metricas.cronometrar()
 def cargar_pagina(driver, donosti_radar_web_url, max_retries=3):
     """Carga la página y reintenta en caso de fallos."""
     for attempt in range(max_retries):
         try:
+            inicio = time.perf_counter()
             driver.get(donosti_radar_web_url)
+            registrar_navegacion(driver, time.perf_counter() - inicio)
             logging.info(f"Página cargada correctamente en el intento {attempt + 1}.")
             return True
         except Exception as e:
@@ -81,18 +141,24 @@ def cargar_pagina(driver, donosti_radar_web_url, max_retries=3):
 
 def rechazar_cookies(driver):
     """Busca y cierra el aviso de cookies si está presente."""
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.common.by import By
     try:
         # Esperar y buscar el botón "Rechazar todo"
         cookies_button = driver.find_element(By.XPATH, "//button[contains(text(), 'Rechazar todo')]")
         cookies_button.click()
         logging.info("Aviso de cookies rechazado.")
-        time.sleep(1)  # Esperar a que el aviso desaparezca
+
+        # Esperar a que el aviso desaparezca
+        WebDriverWait(driver, 5).until(EC.invisibility_of_element(cookies_button))
     except Exception as e:
         logging.warning("No se encontró el aviso de cookies o no se pudo cerrar: %s", traceback.format_exc())
 
 def ocultar_elementos(driver):
     """Oculta los elementos no deseados en la página."""
-    
+    from selenium.webdriver.common.by import By
+
     try:
         # Buscar el div de las capas base y ocultarlo
         base_layer_element = driver.find_element(By.ID, "SimpleBaseLayerSelectPlugin_c")
@@ -111,64 +177,114 @@ def ocultar_elementos(driver):
         logging.error(f"Error al ocultar los elementos: {e}")
         raise # Propaga el error al `main`
 
-def comprobar_radares(driver):
-    """Verifica si hay radares móviles planificados para hoy y devuelve las ubicaciones (vacías si no hay)."""
+def _registrar_estado_radares(ubicaciones):
+    """Escribe en el log el estado de los radares obtenido de la página."""
+    if ubicaciones is None:
+        logging.warning("Estado de radares desconocido o no planificado.")
+    elif ubicaciones:
+        logging.info(f"Radares móviles encontrados: {ubicaciones}")
+    else:
+        logging.info("No hay radares móviles planificados para hoy.")
+
+@metricas.cronometrar()
+def comprobar_radares_http(fuente, html=None):
+    """Verifica los radares planificados para hoy descargando la página (fuente o URL) sin navegador, o en `html` si ya se descargó."""
     try:
-        # Obtener la fecha actual en formato 'dd/mm/yyyy'
-        fecha_actual = datetime.now().strftime("%d/%m/%Y")
+        fuente = radar_sources.como_fuente(fuente)
+        ubicaciones = fuente.comprobar() if html is None else fuente.parsear(html)
+        _registrar_estado_radares(ubicaciones)
+        return ubicaciones
+    except Exception as e:
+        logging.error("Error al comprobar los radares sin navegador: %s", traceback.format_exc())
+        raise  # Propaga el error al `main`
 
+@metricas.cronometrar()
+def comprobar_radares(driver, fuente=None):
+    """Verifica si hay radares móviles planificados para hoy y devuelve las ubicaciones (vacías si no hay)."""
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.common.by import By
+    try:
         # Esperar explícitamente a que los elementos con la clase "span12" estén presentes en el DOM
-        WebDriverWait(driver, 30).until(
+        WebDriverWait(driver, min(30, fuente.timeout) if fuente else 30).until(
             EC.presence_of_all_elements_located((By.CLASS_NAME, "span12"))
         )
 
-        # Buscar todos los elementos con la clase "span12"
-        elementos_span12 = driver.find_elements(By.CLASS_NAME, "span12")
-
-        # Inicializar una lista vacía para las ubicaciones
-        ubicaciones = []
-
-        # Iterar sobre los elementos encontrados
-        for elemento in elementos_span12:
-            # Esperar a que los párrafos dentro de cada "span12" estén presentes
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_all_elements_located((By.TAG_NAME, "p"))
-            )
-
-            # Obtener los párrafos
-            parrafos = elemento.find_elements(By.TAG_NAME, "p")
-
-            # Buscar en cada párrafo si hay radares planificados o no
-            for i, parrafo in enumerate(parrafos):
-                # Reubicar el párrafo antes de interactuar con él
-                parrafo = elemento.find_elements(By.TAG_NAME, "p")[i]
-                texto_parrafo = parrafo.text
-
-                # Caso en que no hay radares para hoy
-                if "No hay ninguna ubicación planificada para hoy." in texto_parrafo:
-                    logging.info("No hay radares móviles planificados para hoy.")
-                    return ubicaciones  # Retornar lista vacía
-
-                # Caso en que hay radares planificados para hoy
-                elif "el radar móvil estará operando en las siguientes ubicaciones" in texto_parrafo:
-                    # Verificar si hay al menos un párrafo siguiente para evitar IndexError
-                    if i + 1 < len(parrafos):
-                        # Reubicar los elementos antes de acceder a ellos
-                        ubicaciones = [span.text for span in parrafos[i + 1].find_elements(By.CLASS_NAME, "label")]
-                        logging.info(f"Radares móviles encontrados: {ubicaciones}")
-                        return ubicaciones  # Retornar las ubicaciones encontradas
-
-        # Si no se encontró nada relevante, retornar lista vacía
-        logging.warning("Estado de radares desconocido o no planificado.")
-        return None  # Retornar lista vacía si no se encontraron radares
+        # Analizar el HTML renderizado de una sola vez (evita una consulta al WebDriver por párrafo)
+        ubicaciones = fuente.parsear(driver.page_source) if fuente else parsear_radares(driver.page_source)
+        _registrar_estado_radares(ubicaciones)
+        return ubicaciones
 
     except Exception as e:
         logging.error("Error al comprobar los radares: %s", traceback.format_exc())
         raise  # Propaga el error al `main`
         
-def extraer_canvas(driver):
+def esperar_renderizado_mapa(driver, timeout=MAP_RENDER_TIMEOUT):
+    """Espera a que el mapa termine de renderizarse (evento `rendercomplete` o imágenes cargadas)."""
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    try:
+        driver.set_script_timeout(timeout)
+        if driver.execute_async_script(JS_ESPERAR_RENDERIZADO):
+            logging.info("Mapa renderizado (rendercomplete).")
+            return
+    except Exception as e:
+        logging.warning(f"No se pudo esperar al evento rendercomplete del mapa: {e}")
+
+    # Si no se encuentra el objeto del mapa, esperar a que la página y sus imágenes terminen de cargar
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.execute_script(
+            "return document.readyState === 'complete' && "
+            "Array.prototype.every.call(document.images, function (img) { return img.complete; });"
+        )
+    )
+    logging.info("Página e imágenes del mapa cargadas.")
+
+def leer_puntos_mapa(driver=None, features_url=MAP_FEATURES_URL):
+    """Obtiene las ubicaciones de los radares del GeoJSON configurado o de las capas del mapa en la página."""
+    if features_url:
+        response = requests.get(features_url, timeout=(5, 20))
+        response.raise_for_status()
+        return puntos_desde_geojson(response.json())
+
+    if driver:
+        puntos = driver.execute_script(JS_LEER_PUNTOS)
+        if puntos is not None:
+            return [normalizar_punto(p["x"], p["y"], p["nombre"]) for p in puntos]
+
+    return None
+
+@metricas.cronometrar()
+def renderizar_mapa_desde_datos(driver=None, features_url=MAP_FEATURES_URL):
+    """Renderiza el mapa con Pillow a partir de los datos del mapa (devuelve None si no está disponible)."""
+    if MAP_RENDER_MODE != "render" or not (features_url or driver):
+        return None
+
+    try:
+        puntos = leer_puntos_mapa(driver, features_url)
+        if not puntos:
+            logging.warning("No se encontraron datos de radares para renderizar el mapa.")
+            return None
+
+        # Codificar directamente la imagen renderizada (sin pasar por un PNG intermedio)
+        img_byte_array, _ = optimizar_imagen(renderizar_mapa(puntos))
+        return img_byte_array
+    except Exception as e:
+        logging.warning("Error al renderizar el mapa a partir de los datos: %s", traceback.format_exc())
+        return None
+
+@metricas.cronometrar()
+def extraer_canvas(driver, features_url=MAP_FEATURES_URL):
     """Extrae el contenido del canvas de la página y lo devuelve como un objeto de imagen en memoria."""
+    from selenium.webdriver.common.by import By
+
     try:
+        # Renderizar el mapa a partir de sus datos si ese modo está activo
+        img_byte_array = renderizar_mapa_desde_datos(driver, features_url)
+        if img_byte_array:
+            logging.info("Mapa generado a partir de los datos de los radares.")
+            return img_byte_array
+
         # Rechazar cookies si es necesario
         rechazar_cookies(driver)
 
@@ -182,31 +298,11 @@ def extraer_canvas(driver):
         driver.execute_script("arguments[0].scrollIntoView(true);", canvas)
         logging.info("Canvas desplazado a la vista.")
 
-        # Esperar un momento para asegurarnos de que todo se haya renderizado
-        time.sleep(10)
-
-        # Tomar la captura de pantalla completa como objeto binario (para no guardarla)
-        screenshot = driver.get_screenshot_as_png()
-        
-        # Abrir la captura desde los datos en memoria
-        img = Image.open(BytesIO(screenshot))
-        
-        # Obtener el tamaño de la imagen original
-        width, height = img.size
-
-        # Definir el recorte
-        left = 31
-        top = 1
-        right = width - 48
-        bottom = height - 52
-
-        # Recortar la imagen
-        img_recortada = img.crop((left, top, right, bottom))
+        # Esperar a que el mapa termine de renderizarse
+        esperar_renderizado_mapa(driver)
 
-        # Guardamos la imagen en un buffer de memoria
-        img_byte_array = BytesIO()
-        img_recortada.save(img_byte_array, format="PNG")
-        img_byte_array.seek(0)  # Rebobinar el buffer hasta el principio
+        # Capturar solo el área del canvas (el navegador recorta por los límites del elemento) y comprimirla
+        img_byte_array, _ = optimizar_imagen(canvas.screenshot_as_png)
 
         logging.info("Canvas capturado y convertido en imagen en memoria.")
         return img_byte_array  # Retorna el buffer en memoria
@@ -223,8 +319,30 @@ def extraer_canvas(driver):
 ###############################
 
 
-def enviar_mensaje_telegram(ids_usuarios, has_radar, locations):
-    """Envía el mensaje con la información de los radares a todos los usuarios obtenidos."""
+def difundir_registrado(run_id, tipo, ids_usuarios, construir_peticion, payload=None, reabrir_fallidos=False, **opciones):
+    """
+    Difunde a través de la outbox si hay identificador de ejecución y directamente si no.
+
+    Con la outbox cada envío queda registrado: si la ejecución se interrumpe, repetirla con el
+    mismo `run_id` solo envía a los usuarios que faltaban.
+    """
+    if not run_id:
+        return difundir(ids_usuarios, construir_peticion, **opciones)
+    return outbox.difundir_outbox(
+        contexto.collection_outbox, run_id, tipo, ids_usuarios, construir_peticion,
+        payload=payload, reabrir_fallidos=reabrir_fallidos, **opciones
+    )
+
+def enviar_mensaje_telegram(ids_usuarios, has_radar, locations, detalles=None, encabezado=None, run_id=None, idiomas=None):
+    """
+    Envía el mensaje con la información de los radares a todos los usuarios obtenidos.
+
+    Si se pasa el diccionario `detalles`, se rellena con el resultado del envío a cada usuario.
+    `encabezado` (el nombre del municipio cuando hay varias fuentes) se añade al principio.
+    Con `run_id` el envío pasa por la outbox y no se repite a quien ya lo recibió.
+    `idiomas` ({chat_id: language_code}) elige la plantilla de cada usuario (ver `message_templates`);
+    el mensaje devuelto es el del idioma por defecto.
+    """
 
     # Inicializar variables para el mensaje y las listas de usuarios
     message_sent = ""
@@ -232,36 +350,34 @@ def enviar_mensaje_telegram(ids_usuarios, has_radar, locations):
     ids_error = []
 
     try:
-        # Verificar si locations es None (error en la obtención de radares)
-        if locations is None:
-            message_sent = "⚠️ *Error al obtener información de los radares.*\n\n🚨 No se pudo verificar si hay radares móviles."
-        elif has_radar:
-            # Mensaje para radares encontrados
-            message_sent = "🚨 El radar móvil estará operando en las siguientes ubicaciones:\n\n"
-            message_sent += "\n".join([f"   •  *{loc}*" for loc in locations])
-            message_sent += "\n\n🚗💨 ¡Cuidado con los naranjitos! 🚓"
-        else:
-            # Mensaje cuando no hay radares
-            message_sent = "No hay radares móviles planificados para hoy."
-
-        # Usar una sesión para las solicitudes (opcionalmente mejora el rendimiento)
-        with requests.Session() as session:
-            for user_id in ids_usuarios:
-                params = {
-                    'chat_id': user_id,
-                    'text': message_sent,
-                    'parse_mode': 'Markdown'
-                }
-
-                # Enviar el mensaje
-                response = session.post(SEND_MESSAGE_URL, data=params)
-
-                if response.status_code == 200:
-                    ids_sent.append(user_id)  # Añadir id del usuario al que se le envió el mensaje
-                    logging.info(f"Mensaje enviado correctamente a {user_id}")
-                else:
-                    ids_error.append(user_id)   # Añadir id del usuario al que NO se le pudo enviar el mensaje
-                    logging.error(f"Error al enviar el mensaje a {user_id}: {response.status_code}")
+        # Un texto por idioma, renderizado una sola vez (sin radares, con radares o error si locations es None)
+        message_sent = message_templates.mensaje_radares(message_templates.IDIOMA_POR_DEFECTO, locations, encabezado)
+        grupos = message_templates.agrupar_por_idioma(ids_usuarios, idiomas or {})
+        params = {
+            idioma: {'text': message_templates.mensaje_radares(idioma, locations, encabezado), 'parse_mode': 'Markdown'}
+            for idioma in grupos
+        }
+        idioma_usuario = {user_id: idioma for idioma, ids in grupos.items() for user_id in ids}
+        url = obtener_cliente().url("sendMessage")
+        metricas.incrementar("message_variants", len(grupos))
+
+        # Enviar el mensaje de cada idioma a sus usuarios en paralelo respetando los límites de Telegram
+        detalles = {} if detalles is None else detalles
+        with metricas.medir("broadcast_message"):
+            for idioma, ids in grupos.items():
+                enviados, errores = difundir_registrado(
+                    run_id, "message",
+                    ids,
+                    lambda user_id: (url, {**params[idioma_usuario[user_id]], 'chat_id': user_id}, None),
+                    payload={"method": "sendMessage", "data": params[idioma]},
+                    detalles=detalles
+                )
+                ids_sent += enviados
+                ids_error += errores
+        logging.info(f"Mensaje enviado a {len(ids_sent)} usuarios en {len(grupos)} idiomas ({len(ids_error)} errores).")
+
+        # Los usuarios que han bloqueado el bot se marcan como inactivos sin consultar a Telegram
+        registrar_usuarios_bloqueados(ids_error, detalles)
 
     except Exception as e:
         logging.error("Error al enviar los mensajes de Telegram: %s", traceback.format_exc())
@@ -269,30 +385,117 @@ def enviar_mensaje_telegram(ids_usuarios, has_radar, locations):
 
     return message_sent, ids_sent, ids_error
 
-def enviar_imagen_telegram(ids_usuarios, img_byte_array):
-    """Envía la imagen (como archivo) a los usuarios obtenidos."""
+def registrar_usuarios_bloqueados(ids_error, detalles):
+    """Marca como inactivos en MongoDB los usuarios cuyo envío ha fallado con 403 (bot bloqueado)."""
+    bloqueados = [user_id for user_id in ids_error if detalles.get(user_id, {}).get("status") == 403]
+    if not bloqueados:
+        return
+
     try:
-        for user_id in ids_usuarios:
-            # Parámetros de la solicitud
-            params = {
-                'chat_id': user_id,
-            }
-            
-            # Rebobinar el puntero del archivo antes de cada solicitud
-            img_byte_array.seek(0)  # Aseguramos que el puntero apunte al inicio del archivo
-            
+        marcar_estado_usuarios(contexto.collection_interactions, dict.fromkeys(bloqueados, False), "broadcast")
+    except Exception as e:
+        # No debe interrumpir el envío al resto de usuarios
+        logging.error(f"Error al marcar como inactivos a los usuarios que han bloqueado el bot: {e}")
+
+@metricas.cronometrar("broadcast_photo")
+def enviar_imagen_telegram(ids_usuarios, img_byte_array, file_id=None, detalles=None, run_id=None):
+    """
+    Envía la imagen a los usuarios obtenidos subiéndola una sola vez.
+
+    La primera subida correcta devuelve el `file_id` de la foto y el resto de usuarios la recibe
+    por ese identificador (si ya se conoce, p. ej. desde la caché, no se sube). Si el envío por
+    file_id falla, se vuelve a subir la imagen. Devuelve (ids_sent, ids_error, estadisticas);
+    las estadísticas incluyen el file_id utilizado. `detalles` recibe el resultado por usuario.
+    Con `run_id` los envíos pasan por la outbox: al reanudar una ejecución, los usuarios que ya tienen
+    la imagen no se vuelven a procesar y su file_id se reutiliza. Las estadísticas solo cuentan las
+    subidas hechas en esta ejecución.
+    """
+    try:
+        # Cada hilo necesita su propio buffer: un BytesIO compartido no se puede leer en paralelo
+        contenido = img_byte_array.getvalue()
+        nombre_fichero, tipo_mime = tipo_imagen(contenido)
+        ids_sent = []
+        ids_error = []
+        detalles = {} if detalles is None else detalles
+        estadisticas = {"uploads": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+        subidas = []
+
+        # Cliente compartido del proceso (las conexiones se reutilizan entre envíos)
+        session = obtener_cliente()
+        url = session.url("sendPhoto")
+
+        def peticion_subida(user_id):
+            subidas.append(user_id)
             # Enviar la imagen como un archivo en memoria
             files = {
-                'photo': ('mapa_recortado.png', img_byte_array, 'image/png')
+                'photo': (nombre_fichero, BytesIO(contenido), tipo_mime)
             }
-
-            # Hacer la solicitud POST para enviar la imagen
-            response = requests.post(SEND_PHOTO_URL, data=params, files=files)
-
-            if response.status_code == 200:
-                logging.info(f"Imagen enviada correctamente a {user_id}")
-            else:
-                logging.error(f"Error al enviar la imagen a {user_id}: {response.status_code}")
+            return url, {'chat_id': user_id}, files
+
+        # En una ejecución reanudada, quien ya recibió la imagen no se vuelve a procesar
+        pendientes = list(ids_usuarios)
+        if run_id:
+            previos = outbox.enviados(contexto.collection_outbox, run_id, "photo")
+            for user_id in pendientes:
+                if user_id in previos:
+                    ids_sent.append(user_id)
+                    detalles.setdefault(user_id, {**previos[user_id], "response": None})
+                    file_id = file_id or previos[user_id].get("file_id")
+            pendientes = [user_id for user_id in pendientes if user_id not in previos]
+
+        # Subir la imagen a los usuarios de uno en uno hasta obtener su file_id
+        while pendientes and not file_id:
+            user_id = pendientes.pop(0)
+            enviados, errores = difundir_registrado(run_id, "photo", [user_id], peticion_subida, session=session, workers=1, detalles=detalles)
+            ids_sent += enviados
+            ids_error += errores
+            if enviados:
+                file_id = outbox.file_id_foto(detalles.get(user_id, {}).get("response"))
+
+        if file_id:
+            logging.info(f"Imagen disponible con file_id {file_id}, enviándola a {len(pendientes)} usuarios.")
+            enviados, errores = difundir_registrado(
+                run_id, "photo",
+                pendientes,
+                lambda user_id: (url, {'chat_id': user_id, 'photo': file_id}, None),
+                payload={"method": "sendPhoto", "data": {'photo': file_id}},
+                session=session,
+                detalles=detalles
+            )
+            ids_sent += enviados
+            estadisticas["bytes_saved"] += len(contenido) * len(enviados)
+
+            # Los envíos por file_id fallidos se reintentan subiendo la imagen (salvo usuarios que bloquearon el bot)
+            pendientes = [user_id for user_id in errores if detalles.get(user_id, {}).get("status") != 403]
+            ids_error += [user_id for user_id in errores if detalles.get(user_id, {}).get("status") == 403]
+            if pendientes:
+                logging.warning(f"Fallo al enviar por file_id a {len(pendientes)} usuarios, subiendo la imagen de nuevo.")
+
+        # Subida normal para los usuarios restantes
+        if pendientes:
+            latencias_previas = {user_id: detalles[user_id]["latency"] for user_id in pendientes if user_id in detalles}
+            # Los envíos por file_id fallidos se reabren en la outbox para subir la imagen
+            enviados, errores = difundir_registrado(
+                run_id, "photo", pendientes, peticion_subida, reabrir_fallidos=True, session=session, detalles=detalles
+            )
+            for user_id, latencia in latencias_previas.items():
+                detalles[user_id]["latency"] += latencia
+            ids_sent += enviados
+            ids_error += errores
+
+        registrar_usuarios_bloqueados(ids_error, detalles)
+        estadisticas["uploads"] = len(subidas)
+        estadisticas["bytes_uploaded"] = len(contenido) * len(subidas)
+        estadisticas["file_id"] = file_id
+        metricas.incrementar("photo_uploads", estadisticas["uploads"])
+        metricas.incrementar("bytes_uploaded", estadisticas["bytes_uploaded"])
+        metricas.incrementar("bytes_saved", estadisticas["bytes_saved"])
+
+        logging.info(
+            f"Imagen enviada a {len(ids_sent)} usuarios ({len(ids_error)} errores) con {estadisticas['uploads']} subidas; "
+            f"{estadisticas['bytes_saved']} bytes ahorrados."
+        )
+        return ids_sent, ids_error, estadisticas
     except Exception as e:
         logging.error("Error al enviar las imágenes de Telegram: %s", traceback.format_exc())
         raise  # Propaga el error al `main`
@@ -306,42 +509,162 @@ def enviar_imagen_telegram(ids_usuarios, img_byte_array):
 ##############################
 
 
-def obtener_ids_usuarios():
-    """Obtiene los IDs de los usuarios que han interactuado con el bot."""
+def crear_indices_destinatarios():
+    """Crea los índices que cubren la consulta de destinatarios y elimina los obsoletos (una vez por proceso)."""
+    if contexto.collection_interactions.full_name in _indices_destinatarios_creados:
+        return
+
+    # Filtro por `active` y `has_subscriptions` y proyección de `chat_id` y `language_code`: la consulta se resuelve solo con el índice
+    contexto.collection_interactions.create_index(
+        [("active", 1), ("has_subscriptions", 1), ("chat_id", 1), ("language_code", 1)],
+        name="active_subscriptions_chat_id_language"
+    )
+    existentes = contexto.collection_interactions.index_information()
+    for nombre in INDICES_DESTINATARIOS_OBSOLETOS:
+        if nombre in existentes:
+            contexto.collection_interactions.drop_index(nombre)
+            logging.info(f"Eliminado el índice obsoleto de destinatarios {nombre}.")
+    subscriptions.crear_indices(contexto.collection_subscriptions)
+    _indices_destinatarios_creados.add(contexto.collection_interactions.full_name)
+
+def iterar_ids_usuarios(batch_size=DESTINATARIOS_BATCH_SIZE, idiomas=None):
+    """
+    Genera los IDs de los usuarios activos sin suscripciones (reciben todos los avisos) leyendo únicamente `chat_id`.
+
+    Si se pasa el diccionario `idiomas`, se rellena con el `language_code` de cada usuario.
+    """
+    cursor = contexto.collection_interactions.find(
+        {"active": True, "has_subscriptions": {"$ne": True}},
+        {"chat_id": 1, "language_code": 1, "_id": 0}
+    ).batch_size(batch_size)
+
+    for usuario in cursor:
+        chat_id = usuario.get('chat_id')
+        if chat_id:
+            if idiomas is not None and usuario.get("language_code"):
+                idiomas[chat_id] = usuario["language_code"]
+            yield chat_id
+
+def iterar_ids_suscritos(locations, batch_size=DESTINATARIOS_BATCH_SIZE, idiomas=None):
+    """Genera los IDs de los usuarios activos suscritos a alguna de las ubicaciones (índice invertido, sin recorrer todos los chats)."""
+    suscritos = subscriptions.suscriptores(contexto.collection_subscriptions, locations)
+    if not suscritos:
+        return
+
+    cursor = contexto.collection_interactions.find(
+        {"active": True, "has_subscriptions": True, "chat_id": {"$in": list(suscritos)}},
+        {"chat_id": 1, "language_code": 1, "_id": 0}
+    ).batch_size(batch_size)
+
+    for usuario in cursor:
+        if idiomas is not None and usuario.get("language_code"):
+            idiomas[usuario["chat_id"]] = usuario["language_code"]
+        yield usuario["chat_id"]
+
+@metricas.cronometrar()
+def obtener_ids_usuarios(locations=None, general=True, idiomas=None):
+    """
+    Obtiene los IDs de los usuarios activos que deben recibir el aviso.
+
+    Los usuarios sin suscripciones reciben todos los avisos (de las fuentes con `general`); los
+    suscritos solo los de sus ubicaciones, de modo que no reciben nada si no hay radares en ellas.
+    Si se pasa el diccionario `idiomas`, se rellena con el idioma de cada destinatario.
+    """
     try:
-        # Buscar todos los documentos en la colección bot_interactions
-        usuarios = collection_interactions.find({})
-
-        # Extraer los chat_id de los usuarios
-        ids = []
-        for usuario in usuarios:
-            chat_id = usuario.get('chat_id')
-            if chat_id:
-                ids.append(chat_id)
-
-        logging.info(f"IDs de usuarios obtenidos desde MongoDB: {ids}")
+        ids = list(iterar_ids_usuarios(idiomas=idiomas)) if general else []
+        suscritos = list(iterar_ids_suscritos(locations, idiomas=idiomas)) if locations else []
+        metricas.incrementar("recipients_all", len(ids))
+        metricas.incrementar("recipients_subscribed", len(suscritos))
+        ids += suscritos
+
+        logging.info(f"IDs de usuarios activos obtenidos desde MongoDB: {len(ids)} ({len(suscritos)} por suscripción)")
+        logging.debug(f"IDs de usuarios: {ids}")
         return ids
     except Exception as e:
         logging.error("Error al obtener los IDs de los usuarios desde MongoDB: %s", e)
         raise # Propaga el error al `main`
 
-def registrar_monitoreo_mensajes(scrapping_time, has_radar, locations, message_sent, ids_sent, ids_error):
-    """Registra en MongoDB el monitoreo de los mensajes enviados tras el scraping."""
+def variante_imagen(url):
+    """Variante de la imagen en la caché: modo de generación, codificación y página de origen."""
+    return f"{MAP_RENDER_MODE}:{variante()}:{url}"
+
+def obtener_imagen_cacheada(clave):
+    """Busca en la caché de MongoDB la imagen del mapa; un fallo de la caché no interrumpe el envío."""
+    try:
+        image_cache.crear_indices(contexto.collection_image_cache)
+    except Exception as e:
+        # Sin el índice TTL la caché sigue sirviendo (el límite de entradas la mantiene acotada)
+        logging.error(f"Error al crear el índice de la caché de imágenes: {e}")
+
+    try:
+        return image_cache.obtener_imagen(contexto.collection_image_cache, clave)
+    except Exception as e:
+        logging.warning(f"Error al consultar la caché de imágenes: {e}")
+        return None
+
+def guardar_imagen_cacheada(clave, png, locations, fecha):
+    """Guarda la imagen del mapa en la caché de MongoDB."""
+    try:
+        image_cache.guardar_imagen(contexto.collection_image_cache, clave, png, locations, fecha)
+    except Exception as e:
+        logging.warning(f"Error al guardar la imagen en caché: {e}")
+
+def guardar_file_id_cacheado(clave, file_id):
+    """Asocia el file_id de Telegram a la imagen cacheada."""
+    try:
+        image_cache.guardar_file_id(contexto.collection_image_cache, clave, file_id)
+    except Exception as e:
+        logging.warning(f"Error al guardar el file_id en caché: {e}")
+
+def resumir_entregas(detalles_mensaje, detalles_imagen):
+    """Combina el resultado del mensaje y de la imagen de cada usuario en un documento compacto de entrega."""
+    entregas = {}
+    for chat_id, mensaje in detalles_mensaje.items():
+        entrega = {
+            "ok": mensaje["status"] == 200,
+            "message_status": mensaje["status"],
+            "retries": mensaje["retries"],
+            "latency": round(mensaje["latency"], 3)
+        }
+        imagen = detalles_imagen.get(chat_id)
+        if imagen:
+            entrega["photo_status"] = imagen["status"]
+            entrega["retries"] += imagen["retries"]
+            entrega["photo_latency"] = round(imagen["latency"], 3)
+        entregas[chat_id] = entrega
+    return entregas
+
+def registrar_monitoreo_mensajes(timestamp, has_radar, locations, message_sent, ids_sent, ids_error, image_delivery=None, browser_startup=None, entregas=None, source=None):
+    """
+    Registra en MongoDB el monitoreo de los mensajes (y, si la hay, de la imagen) enviados tras el scraping.
+
+    El report solo guarda los totales; el resultado de cada usuario (`entregas`) va a la colección de entregas.
+    """
     try:
 
-        # Documento a insertar
+        # Documento a insertar (colección time-series: `timestamp` como fecha y `meta` para agrupar)
         documento = {
-            "scrapping_time": scrapping_time,
-            "has_radar": has_radar,
+            "timestamp": timestamp,
+            "meta": {"has_radar": has_radar, "source": source},
             "locations": locations,
             "message_sent": message_sent,
-            "ids_sent": ids_sent,
-            "ids_error":ids_error
+            "counts": {"recipients": len(ids_sent) + len(ids_error), "sent": len(ids_sent), "error": len(ids_error)}
         }
 
-        # Inserta el documento
-        result = collection_reports.insert_one(documento)
-        logging.info(f"Monitoreo del scrapping realizada correctamente con ID: {result.inserted_id}")
+        # Estadísticas del envío de la imagen (subidas y bytes ahorrados)
+        if image_delivery is not None:
+            documento["image_delivery"] = image_delivery
+
+        # Tiempos de arranque del navegador (solo si se ha necesitado)
+        if browser_startup is not None:
+            documento["browser_startup"] = browser_startup
+
+        # Duraciones por etapa, contadores, estados HTTP de Telegram y comandos de MongoDB de esta ejecución
+        documento["metrics"] = metricas.resumen()
+
+        # Inserta el report y las entregas por usuario
+        run_id = reports.guardar_report(contexto.collection_reports, contexto.collection_deliveries, documento, entregas)
+        logging.info(f"Monitoreo del scrapping realizada correctamente con ID: {run_id}")
 
     except Exception as e:
         logging.error("Error al registrar el monitoreo en MongoDB: %s", traceback.format_exc())
@@ -356,59 +679,201 @@ def registrar_monitoreo_mensajes(scrapping_time, has_radar, locations, message_s
 ########################
 
 
-def main():
-    """Función principal que inicializa el driver, carga la página, verifica el estado y envía el mensaje por WhatsApp."""
-
-    # Inicializar el driver
-    driver = inicializar_driver()
+def abrir_pagina_radares(persistente=False, fuente=None):
+    """Inicializa el driver de Chrome y carga la página de radares (devuelve None si no hay driver)."""
+    url = fuente.url if fuente else url_radares()
+    driver = inicializar_driver(persistente, url)
+    if driver:
+        if fuente:
+            # Ninguna orden al navegador (carga, scripts o la petición al chromedriver) puede superar
+            # el tiempo de la fuente: el hilo del escaneo termina aunque el navegador se cuelgue
+            limitar_tiempo(driver, fuente.timeout)
+            cargar_pagina(driver, url, max_retries=1)
+        else:
+            cargar_pagina(driver, url)
+    return driver
+
+def escanear_fuente(fuente, persistente=False):
+    """
+    Comprueba los radares de una fuente y prepara el envío: ubicaciones, destinatarios e imagen del mapa.
+
+    Devuelve un diccionario con lo necesario para `entregar_fuente`, o None si no se pudo
+    comprobar la fuente (sin navegador disponible) o si la página no ha cambiado desde la última
+    entrega de hoy (ver `snapshots`).
+    """
+    # El navegador solo se arranca si hace falta (página sin datos en el HTML o captura del mapa)
+    driver = None
+    features_url = fuente.opciones.get("map_features_url")
+    fecha_hoy = datetime.now(pytz.timezone(ZONA_HORARIA)).date().isoformat()
+    anterior = html = huella = None
 
-    # Cargar la página, comprobar los radares y enviar la información a los usuarios
-    if driver and cargar_pagina(driver, donosti_radar_web_url):
+    try:
+        # Comparar la página con la última comprobación antes de analizarla
+        if RADAR_SNAPSHOTS:
+            anterior, html, huella = snapshots.comprobar(contexto.collection_snapshots, fuente)
+
+        if snapshots.sin_cambios(anterior, huella):
+            if anterior.get("delivered_on") == fecha_hoy:
+                logging.info(f"La página de {fuente.nombre} no ha cambiado desde la última entrega de hoy, no hay nada que enviar.")
+                metricas.incrementar("snapshots_sin_cambios")
+                snapshots.guardar(contexto.collection_snapshots, fuente.nombre, huella, anterior["locations"], fecha_hoy, cambiada=False)
+                return None
+
+            # Mismo contenido que la última entrega (de otro día): se reutilizan sus ubicaciones
+            locations = anterior["locations"]
+            logging.info(f"La página de {fuente.nombre} no ha cambiado, se reutilizan las ubicaciones: {locations}")
+        else:
+            # Comprobar el estado de los radares sin navegador
+            locations = comprobar_radares_http(fuente, html)
 
-        # Comprobar el estado de los radares
-        locations = comprobar_radares(driver)
+        # Si el HTML descargado no permite determinar el estado, se recurre a la página renderizada
+        if locations is None:
+            # Y el HTML no sirve para saber si los radares han cambiado: no se guarda la instantánea
+            huella = None
+            logging.warning(f"No se pudo determinar el estado de {fuente.nombre} desde el HTML, comprobando con Selenium.")
+            driver = abrir_pagina_radares(persistente, fuente)
+            if not driver:
+                return None
+            locations = comprobar_radares(driver, fuente)
 
         # Obtener los IDs de los usuarios
-        ids_usuarios = obtener_ids_usuarios()
+        crear_indices_destinatarios()
+        idiomas = {}
+        ids_usuarios = obtener_ids_usuarios(locations, fuente.difusion_general, idiomas)
 
         # ids_usuarios = [632062529]
 
-        # Inicializar variables para el monitoreo
-        has_radar = bool(locations)
-        message_sent = ""
-        ids_sent = []
-        ids_error = []
-        
-        if ids_usuarios:
-            
-            if has_radar:
-                # Extraer imagen del mapa de los radares
-                img_byte_array = extraer_canvas(driver)
-                
-            # Enviar la información de los radares a todos los usuarios
-            message_sent, ids_sent, ids_error = enviar_mensaje_telegram(ids_usuarios, has_radar, locations)
-
-            if has_radar:
-                # Enviar la imagen a todos los usuarios
-                enviar_imagen_telegram(ids_usuarios, img_byte_array)
+        img_byte_array = None
+        file_id = None
+        clave_cache = None
+
+        if ids_usuarios and locations:
+            # Reutilizar la imagen si ya se generó para las mismas ubicaciones hoy (sin navegador)
+            clave_cache = image_cache.clave_imagen(locations, fecha_hoy, variante_imagen(fuente.url))
+            imagen_cacheada = obtener_imagen_cacheada(clave_cache)
+            if imagen_cacheada:
+                img_byte_array = BytesIO(imagen_cacheada["png"])
+                file_id = imagen_cacheada.get("file_id")
+            else:
+                # Renderizar el mapa sin navegador si hay datos de los radares disponibles
+                img_byte_array = renderizar_mapa_desde_datos(driver, features_url)
 
-        else:
-            logging.info("No hay usuarios a los que enviar el mensaje.")
-
-        # Registrar los resultados del monitoreo en MongoDB
-        registrar_monitoreo_mensajes(
-            scrapping_time=datetime.now(pytz.UTC).isoformat(),
-            has_radar=has_radar,
-            locations=locations,
-            message_sent=message_sent,
-            ids_sent=ids_sent,
-            ids_error=ids_error
+                # Si no, extraer imagen del mapa de los radares (solo aquí es imprescindible el navegador)
+                if img_byte_array is None:
+                    driver = driver or abrir_pagina_radares(persistente, fuente)
+                    if driver:
+                        img_byte_array = extraer_canvas(driver, features_url)
+                    else:
+                        logging.error("No se pudo arrancar el navegador, se enviará el aviso sin imagen.")
+
+                if img_byte_array:
+                    guardar_imagen_cacheada(clave_cache, img_byte_array.getvalue(), locations, fecha_hoy)
+
+        return {
+            "locations": locations,
+            "ids_usuarios": ids_usuarios,
+            "idiomas": idiomas,
+            "img_byte_array": img_byte_array,
+            "file_id": file_id,
+            "clave_cache": clave_cache,
+            "browser_startup": getattr(driver, "tiempos_arranque", None),
+            "fecha": fecha_hoy,
+            "huella": huella,
+            "cambiada": not snapshots.sin_cambios(anterior, huella)
+        }
+
+    finally:
+        # Cerrar el driver
+        if driver:
+            liberar_driver(driver)
+            logging.info("Driver de Chrome cerrado correctamente.")
+
+def entregar_fuente(fuente, resultado, encabezado=None):
+    """
+    Envía el aviso y la imagen de una fuente ya comprobada y registra el resultado en MongoDB.
+
+    Los envíos se registran en la outbox con un identificador de la fuente, el día y el contenido:
+    si la ejecución se interrumpe, repetirla solo envía a los usuarios que faltaban.
+    """
+    locations = resultado["locations"]
+    ids_usuarios = resultado["ids_usuarios"]
+    img_byte_array = resultado["img_byte_array"]
+    file_id = resultado["file_id"]
+
+    # Inicializar variables para el monitoreo
+    has_radar = bool(locations)
+    message_sent = ""
+    ids_sent = []
+    ids_error = []
+    image_delivery = None
+    detalles_mensaje = {}
+    detalles_imagen = {}
+
+    if ids_usuarios:
+        run_id = outbox.id_ejecucion(fuente.nombre, resultado["fecha"], locations, encabezado)
+        logging.info(f"Envíos de {fuente.nombre} registrados en la outbox como {run_id}.")
+
+        # Enviar la información de los radares a todos los usuarios
+        message_sent, ids_sent, ids_error = enviar_mensaje_telegram(ids_usuarios, has_radar, locations, detalles_mensaje, encabezado, run_id, resultado["idiomas"])
+
+        if img_byte_array:
+            # Enviar la imagen a todos los usuarios
+            _, _, image_delivery = enviar_imagen_telegram(ids_usuarios, img_byte_array, file_id, detalles_imagen, run_id)
+
+            # Recordar el file_id para que las siguientes ejecuciones no suban la imagen
+            if image_delivery["file_id"] and image_delivery["file_id"] != file_id:
+                guardar_file_id_cacheado(resultado["clave_cache"], image_delivery["file_id"])
+
+    else:
+        logging.info(f"No hay usuarios a los que enviar el mensaje de {fuente.nombre}.")
+
+    # Registrar los resultados del monitoreo en MongoDB
+    registrar_monitoreo_mensajes(
+        timestamp=datetime.now(pytz.UTC),
+        has_radar=has_radar,
+        locations=locations,
+        message_sent=message_sent,
+        ids_sent=ids_sent,
+        ids_error=ids_error,
+        image_delivery=image_delivery,
+        browser_startup=resultado["browser_startup"],
+        entregas=resumir_entregas(detalles_mensaje, detalles_imagen),
+        source=fuente.nombre
+    )
+
+    # Recordar la versión entregada de la página (si algo falla antes, la siguiente ejecución la comprobará de nuevo)
+    if resultado["huella"]:
+        snapshots.guardar(contexto.collection_snapshots, fuente.nombre, resultado["huella"], locations, resultado["fecha"], resultado["cambiada"])
+
+def main(persistente=False):
+    """
+    Función principal que comprueba los radares, captura el mapa si hace falta y envía la información por Telegram.
+
+    Las fuentes configuradas (RADAR_SOURCES, por defecto solo DONOSTI_RADAR_WEB) se comprueban en
+    paralelo y cada una se envía en cuanto termina. Con `persistente=True` (modo daemon) se
+    reutilizan los navegadores entre ejecuciones.
+    """
+    metricas.reiniciar()
+    inicio = time.perf_counter()
+
+    try:
+        fuentes = radar_sources.cargar_fuentes(url_por_defecto=url_radares(), map_features_url=MAP_FEATURES_URL)
+
+        # Con varios municipios, cada mensaje indica a cuál corresponde
+        varias = len(fuentes) > 1
+        errores = radar_sources.ejecutar_fuentes(
+            fuentes,
+            lambda fuente: escanear_fuente(fuente, persistente),
+            lambda fuente, resultado: entregar_fuente(fuente, resultado, fuente.nombre if varias else None)
         )
 
-    # Cerrar el driver
-    if driver:
-        driver.quit()
-        logging.info("Driver de Chrome cerrado correctamente.")
+        if errores:
+            raise next(iter(errores.values()))  # Propaga el error al que ejecuta el script
+
+    finally:
+        # Exportar las métricas de la ejecución (si METRICS_FILE está configurado)
+        metricas.registrar_duracion("main", time.perf_counter() - inicio)
+        metricas.exportar()
 
 
 
@@ -0,0 +1,19 @@
+import threading
+
+
+class ColeccionSincronizada:
+    """mongomock no admite escrituras concurrentes sobre una colección: serializa sus llamadas."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._collection, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def sincronizado(*args, **kwargs):
+            with self._lock:
+                return atributo(*args, **kwargs)
+        return sincronizado
@@ -0,0 +1,32 @@
+"""
+Caché de la imagen del mapa: un índice en conflicto no debe desactivarla.
+"""
+import mongomock
+import pytest
+from pymongo.errors import OperationFailure
+
+import telegram_radar_notifier as notifier
+import image_cache
+
+
+@pytest.fixture
+def cache():
+    notifier.contexto.usar_cliente(mongomock.MongoClient(), "test_image_cache")
+    image_cache._indices_creados.clear()
+    yield notifier.contexto.collection_image_cache
+    notifier.contexto.reiniciar()
+
+
+def test_indice_en_conflicto_no_desactiva_la_cache(cache, monkeypatch):
+    intentos = []
+
+    def create_index(*args, **kwargs):
+        intentos.append(args)
+        raise OperationFailure("An equivalent index already exists with different options")
+
+    image_cache.guardar_imagen(cache, "clave", b"png", ["Calle Mayor"], "2026-10-17")
+    monkeypatch.setattr(mongomock.Collection, "create_index", create_index)
+
+    assert notifier.obtener_imagen_cacheada("clave")["png"] == b"png"
+    assert notifier.obtener_imagen_cacheada("otra") is None
+    assert len(intentos) == 1
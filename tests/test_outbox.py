@@ -0,0 +1,108 @@
+"""
+Reanudación de una difusión de la imagen a través de la outbox (mongomock y una API de Telegram simulada).
+"""
+from conftest import ColeccionSincronizada
+from io import BytesIO
+import datetime
+
+import mongomock
+import pytest
+
+import telegram_radar_notifier as notifier
+import outbox
+
+IMAGEN = BytesIO(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+
+
+class Respuesta:
+    def __init__(self, status_code, cuerpo):
+        self.status_code = status_code
+        self.headers = {}
+        self._cuerpo = cuerpo
+
+    def json(self):
+        return self._cuerpo
+
+
+class SesionFalsa:
+    """Responde a sendPhoto como Telegram y registra cada envío (subida o por file_id)."""
+
+    def __init__(self):
+        self.subidas = []
+        self.por_file_id = []
+
+    def url(self, metodo):
+        return f"http://telegram.test/bottest/{metodo}"
+
+    def post(self, url, data=None, files=None):
+        if files:
+            self.subidas.append(data["chat_id"])
+        else:
+            self.por_file_id.append(data["chat_id"])
+        return Respuesta(200, {"ok": True, "result": {"photo": [{"file_id": "foto-nueva"}]}})
+
+
+@pytest.fixture
+def sesion(monkeypatch):
+    contexto = notifier.contexto
+    contexto.usar_cliente(mongomock.MongoClient(), "test_outbox")
+    # Los hilos de la difusión reclaman los trabajos a la vez (mongomock no es atómico)
+    contexto.collection_outbox = ColeccionSincronizada(contexto.db[contexto.nombre_coleccion("collection_outbox")])
+    outbox._indices_creados.clear()
+    notifier.metricas.reiniciar()
+    sesion = SesionFalsa()
+    monkeypatch.setattr(notifier, "obtener_cliente", lambda: sesion)
+    monkeypatch.setattr(notifier, "registrar_usuarios_bloqueados", lambda ids_error, detalles: None)
+    yield sesion
+    notifier.contexto.reiniciar()
+
+
+def _trabajo(chat_id, **campos):
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        "_id": f"r1:photo:{chat_id}", "run_id": "r1", "tipo": "photo", "chat_id": chat_id, "lote": "anterior",
+        "payload": None, "attempts": 1, "created_at": ahora, **campos
+    }
+
+
+def test_reanudar_con_envio_interrumpido(sesion):
+    # El proceso anterior se cayó enviando a 2: su lease ha caducado y el envío queda incierto
+    caducado = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=10)
+    notifier.contexto.collection_outbox.insert_one(_trabajo(2, status="sending", worker="caido", lease_until=caducado))
+
+    ids_sent, ids_error, estadisticas = notifier.enviar_imagen_telegram([1, 2, 3], IMAGEN, run_id="r1")
+
+    assert sorted(ids_sent) == [1, 3]
+    assert ids_error == [2]
+    assert estadisticas["uploads"] == 1
+    assert sesion.subidas == [1] and sesion.por_file_id == [3]
+    assert notifier.metricas.resumen()["http_status"] == {"200": 2}
+
+
+def test_reanudar_reutiliza_el_file_id(sesion):
+    # 95 usuarios ya recibieron la foto en la ejecución interrumpida
+    notifier.contexto.collection_outbox.insert_many([
+        _trabajo(chat_id, status="sent", result={"status": 200, "retries": 0, "latency": 0.1, "file_id": "foto-previa"})
+        for chat_id in range(95)
+    ])
+
+    ids_sent, ids_error, estadisticas = notifier.enviar_imagen_telegram(list(range(100)), IMAGEN, run_id="r1")
+
+    assert sorted(ids_sent) == list(range(100)) and ids_error == []
+    assert estadisticas["file_id"] == "foto-previa"
+    assert estadisticas["uploads"] == 0 and estadisticas["bytes_uploaded"] == 0
+    assert sesion.subidas == [] and sorted(sesion.por_file_id) == list(range(95, 100))
+
+
+@pytest.mark.parametrize("respuesta, llamadas", [(Respuesta(502, {}), 1), (None, outbox.OUTBOX_MAX_INTENTOS)])
+def test_reintentos_de_la_outbox(sesion, monkeypatch, respuesta, llamadas):
+    # Un 5xx ya agotó los reintentos internos; solo se reencola un envío sin respuesta
+    enviados = []
+    monkeypatch.setattr(outbox, "enviar_con_reintentos", lambda *args: (enviados.append(args[2]), (respuesta, 5))[1])
+
+    ids_sent, ids_error = outbox.difundir_outbox(
+        notifier.contexto.collection_outbox, "r1", "message", [1], lambda chat_id: ("url", {"chat_id": chat_id}, None), session=sesion
+    )
+
+    assert ids_error == [1] and len(enviados) == llamadas
+    assert notifier.contexto.collection_outbox.find_one({"chat_id": 1})["status"] == "failed"
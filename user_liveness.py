@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from telegram_client import obtener_cliente
+from pymongo import UpdateOne
+import datetime
+import logging
+import os
+
+# Validez en MongoDB del estado de un usuario antes de volver a consultarlo a Telegram
+LIVENESS_TTL_HORAS = float(os.getenv("LIVENESS_TTL_HORAS", "24"))
+# Consultas getChatMember simultáneas
+LIVENESS_WORKERS = int(os.getenv("LIVENESS_WORKERS", "8"))
+
+# Estados de getChatMember / my_chat_member que indican que el usuario ya no recibe mensajes
+ESTADOS_INACTIVOS = ("left", "kicked")
+
+
+def estado_activo(status):
+    """Indica si un estado de miembro de Telegram ('member', 'left', 'kicked'...) corresponde a un usuario activo."""
+    return status not in ESTADOS_INACTIVOS
+
+def consultar_estado(session, get_chat_member_url, chat_id):
+    """
+    Consulta getChatMember para un chat privado.
+
+    Devuelve True/False si Telegram confirma el estado o None si no se pudo determinar.
+    """
+    try:
+        response = session.get(get_chat_member_url, params={'chat_id': chat_id, 'user_id': chat_id})
+        data = response.json()
+
+        if data.get('ok'):
+            return estado_activo(data['result']['status'])
+
+        # Telegram responde 403 cuando el usuario ha bloqueado el bot
+        if data.get('error_code') == 403:
+            return False
+
+        logging.error(f"Error al obtener estado del usuario {chat_id}: {data}")
+        return None
+    except Exception as e:
+        logging.error(f"Error al verificar estado del usuario {chat_id}: {e}")
+        return None
+
+def marcar_estado_usuarios(collection, estados, fuente):
+    """
+    Guarda el estado (`active`) de varios usuarios en una sola escritura.
+
+    `estados` es un diccionario chat_id -> bool y `fuente` indica de dónde se ha obtenido
+    ('probe', 'my_chat_member', 'broadcast'...). La fecha de comprobación sirve de caché.
+    """
+    if not estados:
+        return
+
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    collection.bulk_write([
+        UpdateOne(
+            {"chat_id": chat_id},
+            {"$set": {"active": activo, "active_checked_at": ahora, "active_source": fuente}}
+        )
+        for chat_id, activo in estados.items()
+    ], ordered=False)
+
+    inactivos = sum(1 for activo in estados.values() if not activo)
+    logging.info(f"Estado actualizado de {len(estados)} usuarios ({inactivos} inactivos) desde '{fuente}'.")
+
+def comprobar_usuarios(collection, chat_ids, get_chat_member_url, session=None, ttl_horas=LIVENESS_TTL_HORAS, workers=LIVENESS_WORKERS):
+    """
+    Devuelve un diccionario chat_id -> bool con el estado de cada usuario.
+
+    Cada chat se consulta como mucho una vez: los que tienen un estado en MongoDB más reciente
+    que el TTL se resuelven desde la caché y el resto se consulta en paralelo con getChatMember
+    sobre el cliente compartido de Telegram. Si no se puede determinar, se asume activo.
+    """
+    chat_ids = list(dict.fromkeys(chat_ids))
+    if not chat_ids:
+        return {}
+
+    # Estados aún vigentes en la caché de MongoDB
+    limite = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=ttl_horas)
+    estados = {
+        doc["chat_id"]: doc.get("active", True)
+        for doc in collection.find(
+            {"chat_id": {"$in": chat_ids}, "active_checked_at": {"$gte": limite}},
+            {"chat_id": 1, "active": 1, "_id": 0}
+        )
+    }
+    pendientes = [chat_id for chat_id in chat_ids if chat_id not in estados]
+
+    if pendientes:
+        logging.info(f"Comprobando el estado de {len(pendientes)} usuarios ({len(estados)} en caché).")
+        session = session or obtener_cliente()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            resultados = dict(zip(pendientes, executor.map(lambda chat_id: consultar_estado(session, get_chat_member_url, chat_id), pendientes)))
+
+        # Solo se cachean los estados confirmados por Telegram
+        confirmados = {chat_id: activo for chat_id, activo in resultados.items() if activo is not None}
+        marcar_estado_usuarios(collection, confirmados, "probe")
+        estados.update({chat_id: activo if activo is not None else True for chat_id, activo in resultados.items()})
+
+    return estados